@@ -1,7 +1,7 @@
-from fastapi import FastAPI, UploadFile, File, Form, Body
-from pyzbar.pyzbar import decode
+from fastapi import FastAPI, UploadFile, File, Form, Body, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from PIL import Image
-from openai import OpenAI
 from huggingface_hub import InferenceClient
 from dotenv import load_dotenv
 import requests
@@ -13,13 +13,37 @@ app = FastAPI()
 load_dotenv()
 
 HF_TOKEN = os.getenv("HF_TOKEN")
+# nén response: gzip (mặc định), br (cần cài brotli-asgi, không có thì dùng gzip) hoặc none
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "gzip").lower()
 
-client = OpenAI(
-    api_key = HF_TOKEN,
-    base_url="https://router.huggingface.co/v1"
-)
+if RESPONSE_COMPRESSION == "br":
+    try:
+        from brotli_asgi import BrotliMiddleware
+        # client không hỗ trợ br vẫn nhận gzip
+        app.add_middleware(BrotliMiddleware, minimum_size=1000)
+    except ImportError:
+        print("🔴 [WARNING] Chưa cài brotli-asgi, dùng gzip")
+        RESPONSE_COMPRESSION = "gzip"
+if RESPONSE_COMPRESSION == "gzip":
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+import asyncio
+
+import httpx
+
+import llm_gateway
+from barcode_decode import decode_barcodes, read_codes
+from image_preprocess import ImageRejected
+from product_lookup import get_product_lookup
+from product_projection import parse_fields, product_payload, project_product, prompt_macros
+from product_verdict import ProductVerdicts
+
+# client OpenFoodFacts dùng chung: connection pool + cache RAM/SQLite + gộp request trùng barcode
+product_lookup = get_product_lookup()
+# kết luận theo luật trước, chỉ hỏi LLM khi không chắc (cache theo barcode + nhóm profile)
+product_verdicts = ProductVerdicts()
 
-def is_this_stuff_good(weight, goal, disease, allergy, product_name, nutriments, calories, protein, carbs, fat):
+async def is_this_stuff_good(weight, goal, disease, allergy, product_name, macros):
     system_prompt = {"role": "system",
                      "content": f"""
     -Duới đây là thông tin của người dùng:
@@ -30,11 +54,7 @@ def is_this_stuff_good(weight, goal, disease, allergy, product_name, nutriments,
 
     Và dưới đây là thông tin của sản phẩm:
     Tên: {product_name},
-    Dinh dưỡng: {nutriments},
-    Calo: {calories},
-    Protein: {protein},
-    Carbs: {carbs},
-    Fat: {fat},
+    Dinh dưỡng: {macros}.
 
     Hãy cho người dùng biết sản phẩm này có hợp với người dùng hay không, nói ngắn gọn, không dài dòng và không cần hỏi thêm người dùng. Giới hạn 100 kí tự.
 """}
@@ -42,14 +62,22 @@ def is_this_stuff_good(weight, goal, disease, allergy, product_name, nutriments,
     messages = []
     messages.append(system_prompt)
 
-    completion = client.chat.completions.create(
+    bot_response = await llm_gateway.chat(
         model="openai/gpt-oss-20b:groq",
         messages=messages,
     )
-
-    bot_response = completion.choices[0].message.content
     return bot_response
 
+@app.get("/metrics")
+async def metrics():
+    return {"product_lookup": product_lookup.metrics(), "verdicts": product_verdicts.metrics()}
+
+
+@app.on_event("shutdown")
+async def close_product_lookup():
+    await product_lookup.aclose()
+
+
 @app.post("/get_product_info")
 async def get_product_info(
     barcode: str = Form(...),
@@ -61,13 +89,20 @@ async def get_product_info(
     allergy: str | None = Form(None),
     goal: str | None = Form(None),
     gender: str | None = Form(None),
+    fields: str | None = Form(None),
 ):
     """
     Endpoint chính: Nhận mã barcode từ Flutter (đã quét bằng ML Kit)
     và trả về thông tin sản phẩm từ OpenFoodFacts.
 
     Đồng thời nhận kèm userData dạng form fields (Flutter hiện đang gửi kiểu này).
+    fields: các trường product cần trả về, vd "product_name,nutriments" (mặc định: bản rút gọn đầy đủ, "raw": nguyên object OFF).
     """
+    try:
+        selected = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     print(f"\n{'='*60}")
     print(f"🔵 [INFO] Nhận barcode từ Flutter: {barcode}")
 
@@ -83,11 +118,10 @@ async def get_product_info(
         print(f"   - Dị ứng: {allergy}")
         print(f"   - Mục tiêu: {goal}")
     
-    url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
-    print(f"🔵 [INFO] Đang gọi OpenFoodFacts API...")
+    print(f"🔵 [INFO] Đang tra cứu OpenFoodFacts...")
     
     try:
-        resp = requests.get(url, timeout=10).json()
+        resp = await product_lookup.lookup(barcode)
         
         status = resp.get('status')
         print(f"🔵 [INFO] API status: {status}")
@@ -101,15 +135,16 @@ async def get_product_info(
             }
 
         product = resp.get("product", {})
+        # chỉ giữ các trường app / prompt cần (object OFF gốc có thể vài trăm KB)
+        compact = project_product(product)
         
         # Log thông tin sản phẩm
-        product_name = product.get('product_name', 'N/A')
-        brands = product.get('brands', 'N/A')
-        nutriments = product.get('nutriments', {})
-        calories = nutriments.get('energy-kcal', 0)
-        protein = nutriments.get('proteins', 0)
-        carbs = nutriments.get('carbohydrates', 0)
-        fat = nutriments.get('fat', 0)
+        product_name = compact.product_name or 'N/A'
+        brands = compact.brands or 'N/A'
+        calories = compact.nutriments.energy_kcal or 0
+        protein = compact.nutriments.proteins or 0
+        carbs = compact.nutriments.carbohydrates or 0
+        fat = compact.nutriments.fat or 0
         
         print(f"🟢 [SUCCESS] Tìm thấy sản phẩm!")
         print(f"   📦 Tên: {product_name}")
@@ -120,15 +155,20 @@ async def get_product_info(
         print(f"   🧈 Fat: {fat}g")
         print(f"{'='*60}\n")
 
-        response = is_this_stuff_good(weight, goal, disease, allergy, product_name, nutriments, calories, protein, carbs, fat)
+        response, source = await product_verdicts.verdict(
+            barcode, compact,
+            lambda: is_this_stuff_good(weight, goal, disease, allergy, product_name, prompt_macros(compact)),
+            weight=weight, goal=goal, disease=disease, allergy=allergy,
+        )
+        print(f"🟢 [VERDICT] ({source}) {response}")
         
         return {
             "barcode": barcode,
             "response": response,
-            "product": product
+            "product": product_payload(product, selected)
         }
         
-    except requests.Timeout:
+    except httpx.TimeoutException:
         print(f"🔴 [ERROR] Timeout khi gọi OpenFoodFacts API")
         return {
             "error": "Timeout khi tra cứu sản phẩm"
@@ -140,31 +180,48 @@ async def get_product_info(
         }
 
 @app.post("/scan_barcode")
-async def scan_barcode(file: UploadFile = File(...)):
-    image_bytes = await file.read()
-    image = Image.open(io.BytesIO(image_bytes))
+async def scan_barcode(file: UploadFile = File(...), fields: str | None = Form(None)):
+    try:
+        selected = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    results = decode(image)
-    if not results:
+    image_bytes = await file.read()
+    try:
+        # lượt nhanh trên ảnh thu nhỏ, không thấy thì thử song song nhiều cách xử lý ảnh
+        codes, strategy, elapsed_ms = await asyncio.to_thread(decode_barcodes, image_bytes)
+    except ImageRejected as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    if not codes:
+        print(f"🔴 [WARNING] Không đọc được barcode ({elapsed_ms:.0f}ms)")
         return {"error": "Không tìm thấy barcode"}
+    print(f"🟢 [BARCODE] {[c['data'] for c in codes]} ({strategy}, {elapsed_ms:.0f}ms)")
 
-    barcode = results[0].data.decode("utf-8")
+    barcode = codes[0]["data"]
 
-    url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
-    resp = requests.get(url).json()
+    try:
+        resp = await product_lookup.lookup(barcode)
+    except httpx.TimeoutException:
+        return JSONResponse(status_code=504, content={"error": "Timeout khi tra cứu sản phẩm"})
+    except httpx.HTTPError as e:
+        # gồm cả trả lời không phải JSON từ OpenFoodFacts (httpx.DecodingError từ product_lookup)
+        return JSONResponse(status_code=502, content={"error": f"Lỗi khi tra cứu sản phẩm: {str(e)}"})
 
     product = resp.get("product", None)
     if not product:
         print("Không tìm thấy thông tin sản phẩm tron OpenFoodFact")
+        return {"barcode": barcode, "barcodes": codes, "product": None,
+                "message": "Sản phẩm không có trong database OpenFoodFacts"}
 
+    payload = product_payload(product, selected)
     print("\n Tên sản phẩm:", product.get("product_name"))
     print("Thương hiệu:", product.get("brands"))
-    print("Calo:", product.get("nutriments", {}).get("energy-kcal"))
-    print("Nutriments:", product.get("nutriments"))
+    print("Nutriments:", payload.get("nutriments"))
 
     return {
         "barcode": barcode,
-        "product": resp.get("product", {})
+        "barcodes": codes,  # mọi mã đọc được trong ảnh, mã sản phẩm đứng trước
+        "product": payload
     }
 
 if __name__ == "__main__":
@@ -184,11 +241,11 @@ if __name__ == "__main__":
         # Option B (simpler): PIL can open from path directly
         # image = Image.open(test_file)
 
-        results = decode(image)
+        results = read_codes(image.convert("L"))
         if not results:
             print("⚠️ Không tìm thấy barcode trong ảnh test.")
         else:
-            barcode = results[0].data.decode("utf-8")
+            barcode = results[0]["data"]
             print("📌 Barcode nhận được:", barcode)
 
             url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
@@ -0,0 +1,132 @@
+"""
+Đọc barcode từ ảnh upload cho /scan_barcode.
+
+1. ảnh grayscale thu nhỏ về BARCODE_FAST_SIDE -> pyzbar (đa số ảnh chụp rõ dừng ở đây)
+2. không thấy: chạy song song trên thread pool các cách xử lý ảnh (độ phân giải cao hơn, tăng tương phản,
+   nhị phân hoá, xoay nghiêng, cắt vùng giữa / nửa trên / nửa dưới rồi phóng to), lấy kết quả đầu tiên tìm thấy.
+zbar được gọi qua ctypes (nhả GIL) nên các luồng thực sự chạy song song.
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError
+from pyzbar.pyzbar import ZBarSymbol, decode
+
+from image_preprocess import SCAN_MAX_PIXELS, ImageRejected, check_upload_size
+
+#---config---#
+BARCODE_FAST_SIDE = int(os.getenv("BARCODE_FAST_SIDE", "800"))       # cạnh dài của ảnh cho lượt đọc nhanh
+BARCODE_FULL_SIDE = int(os.getenv("BARCODE_FULL_SIDE", "2000"))      # cạnh dài tối đa cho các lượt xử lý sau
+BARCODE_DECODE_WORKERS = int(os.getenv("BARCODE_DECODE_WORKERS", "4"))
+BARCODE_DECODE_TIMEOUT = float(os.getenv("BARCODE_DECODE_TIMEOUT", "3"))  # giây, cho toàn bộ lượt song song
+#---config---#
+
+# mã sản phẩm được ưu tiên khi ảnh có nhiều mã (vd. barcode + QR khuyến mãi trên bao bì)
+PRODUCT_SYMBOLS = [ZBarSymbol.EAN13, ZBarSymbol.EAN8, ZBarSymbol.UPCA, ZBarSymbol.UPCE]
+SYMBOLS = PRODUCT_SYMBOLS + [ZBarSymbol.CODE128, ZBarSymbol.CODE39, ZBarSymbol.I25, ZBarSymbol.QRCODE]
+PRODUCT_TYPES = {s.name for s in PRODUCT_SYMBOLS}
+
+_executor = ThreadPoolExecutor(max_workers=BARCODE_DECODE_WORKERS, thread_name_prefix="barcode-decode")
+
+
+def load_gray(image_bytes, max_side=BARCODE_FULL_SIDE):
+    """Decode ảnh upload một lần: xoay theo EXIF, grayscale, thu nhỏ về max_side. Raise ImageRejected nếu không phải ảnh."""
+    check_upload_size(len(image_bytes))
+    try:
+        img = Image.open(BytesIO(image_bytes))
+        if img.width * img.height > SCAN_MAX_PIXELS:
+            raise ImageRejected("Ảnh có độ phân giải quá lớn", 413)
+        img.draft("L", (max_side, max_side))
+        img = ImageOps.exif_transpose(img).convert("L")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ImageRejected(f"File upload không phải ảnh hợp lệ: {e}", 415)
+    img.thumbnail((max_side, max_side), Image.BILINEAR)
+    return img
+
+
+def read_codes(img):
+    """Danh sách {"data", "type"} các mã đọc được, không trùng, mã sản phẩm (EAN / UPC) đứng trước."""
+    found = {}
+    for r in decode(img, symbols=SYMBOLS):
+        data = r.data.decode("utf-8", errors="replace")
+        found.setdefault((data, r.type), {"data": data, "type": r.type})
+    return sorted(found.values(), key=lambda c: c["type"] not in PRODUCT_TYPES)
+
+
+def _scaled(img, side):
+    img = img.copy()
+    img.thumbnail((side, side), Image.BILINEAR)
+    return img
+
+
+def _binarize(img):
+    """Nhị phân hoá theo ngưỡng Otsu: ảnh thiếu sáng / tương phản thấp."""
+    hist = np.bincount(np.asarray(img).ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight = np.cumsum(hist)
+    mean = np.cumsum(hist * levels)
+    total, total_mean = weight[-1], mean[-1]
+    between = (total_mean * weight - mean * total) ** 2 / np.maximum(weight * (total - weight), 1)
+    threshold = int(np.argmax(between))
+    return img.point(lambda v: 255 if v > threshold else 0)
+
+
+def _crop(img, box, scale=2):
+    w, h = img.size
+    region = img.crop((int(box[0] * w), int(box[1] * h), int(box[2] * w), int(box[3] * h)))
+    return region.resize((region.width * scale, region.height * scale), Image.BICUBIC)
+
+
+# tên -> hàm biến đổi ảnh grayscale (đã giới hạn ở BARCODE_FULL_SIDE); thứ tự = thứ tự gửi vào pool
+STRATEGIES = {
+    "full": lambda img: img,
+    "contrast": lambda img: ImageOps.autocontrast(img, cutoff=2).filter(ImageFilter.SHARPEN),
+    "binarize": _binarize,
+    "rotate_30": lambda img: img.rotate(30, expand=True, fillcolor=255),
+    "rotate_-30": lambda img: img.rotate(-30, expand=True, fillcolor=255),
+    "rotate_45": lambda img: img.rotate(45, expand=True, fillcolor=255),
+    "rotate_-45": lambda img: img.rotate(-45, expand=True, fillcolor=255),
+    "roi_center": lambda img: _crop(img, (0.2, 0.2, 0.8, 0.8)),
+    "roi_top": lambda img: _crop(img, (0.0, 0.0, 1.0, 0.55)),
+    "roi_bottom": lambda img: _crop(img, (0.0, 0.45, 1.0, 1.0)),
+}
+
+
+def _run_strategy(name, img):
+    return name, read_codes(STRATEGIES[name](img))
+
+
+def decode_barcodes(image_bytes, timeout=BARCODE_DECODE_TIMEOUT, strategies=None):
+    """
+    (danh sách mã, tên cách đọc được, thời gian ms). Danh sách rỗng nếu không đọc được mã nào.
+    strategies: giới hạn các cách xử lý ở lượt song song (mặc định tất cả STRATEGIES).
+    """
+    start = time.perf_counter()
+    img = load_gray(image_bytes)
+    codes = read_codes(_scaled(img, BARCODE_FAST_SIDE))
+    if codes:
+        return codes, "fast", (time.perf_counter() - start) * 1000
+
+    pending = {_executor.submit(_run_strategy, name, img) for name in (strategies or STRATEGIES)}
+    deadline = start + timeout
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.perf_counter(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break  # hết thời gian
+            for future in done:
+                try:
+                    name, codes = future.result()
+                except Exception as e:
+                    print(f"🔴 [WARNING] Lỗi khi đọc barcode: {e}")
+                    continue
+                if codes:
+                    return codes, name, (time.perf_counter() - start) * 1000
+    finally:
+        # các cách chưa chạy thì bỏ, cách đang chạy tự kết thúc trong nền
+        for future in pending:
+            future.cancel()
+    return [], None, (time.perf_counter() - start) * 1000
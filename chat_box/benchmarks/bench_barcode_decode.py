@@ -0,0 +1,72 @@
+"""
+So sánh latency và tỉ lệ đọc được barcode: pyzbar một lần trên ảnh gốc (cách cũ của /scan_barcode)
+với barcode_decode.decode_barcodes (lượt nhanh trên ảnh thu nhỏ + các cách xử lý song song).
+Ảnh EAN-13 được sinh tại chỗ (benchmarks/synthetic_barcodes.py).
+
+    cd chat_box
+    python -m benchmarks.bench_barcode_decode --per-kind 20
+"""
+import argparse
+import statistics
+import time
+from collections import defaultdict
+from io import BytesIO
+
+from PIL import Image
+from pyzbar.pyzbar import decode
+
+from barcode_decode import decode_barcodes
+from benchmarks.synthetic_barcodes import KINDS, make_dataset
+
+
+def baseline(image_bytes):
+    results = decode(Image.open(BytesIO(image_bytes)))
+    return [r.data.decode("utf-8") for r in results]
+
+
+def pipeline(image_bytes):
+    codes, _, _ = decode_barcodes(image_bytes)
+    return [c["data"] for c in codes]
+
+
+def run(name, fn, dataset):
+    per_kind = defaultdict(lambda: {"ok": 0, "all": 0, "n": 0, "ms": []})
+    for kind, image_bytes, expected in dataset:
+        start = time.perf_counter()
+        found = fn(image_bytes)
+        stats = per_kind[kind]
+        stats["ms"].append((time.perf_counter() - start) * 1000)
+        stats["n"] += 1
+        stats["ok"] += any(code in found for code in expected)
+        stats["all"] += set(expected) <= set(found)
+
+    print(f"\n{name}")
+    print(f"{'loại ảnh':<14}{'đọc được':>10}{'đủ mã':>8}{'p50 ms':>9}{'max ms':>9}")
+    total_ok, total_n, all_ms = 0, 0, []
+    for kind in KINDS:
+        s = per_kind[kind]
+        total_ok += s["ok"]
+        total_n += s["n"]
+        all_ms += s["ms"]
+        print(f"{kind:<14}{s['ok'] / s['n']:>10.0%}{s['all'] / s['n']:>8.0%}"
+              f"{statistics.median(s['ms']):>9.1f}{max(s['ms']):>9.1f}")
+    print(f"{'tổng':<14}{total_ok / total_n:>10.0%}{'':>8}{statistics.median(all_ms):>9.1f}{max(all_ms):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--per-kind", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dataset = make_dataset(args.per_kind)
+    print(f"{len(dataset)} ảnh giả lập ({time.perf_counter() - start:.1f}s)")
+
+    # chạy pipeline một lần trước để khởi động thread pool
+    decode_barcodes(dataset[0][1])
+    run("pyzbar trên ảnh gốc (cũ)", baseline, dataset)
+    run("decode_barcodes (mới)", pipeline, dataset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Đo độ chính xác và latency tra cứu của DishIndex (max theo alias, một phép matmul).
+
+    cd chat_box
+    python -m benchmarks.bench_dish_index --synthetic 5000
+"""
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+
+from dish_index import DishIndex, load_dishes_file
+from nutrient_regressor import DISH_DB, _encode_dishes, dish_aliases, normalize_text
+
+DISHES_FILE = os.path.join(os.path.dirname(__file__), "..", "graphrag", "input", "dishes.txt")
+
+# (tên VLM có thể trả về, món đúng trong DISH_DB)
+QUERIES = [
+    ("Pho Bo", "beef_bo"), ("Vietnamese beef pho", "beef_bo"), ("Bun Bo Hue", "hue_beef_noodle_soup"),
+    ("Com Tam", "broken_rice"), ("Banh Mi", "vietnamese_baguette_sandwich"),
+    ("Bun Thit Nuong", "grilled_pork_with_vermicelli"), ("Bun Rieu", "crab_noodle_soup"),
+    ("Hu Tieu", "southern_noodle_soup"), ("Mien Ga", "chicken_glass_noodle_soup"),
+    ("Banh Xeo", "vietnamese_pancake"), ("Goi Cuon", "spring_rolls"), ("Fresh spring rolls", "spring_rolls"),
+    ("Chao Ga", "chicken_soup"), ("Banh Cuon", "steamed_rice_rolls"), ("Ca Kho To", "braised_fish"),
+    ("Sup Chay", "vegetarian_soup"), ("Ca Chien Toi", "fried_fish_with_garlic"),
+]
+
+
+def time_lookup(index, queries, repeat=200):
+    latencies = []
+    for _ in range(repeat):
+        for q in queries:
+            start = time.perf_counter()
+            index.search(q, k=5)
+            latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--synthetic", type=int, default=5000, help="số món giả thêm vào để đo khi index lớn")
+    parser.add_argument("--aliases", type=int, default=3, help="số alias mỗi món giả")
+    args = parser.parse_args()
+
+    query_embs = _encode_dishes([normalize_text(q) for q, _ in QUERIES])
+
+    keys_only = DishIndex.build([(k, [normalize_text(k.replace("_", " "))]) for k in DISH_DB], _encode_dishes)
+    with_alias = DishIndex.build(dish_aliases(DISH_DB), _encode_dishes)
+    for name, index in (("chỉ key", keys_only), ("key + alias", with_alias)):
+        hits = [index.search(emb, k=1)[0][0] for emb in query_embs]
+        correct = sum(key == expected for (key, _), (_, expected) in zip(hits, QUERIES))
+        scores = [score for _, score in hits]
+        print(f"{name:>12}: top1={correct}/{len(QUERIES)}  score min={min(scores):.3f}  median={statistics.median(scores):.3f}")
+
+    entries = dish_aliases(DISH_DB)
+    if os.path.exists(DISHES_FILE):
+        entries += load_dishes_file(DISHES_FILE, normalize_text)
+    index = DishIndex.build(entries, _encode_dishes)
+    print(f"DISH_DB + dishes.txt: {len(index)} món, {len(index.aliases)} alias, "
+          f"lookup p50={time_lookup(index, query_embs):.1f}µs")
+
+    # index lớn: vector ngẫu nhiên cùng số chiều, chỉ để đo latency
+    rng = np.random.default_rng(0)
+    n = args.synthetic
+    dim = index.embeddings.shape[1]
+    big = DishIndex([f"dish_{i}" for i in range(n)], [str(i) for i in range(n * args.aliases)],
+                    rng.standard_normal((n * args.aliases, dim)).astype(np.float32),
+                    np.arange(0, n * args.aliases, args.aliases))
+    big.embeddings /= np.linalg.norm(big.embeddings, axis=1, keepdims=True)
+    print(f"synthetic: {n} món x {args.aliases} alias, lookup top-5 p50={time_lookup(big, query_embs, 20):.1f}µs")
+
+
+if __name__ == "__main__":
+    main()
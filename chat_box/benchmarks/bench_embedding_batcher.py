@@ -0,0 +1,54 @@
+"""
+Tải đồng thời lên EmbeddingService: encodes/giây và p99 latency theo mức concurrency,
+so sánh encode từng câu (EMBED_MICRO_BATCH=1) với micro-batching.
+
+    cd chat_box
+    python -m benchmarks.bench_embedding_batcher --requests 2000
+"""
+import argparse
+import concurrent.futures
+import time
+
+import numpy as np
+
+from embedding_service import EMBED_MAX_WAIT_MS, EMBED_MICRO_BATCH, EmbeddingService, load_model
+
+
+def run(service, concurrency, n_requests, offset):
+    latencies = []
+
+    def one(i):
+        # mỗi câu là duy nhất để không trúng cache RAM
+        start = time.perf_counter()
+        service.encode([f"món ăn số {offset + i} có bao nhiêu calo"], persist=False)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(n_requests)))
+    elapsed = time.perf_counter() - start
+    return n_requests / elapsed, np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--max-batch", type=int, default=EMBED_MICRO_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=EMBED_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    load_model(args.model).encode(["warm up"])
+    offset = 0
+    for label, max_batch in (("no batching", 1), ("micro-batch", args.max_batch)):
+        service = EmbeddingService(args.model, cache_dir=None, memory_entries=0,
+                                   micro_batch=max_batch, max_wait_ms=args.max_wait_ms if max_batch > 1 else 0)
+        for concurrency in (1, 4, 16, 64):
+            rate, p50, p99 = run(service, concurrency, args.requests, offset)
+            offset += args.requests
+            print(f"{label:>12}  concurrency={concurrency:>3}  {rate:8.1f} encodes/s  p50={p50:6.1f}ms  p99={p99:6.1f}ms  "
+                  f"avg batch={service.batcher.metrics()['avg_batch']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+So sánh thời gian decode khi lấy mẫu frame: đọc mọi frame (cách cũ) / grab+retrieve / seek.
+Video được tạo bằng OpenCV nên không cần file thật.
+
+    cd chat_box
+    python -m benchmarks.bench_frame_sampling --seconds 60 --interval 3
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+
+from benchmarks.synthetic_video import make_synthetic_video
+from video_frames import iter_frames
+
+
+def read_every_frame(video_path, interval_sec):
+    # cách cũ: cap.read() mọi frame, giữ 1 frame mỗi fps*interval
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = max(int(fps * interval_sec), 1)
+    frame_idx = kept = 0
+    while True:
+        ret, _ = cap.read()
+        if not ret:
+            break
+        if frame_idx % frame_interval == 0:
+            kept += 1
+        frame_idx += 1
+    cap.release()
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--interval", type=float, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for fps in (30, 60):
+            path = make_synthetic_video(os.path.join(tmp, f"synthetic_{fps}.mp4"), seconds=args.seconds, fps=fps,
+                                        size=(1280, 720))
+            per_minute = 60 / args.seconds
+            start = time.perf_counter()
+            kept = read_every_frame(path, args.interval)
+            print(f"fps={fps}  read-all  frames={kept:>3}  decode={(time.perf_counter() - start) * per_minute:6.2f}s/phút video")
+            for sampler in ("grab", "seek", "auto"):
+                start = time.perf_counter()
+                kept = sum(1 for _ in iter_frames(path, args.interval, sampler=sampler))
+                print(f"fps={fps}  {sampler:<8}  frames={kept:>3}  decode={(time.perf_counter() - start) * per_minute:6.2f}s/phút video")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Đo throughput của llm_gateway với server LLM giả (không cần mạng / HF_TOKEN).
+
+    cd chat_box
+    python -m benchmarks.bench_llm_gateway --requests 200 --latency 0.5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fake_llm_server import start_fake_llm_server
+from llm_gateway import LLMGateway
+
+
+async def run(base_url, total, concurrency, hedge_delay):
+    gateway = LLMGateway(api_key="fake", base_url=base_url, default_concurrency=concurrency,
+                         hedge_delay=hedge_delay)
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        await gateway.chat("fake-model", [{"role": "user", "content": "xin chào"}])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    await gateway.aclose()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"concurrency={concurrency:>3}  req/s={total / elapsed:7.1f}  "
+          f"p50={statistics.median(latencies) * 1000:7.1f}ms  p99={p99 * 1000:7.1f}ms  "
+          f"hedges={gateway.stats['hedges']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--hedge-delay", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    base_url, server = start_fake_llm_server(args.port, latency=args.latency, jitter=args.jitter)
+    for concurrency in (1, 8, 32, 64):
+        # concurrency thấp thì chạy ít request hơn cho đỡ lâu
+        total = min(args.requests, concurrency * 10)
+        asyncio.run(run(base_url, total, concurrency, args.hedge_delay))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
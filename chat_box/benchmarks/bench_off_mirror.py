@@ -0,0 +1,69 @@
+"""
+Đo tốc độ import mirror OpenFoodFacts và latency tra cứu barcode trên dump JSONL giả lập.
+
+    cd chat_box
+    python -m benchmarks.bench_off_mirror --products 2000000
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_off_server import fake_product
+from off_mirror import OFFMirror, import_dump
+
+
+def write_dump(path, n, seed=0):
+    rng = random.Random(seed)
+    template = fake_product("8930000000000")
+    barcodes = []
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as f:
+        for i in range(n):
+            barcode = str(rng.randrange(10 ** 12, 10 ** 13))
+            barcodes.append(barcode)
+            product = dict(template, code=barcode, product_name=f"Sản phẩm {i}")
+            f.write(json.dumps({"code": barcode, **product}, ensure_ascii=False) + "\n")
+    return barcodes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "products.jsonl.gz")
+        start = time.perf_counter()
+        barcodes = write_dump(dump, args.products)
+        print(f"dump giả: {args.products} sản phẩm, {os.path.getsize(dump) / 2**20:.0f} MB gz ({time.perf_counter() - start:.1f}s)")
+
+        out = os.path.join(tmp, "mirror")
+        start = time.perf_counter()
+        count = import_dump(dump, out, log_every=0)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(out) for name in names)
+        print(f"import: {count} sản phẩm, {count / elapsed:,.0f} sản phẩm/s, mirror {size / 2**20:.0f} MB")
+
+        start = time.perf_counter()
+        mirror = OFFMirror.open(out)
+        print(f"mở mirror: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+        rng = random.Random(1)
+        queries = [rng.choice(barcodes) if rng.random() < 0.8 else "0" + str(rng.randrange(10 ** 11)) for _ in range(args.lookups)]
+        latencies, hits = [], 0
+        for barcode in queries:
+            start = time.perf_counter()
+            hits += mirror.get(barcode) is not None
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"lookup: {args.lookups} lần (hit {hits / args.lookups:.0%})  p50={statistics.median(latencies) * 1e6:.1f}µs  "
+              f"p99={latencies[int(0.99 * (len(latencies) - 1))] * 1e6:.1f}µs")
+
+
+if __name__ == "__main__":
+    main()
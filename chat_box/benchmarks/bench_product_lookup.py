@@ -0,0 +1,89 @@
+"""
+Kiểm tra + đo ProductLookup với server OpenFoodFacts giả:
+cache RAM / SQLite, cache kết quả không tìm thấy và gộp request trùng barcode.
+
+    cd chat_box
+    python -m benchmarks.bench_product_lookup --scans 2000 --products 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_off_server import app as fake_app, start_fake_off_server
+from product_lookup import ProductLookup, ProductStore
+
+
+async def check_behaviour(base_url, db_path):
+    lookup = ProductLookup(base_url, store=ProductStore(db_path))
+    fake_app.state.requests = 0
+
+    # 50 request đồng thời cùng một barcode -> 1 lần gọi API
+    results = await asyncio.gather(*(lookup.lookup("8934673123456") for _ in range(50)))
+    assert all(r["status"] == 1 for r in results)
+    assert fake_app.state.requests == 1, fake_app.state.requests
+
+    # barcode không có trong OFF cũng được cache
+    assert (await lookup.lookup("0000000000000"))["status"] == 0
+    assert (await lookup.lookup("0000000000000"))["status"] == 0
+    assert fake_app.state.requests == 2, fake_app.state.requests
+
+    # barcode không hợp lệ không gọi API
+    assert (await lookup.lookup("../../etc"))["status"] == 0
+    await lookup.aclose()
+
+    # process mới (RAM trống) vẫn lấy được từ SQLite
+    restarted = ProductLookup(base_url, store=ProductStore(db_path))
+    assert (await restarted.lookup("8934673123456"))["status"] == 1
+    assert fake_app.state.requests == 2, fake_app.state.requests
+    print(f"ok: coalescing, negative cache, SQLite sau restart  {restarted.metrics()}")
+    await restarted.aclose()
+
+
+async def load(base_url, db_path, scans, products, concurrency):
+    lookup = ProductLookup(base_url, store=ProductStore(db_path))
+    fake_app.state.requests = 0
+    # phân bố lệch: vài sản phẩm phổ biến chiếm phần lớn lượt quét
+    barcodes = [f"893{i:010d}" for i in range(products)]
+    weights = [1 / (i + 1) for i in range(products)]
+    sequence = random.Random(0).choices(barcodes, weights, k=scans)
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def scan(barcode):
+        async with sem:
+            start = time.perf_counter()
+            await lookup.lookup(barcode)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(scan(b) for b in sequence))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"{scans} lượt quét / {products} sản phẩm: {scans / elapsed:8.1f} scans/s  "
+          f"p50={statistics.median(latencies) * 1000:6.2f}ms  p99={latencies[int(0.99 * (len(latencies) - 1))] * 1000:6.1f}ms  "
+          f"gọi API={fake_app.state.requests}")
+    await lookup.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scans", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.3, help="latency giả của OFF (giây)")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+
+    base_url, server = start_fake_off_server(args.port, latency=args.latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(check_behaviour(base_url, os.path.join(tmp, "check.db")))
+        asyncio.run(load(base_url, os.path.join(tmp, "load.db"), args.scans, args.products, args.concurrency))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
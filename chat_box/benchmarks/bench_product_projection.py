@@ -0,0 +1,55 @@
+"""
+So sánh product OpenFoodFacts gốc với bản rút gọn (product_projection.py): kích thước JSON / gzip,
+thời gian serialize và độ dài prompt gửi LLM.
+
+    cd chat_box
+    python -m benchmarks.bench_product_projection --products 2000
+"""
+import argparse
+import gzip
+import json
+import time
+
+from benchmarks.fake_off_server import fake_product
+from product_projection import parse_fields, product_payload, project_product, prompt_macros
+
+
+def measure(label, payloads):
+    start = time.perf_counter()
+    bodies = [json.dumps(p, ensure_ascii=False).encode() for p in payloads]
+    dump_us = (time.perf_counter() - start) / len(payloads) * 1e6
+    raw = sum(len(b) for b in bodies) / len(bodies)
+    gz = sum(len(gzip.compress(b, compresslevel=6)) for b in bodies) / len(bodies)
+    print(f"{label:<22} json {raw:>8.0f} B   gzip {gz:>7.0f} B   json.dumps {dump_us:>7.1f}µs")
+    return raw, gz
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1000)
+    args = parser.parse_args()
+
+    products = [fake_product(str(8930000000000 + i * 7919)) for i in range(args.products)]
+
+    start = time.perf_counter()
+    compact = [product_payload(p) for p in products]
+    project_us = (time.perf_counter() - start) / len(products) * 1e6
+    print(f"projection: {project_us:.1f}µs / sản phẩm\n")
+
+    raw_size, raw_gz = measure("raw", products)
+    compact_size, compact_gz = measure("compact", compact)
+    fields = parse_fields("product_name,nutriments")
+    measure("fields=name,nutriments", [product_payload(p, fields) for p in products])
+    print(f"\ncompact / raw: json {compact_size / raw_size:.1%}, gzip {compact_gz / raw_gz:.1%}")
+
+    # prompt cũ nhét cả dict nutriments; token ước lượng ~ 3 ký tự / token
+    old = [str(p["nutriments"]) for p in products]
+    new = [prompt_macros(project_product(p)) for p in products]
+    old_tokens = sum(len(s) for s in old) / len(old) / 3
+    new_tokens = sum(len(s) for s in new) / len(new) / 3
+    print(f"prompt dinh dưỡng: ~{old_tokens:.0f} -> ~{new_tokens:.0f} token")
+    print(f"vd: {new[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Tỉ lệ lượt quét barcode được kết luận bằng luật (product_verdict.py), latency của luật
+và số lần phải gọi LLM khi có cache theo (barcode, nhóm profile).
+
+    cd chat_box
+    python -m benchmarks.bench_product_verdict --scans 20000 --products 500
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from benchmarks.fake_off_server import fake_product
+from product_projection import project_product
+from product_verdict import ProductVerdicts, rule_verdict
+
+GOALS = ["lose_weight", "lose_weight_keto", "gain_weight", "build_muscle", "maintain_weight", "Giảm cân(lowCarb)", None]
+DISEASES = [None, None, None, "tiểu đường", "cao huyết áp", "mỡ máu", "gout", "không"]
+ALLERGIES = [None, None, None, "sữa", "tôm, cua", "đậu phộng", "gluten", "phấn hoa", "không"]
+
+
+def random_profile(rng):
+    return {
+        "weight": rng.uniform(45, 95),
+        "goal": rng.choice(GOALS),
+        "disease": rng.choice(DISEASES),
+        "allergy": rng.choice(ALLERGIES),
+    }
+
+
+async def run(args):
+    rng = random.Random(0)
+    barcodes = [str(8930000000000 + i * 7919) for i in range(args.products)]
+    products = {b: project_product(fake_product(b)) for b in barcodes}
+    profiles = [random_profile(rng) for _ in range(args.users)]
+    # vài sản phẩm phổ biến được quét nhiều hơn hẳn
+    weights = [1 / (i + 1) for i in range(len(barcodes))]
+    scans = [(rng.choices(barcodes, weights)[0], rng.choice(profiles)) for _ in range(args.scans)]
+
+    latencies = []
+    for barcode, profile in scans:
+        start = time.perf_counter()
+        rule_verdict(products[barcode], profile["goal"], profile["disease"], profile["allergy"])
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    print(f"luật: p50 {statistics.median(latencies):.1f}µs, p99 {latencies[int(len(latencies) * 0.99)]:.1f}µs")
+
+    verdicts = ProductVerdicts()
+
+    async def fake_llm():
+        await asyncio.sleep(0)
+        return "Có thể dùng, nhưng nên ăn vừa phải."
+
+    for barcode, profile in scans:
+        await verdicts.verdict(barcode, products[barcode], fake_llm, **profile)
+    metrics = verdicts.metrics()
+    print(f"{args.scans} lượt quét, {args.products} sản phẩm, {args.users} người dùng")
+    print(f"kết luận bằng luật: {metrics['rules']} ({metrics['rule_rate']:.1%})")
+    print(f"LLM cache hit: {metrics['llm_cached']}, gọi LLM: {metrics['llm_calls']} "
+          f"({metrics['llm_calls'] / args.scans:.1%} lượt quét, trước đây 100%)")
+    print(f"tiết kiệm ~{(args.scans - metrics['llm_calls']) * args.llm_latency:.0f}s LLM "
+          f"(giả định {args.llm_latency}s / lần gọi)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scans", type=int, default=20000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--llm-latency", type=float, default=1.5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
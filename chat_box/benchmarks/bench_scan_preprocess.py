@@ -0,0 +1,77 @@
+"""
+So sánh /scan_food trước và sau bước tiền xử lý ảnh: số byte gửi lên VLM mỗi request và latency,
+dùng ảnh điện thoại giả lập (4032x3024, JPEG q95) và VLM giả.
+
+    cd chat_box
+    python -m benchmarks.bench_scan_preprocess --images 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import base64
+import statistics
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+import llm_gateway
+from benchmarks.fake_llm_server import app as fake_app, start_fake_llm_server
+from image_preprocess import preprocess_image
+from nutrient_regressor import food_classification
+
+
+def make_phone_photo(seed, size=(4032, 3024), quality=95):
+    """Ảnh có nhiễu + gradient (nén kém như ảnh chụp thật), kèm EXIF xoay 90 độ."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    y, x = np.mgrid[0:h, 0:w]
+    base = np.stack([(x * 255 // w), (y * 255 // h), ((x + y) * 255 // (w + h))], axis=-1)
+    noise = rng.integers(0, 40, size=(h, w, 3))
+    img = Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: xoay 90 độ
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality, exif=exif)
+    return buf.getvalue()
+
+
+async def run(images, mode):
+    fake_app.state.bytes_received = 0
+    fake_app.state.requests = 0
+    latencies = []
+    for image_bytes in images:
+        start = time.perf_counter()
+        if mode == "raw":
+            await food_classification(base64.b64encode(image_bytes).decode("utf-8"))
+        else:
+            image = await asyncio.to_thread(preprocess_image, image_bytes)
+            await food_classification(image.b64, image.mime)
+        latencies.append(time.perf_counter() - start)
+    await llm_gateway._gateway.aclose()
+    per_request = fake_app.state.bytes_received / max(fake_app.state.requests, 1)
+    latencies.sort()
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{mode:>10}  bytes/request={per_request / 1024:9.1f} KB  "
+          f"p50={statistics.median(latencies) * 1000:7.1f}ms  p95={p95 * 1000:7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="latency giả của VLM (giây)")
+    parser.add_argument("--port", type=int, default=9003)
+    args = parser.parse_args()
+
+    base_url, server = start_fake_llm_server(args.port, latency=args.latency, jitter=0.0,
+                                             reply='{"dish": "pho bo", "ingredients": [], "confidence": "high", "message": ""}')
+    images = [make_phone_photo(seed) for seed in range(args.images)]
+    print(f"upload trung bình: {sum(map(len, images)) / len(images) / 1024:.1f} KB")
+    for mode in ("raw", "preprocess"):
+        llm_gateway._gateway = llm_gateway.LLMGateway(api_key="fake", base_url=base_url)
+        asyncio.run(run(images, mode))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Đo thời gian mô tả frame của /upload-video/ theo mức concurrency, dùng VLM giả (không tốn token).
+
+    cd chat_box
+    python -m benchmarks.bench_video_captioning --seconds 120 --latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import llm_gateway
+import vid_to_recipe
+from benchmarks.fake_llm_server import start_fake_llm_server
+from benchmarks.synthetic_video import make_synthetic_video
+
+
+async def run(video_path, base_url, concurrency):
+    llm_gateway._gateway = llm_gateway.LLMGateway(api_key="fake", base_url=base_url, default_concurrency=64)
+    start = time.perf_counter()
+    analysis = await vid_to_recipe.analyze_video(video_path, interval_sec=3, concurrency=concurrency)
+    elapsed = time.perf_counter() - start
+    results = analysis.get("frames", [])
+    await llm_gateway._gateway.aclose()
+    ordered = all(a["time"] <= b["time"] for a, b in zip(results, results[1:]))
+    print(f"concurrency={concurrency:>3}  frames={len(results):>4}  skipped={analysis.get('skipped_frames', 0):>4}  "
+          f"total={elapsed:7.2f}s  ordered={ordered}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=120)
+    parser.add_argument("--latency", type=float, default=1.0, help="latency giả của VLM (giây)")
+    parser.add_argument("--port", type=int, default=9001)
+    args = parser.parse_args()
+
+    base_url, server = start_fake_llm_server(args.port, latency=args.latency, jitter=args.latency * 0.2,
+                                             reply='{"food": "yes", "action": "Chop the onions."}')
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = make_synthetic_video(os.path.join(tmp, "synthetic.mp4"), seconds=args.seconds)
+        for concurrency in (1, 2, 4, 8, 16):
+            asyncio.run(run(video_path, base_url, concurrency))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Server LLM giả lập API OpenAI (/v1/chat/completions) để benchmark offline, không tốn token HF.
+
+Chạy riêng:
+    uvicorn benchmarks.fake_llm_server:app --port 9000
+    LLM_BASE_URL=http://127.0.0.1:9000/v1 uvicorn main:app --port 8001
+
+Hoặc dùng start_fake_llm_server() trong script benchmark.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))   # giây trung bình mỗi request
+FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0.1"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_REPLY = os.getenv("FAKE_LLM_REPLY", "Chatbot")
+
+app = FastAPI()
+app.state.latency = FAKE_LLM_LATENCY
+app.state.jitter = FAKE_LLM_JITTER
+app.state.error_rate = FAKE_LLM_ERROR_RATE
+app.state.reply = FAKE_LLM_REPLY
+app.state.requests = 0
+app.state.bytes_received = 0
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    raw = await request.body()
+    body = json.loads(raw)
+    app.state.requests += 1
+    app.state.bytes_received += len(raw)
+    await asyncio.sleep(max(0.0, random.gauss(app.state.latency, app.state.jitter)))
+    if random.random() < app.state.error_rate:
+        return JSONResponse(status_code=503, content={"error": {"message": "fake overload"}})
+
+    reply = app.state.reply
+    if body.get("stream"):
+        return StreamingResponse(_stream_reply(body.get("model", "fake"), reply), media_type="text/event-stream")
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(reply.split()), "total_tokens": len(reply.split())},
+    }
+
+
+async def _stream_reply(model, reply):
+    # token đầu tiên ra ngay sau latency, các token sau cách nhau một khoảng ngắn
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    words = reply.split(" ")
+    for i, word in enumerate(words):
+        if i:
+            await asyncio.sleep(app.state.latency / 20)
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def start_fake_llm_server(port=9000, **state):
+    """Chạy server giả trong thread nền, trả về base_url dạng http://127.0.0.1:<port>/v1."""
+    for key, value in state.items():
+        setattr(app.state, key, value)
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1", server
@@ -0,0 +1,78 @@
+"""
+Server OpenFoodFacts giả (/api/v2/product/{barcode}.json) để chạy thử / benchmark tra cứu barcode offline.
+
+Chạy riêng:
+    uvicorn benchmarks.fake_off_server:app --port 9100
+    OFF_BASE_URL=http://127.0.0.1:9100 uvicorn barcode:app --port 8003
+
+Barcode bắt đầu bằng "0" trả về status 0 (không có sản phẩm), các barcode khác trả về sản phẩm sinh ngẫu nhiên.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI
+
+FAKE_OFF_LATENCY = float(os.getenv("FAKE_OFF_LATENCY", "0.3"))
+
+app = FastAPI()
+app.state.latency = FAKE_OFF_LATENCY
+app.state.requests = 0
+
+
+def fake_product(barcode):
+    rng = random.Random(barcode)
+    kcal = rng.randint(50, 550)
+    return {
+        "code": barcode,
+        "product_name": f"Sản phẩm {barcode[-4:]}",
+        "brands": rng.choice(["Vinamilk", "Acecook", "Orion", "TH true MILK"]),
+        "quantity": f"{rng.choice([100, 180, 250, 500])} g",
+        "nutriscore_grade": rng.choice("abcde"),
+        "nova_group": rng.randint(1, 4),
+        "allergens_tags": rng.sample(["en:milk", "en:gluten", "en:soybeans", "en:nuts", "en:eggs"], rng.randint(0, 2)),
+        "ingredients_text": "đường, sữa bột, dầu thực vật, muối, hương liệu " * rng.randint(1, 5),
+        "nutriments": {
+            "energy-kcal": kcal,
+            "energy-kcal_100g": kcal,
+            "proteins": round(rng.uniform(0, 30), 1),
+            "proteins_100g": round(rng.uniform(0, 30), 1),
+            "carbohydrates": round(rng.uniform(0, 80), 1),
+            "carbohydrates_100g": round(rng.uniform(0, 80), 1),
+            "sugars_100g": round(rng.uniform(0, 40), 1),
+            "fat": round(rng.uniform(0, 35), 1),
+            "fat_100g": round(rng.uniform(0, 35), 1),
+            "saturated-fat_100g": round(rng.uniform(0, 15), 1),
+            "salt_100g": round(rng.uniform(0, 3), 2),
+            "sodium_100g": round(rng.uniform(0, 1.2), 2),
+            "fiber_100g": round(rng.uniform(0, 10), 1),
+        },
+        # OFF trả về rất nhiều trường, mô phỏng kích thước response thật
+        "images": {str(i): {"sizes": {"100": {"h": 100, "w": 75}, "400": {"h": 400, "w": 300}}} for i in range(20)},
+        "categories_tags": [f"en:category-{i}" for i in range(rng.randint(5, 30))],
+    }
+
+
+@app.get("/api/v2/product/{barcode}.json")
+async def product(barcode: str):
+    app.state.requests += 1
+    await asyncio.sleep(app.state.latency)
+    if barcode.startswith("0"):
+        return {"code": barcode, "status": 0, "status_verbose": "product not found"}
+    return {"code": barcode, "status": 1, "status_verbose": "product found", "product": fake_product(barcode)}
+
+
+def start_fake_off_server(port=9100, **state):
+    """Chạy server giả trong thread nền, trả về (base_url, server)."""
+    for key, value in state.items():
+        setattr(app.state, key, value)
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
@@ -0,0 +1,99 @@
+"""
+Sinh ảnh barcode EAN-13 giả lập (không cần thư viện barcode ngoài Pillow) để benchmark /scan_barcode:
+ảnh chụp lớn, xoay nghiêng, tương phản thấp + nhiễu, mờ, nhiều mã trong một ảnh.
+"""
+import random
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+L_CODES = ["0001101", "0011001", "0010011", "0111101", "0100011", "0110001", "0101111", "0111011", "0110111", "0001011"]
+G_CODES = ["0100111", "0110011", "0011011", "0100001", "0011101", "0111001", "0000101", "0010001", "0001001", "0010111"]
+R_CODES = ["1110010", "1100110", "1101100", "1000010", "1011100", "1001110", "1010000", "1000100", "1001000", "1110100"]
+# chữ số đầu quyết định nhóm L/G của 6 số bên trái
+PARITY = ["LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG", "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL"]
+
+
+def ean13_checksum(digits12):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits12))
+    return str((10 - total % 10) % 10)
+
+
+def random_ean13(rng):
+    digits = "893" + "".join(str(rng.randrange(10)) for _ in range(9))
+    return digits + ean13_checksum(digits)
+
+
+def ean13_modules(code):
+    """Chuỗi 95 module '0'/'1' của mã EAN-13."""
+    first, left, right = int(code[0]), code[1:7], code[7:]
+    bits = "101"
+    for parity, d in zip(PARITY[first], left):
+        bits += (L_CODES if parity == "L" else G_CODES)[int(d)]
+    bits += "01010"
+    bits += "".join(R_CODES[int(d)] for d in right)
+    return bits + "101"
+
+
+def render_ean13(code, module=3, height=120, quiet=12):
+    bits = ean13_modules(code)
+    width = (len(bits) + 2 * quiet) * module
+    img = Image.new("L", (width, height + 2 * quiet * module // 2), 255)
+    draw = ImageDraw.Draw(img)
+    top = quiet * module // 2
+    for i, bit in enumerate(bits):
+        if bit == "1":
+            x = (quiet + i) * module
+            draw.rectangle([x, top, x + module - 1, top + height], fill=0)
+    return img
+
+
+def place(canvas, tile, rng, angle=0):
+    if angle:
+        tile = tile.rotate(angle, expand=True, fillcolor=255)
+    x = rng.randrange(0, max(canvas.width - tile.width, 1))
+    y = rng.randrange(0, max(canvas.height - tile.height, 1))
+    canvas.paste(tile, (x, y))
+
+
+def make_image(kind, rng):
+    """(byte JPEG, danh sách mã trong ảnh)."""
+    codes = [random_ean13(rng)]
+    if kind == "clean":
+        canvas = Image.new("L", (1200, 900), 235)
+        place(canvas, render_ean13(codes[0], module=4), rng)
+    elif kind == "large_photo":
+        canvas = Image.new("L", (4032, 3024), 225)
+        place(canvas, render_ean13(codes[0], module=9, height=400), rng)
+    elif kind == "rotated":
+        canvas = Image.new("L", (1600, 1200), 235)
+        place(canvas, render_ean13(codes[0], module=4), rng, angle=rng.choice([-40, -30, 30, 40]))
+    elif kind == "low_contrast":
+        canvas = Image.new("L", (1600, 1200), 255)
+        place(canvas, render_ean13(codes[0], module=4), rng)
+        pixels = np.asarray(canvas, dtype=np.float32) * 0.25 + 90
+        pixels += np.random.default_rng(rng.randrange(1 << 30)).normal(0, 10, pixels.shape)
+        canvas = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    elif kind == "blurred":
+        canvas = Image.new("L", (1600, 1200), 235)
+        place(canvas, render_ean13(codes[0], module=3), rng)
+        canvas = canvas.filter(ImageFilter.GaussianBlur(1.6))
+    elif kind == "multi":
+        codes.append(random_ean13(rng))
+        canvas = Image.new("L", (1600, 1200), 235)
+        canvas.paste(render_ean13(codes[0], module=4), (40, 60))
+        canvas.paste(render_ean13(codes[1], module=4), (700, 700))
+    else:
+        raise ValueError(kind)
+    buf = BytesIO()
+    canvas.convert("RGB").save(buf, format="JPEG", quality=88)
+    return buf.getvalue(), codes
+
+
+KINDS = ["clean", "large_photo", "rotated", "low_contrast", "blurred", "multi"]
+
+
+def make_dataset(per_kind, seed=0):
+    rng = random.Random(seed)
+    return [(kind, *make_image(kind, rng)) for kind in KINDS for _ in range(per_kind)]
@@ -0,0 +1,24 @@
+"""Tạo video giả bằng OpenCV để benchmark pipeline video mà không cần file thật."""
+import cv2
+import numpy as np
+
+
+def make_synthetic_video(path, seconds=60, fps=30, size=(640, 360), scene_every=5):
+    """
+    Ghi một video mp4 gồm các "cảnh" tĩnh đổi màu mỗi `scene_every` giây, có một hình tròn di chuyển.
+    Trả về path.
+    """
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    rng = np.random.default_rng(0)
+    colors = rng.integers(0, 255, size=(seconds // max(scene_every, 1) + 1, 3))
+    for i in range(int(seconds * fps)):
+        t = i / fps
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:] = colors[int(t // scene_every)]
+        x = int((t * 40) % width)
+        cv2.circle(frame, (x, height // 2), 30, (255, 255, 255), -1)
+        cv2.putText(frame, f"{t:05.1f}s", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+        writer.write(frame)
+    writer.release()
+    return path
@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+#---config---#
+CHAT_STORE_BACKEND = os.getenv("CHAT_STORE_BACKEND", "memory")  # memory | sqlite
+CHAT_STORE_PATH = os.getenv("CHAT_STORE_PATH", os.path.join(os.path.dirname(__file__), "chat_sessions.db"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "2000"))
+CHAT_MAX_TURNS = int(os.getenv("CHAT_MAX_TURNS", "6"))          # số lượt (user + assistant) giữ nguyên văn
+CHAT_MAX_TOKENS = int(os.getenv("CHAT_MAX_TOKENS", "1500"))     # ngân sách token cho lịch sử gửi lên LLM
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "3600")) # giây không hoạt động thì xoá session
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+#---config---#
+
+
+def estimate_tokens(text):
+    # Ước lượng thô: tiếng Việt có dấu ~3 kí tự / token, đủ để giữ ngân sách ổn định
+    return len(text) // 3 + 1
+
+
+def _truncate(text, max_tokens):
+    max_chars = max_tokens * 3
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "…"
+
+
+class MemoryBackend:
+    """Lưu session trong RAM, LRU theo lần truy cập gần nhất."""
+
+    def __init__(self, max_sessions=CHAT_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return record
+
+    def save(self, session_id, record):
+        with self._lock:
+            self._sessions[session_id] = record
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict_idle(self, cutoff):
+        with self._lock:
+            stale = [sid for sid, rec in self._sessions.items() if rec["last_seen"] < cutoff]
+            for sid in stale:
+                del self._sessions[sid]
+            return len(stale)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteBackend:
+    """Lưu session xuống file SQLite để nhiều worker dùng chung và không mất khi restart."""
+
+    def __init__(self, path=CHAT_STORE_PATH, max_sessions=CHAT_MAX_SESSIONS):
+        self.path = path
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " record TEXT NOT NULL,"
+            " last_seen REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_seen ON sessions(last_seen)")
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, record):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, record, last_seen) VALUES (?, ?, ?)",
+                (session_id, json.dumps(record, ensure_ascii=False), record["last_seen"]),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            if count > self.max_sessions:
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE session_id IN ("
+                    " SELECT session_id FROM sessions ORDER BY last_seen ASC LIMIT ?)",
+                    (count - self.max_sessions,),
+                )
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def evict_idle(self, cutoff):
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM sessions WHERE last_seen < ?", (cutoff,))
+            return cur.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class ConversationStore:
+    """
+    Lịch sử hội thoại theo session_id.
+    Mỗi session gồm một đoạn tóm tắt (các lượt cũ đã được nén) và vài lượt gần nhất,
+    tổng số token luôn nằm trong CHAT_MAX_TOKENS nên prompt không phình ra theo thời gian.
+    """
+
+    def __init__(self, backend=None, max_turns=CHAT_MAX_TURNS, max_tokens=CHAT_MAX_TOKENS,
+                 session_ttl=CHAT_SESSION_TTL, summary_tokens=CHAT_SUMMARY_TOKENS):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.session_ttl = session_ttl
+        self.summary_tokens = summary_tokens
+        self._last_sweep = time.time()
+
+    def history(self, session_id):
+        """Trả về list message (role/content) để ghép vào prompt."""
+        self._maybe_sweep()
+        record = self.backend.load(session_id)
+        if record is None:
+            return []
+        if time.time() - record["last_seen"] > self.session_ttl:
+            self.backend.delete(session_id)
+            return []
+        messages = []
+        if record["summary"]:
+            messages.append({"role": "system", "content": f"Tóm tắt cuộc trò chuyện trước: {record['summary']}"})
+        messages.extend(record["turns"])
+        return messages
+
+    def append(self, session_id, user_text, assistant_text):
+        record = self.backend.load(session_id) or {"summary": "", "turns": [], "last_seen": 0.0}
+        record["turns"].append({"role": "user", "content": user_text})
+        record["turns"].append({"role": "assistant", "content": assistant_text})
+        record["last_seen"] = time.time()
+        self._compact(record)
+        self.backend.save(session_id, record)
+
+    def clear(self, session_id):
+        self.backend.delete(session_id)
+
+    def _compact(self, record):
+        turns = record["turns"]
+        summary_budget = min(self.summary_tokens, self.max_tokens // 3)
+        budget = self.max_tokens - summary_budget
+
+        # Các lượt vượt quá max_turns hoặc ngân sách token được nén vào phần tóm tắt
+        dropped = []
+        while len(turns) > 2 and (len(turns) > self.max_turns * 2
+                                  or sum(estimate_tokens(m["content"]) for m in turns) > budget):
+            dropped.extend(turns[:2])
+            turns = turns[2:]
+        asked = [m["content"] for m in dropped if m["role"] == "user"]
+        if asked:
+            summary = (record["summary"] + " | " if record["summary"] else "") + "Người dùng đã hỏi: " + "; ".join(asked)
+            # giữ phần mới nhất của tóm tắt
+            record["summary"] = summary[-summary_budget * 3:]
+
+        # Lượt cuối cùng vẫn quá dài thì cắt bớt nội dung
+        if sum(estimate_tokens(m["content"]) for m in turns) > budget:
+            per_message = max(budget // len(turns), 1)
+            turns = [{"role": m["role"], "content": _truncate(m["content"], per_message)} for m in turns]
+        record["turns"] = turns
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        self.backend.evict_idle(now - self.session_ttl)
+
+
+def create_store():
+    if CHAT_STORE_BACKEND == "sqlite":
+        return ConversationStore(backend=SQLiteBackend())
+    return ConversationStore(backend=MemoryBackend())
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+#---config---#
+DISH_INDEX_PATH = os.getenv("DISH_INDEX_PATH", os.path.join(os.path.dirname(__file__), "dish_index.npz"))
+# cosine tối thiểu giữa tên món VLM trả về và alias gần nhất; dưới ngưỡng coi như món không có trong DB
+DISH_MATCH_MIN_SCORE = float(os.getenv("DISH_MATCH_MIN_SCORE", "0.45"))
+#---config---#
+
+
+def index_fingerprint(model_name, entries):
+    digest = hashlib.sha1(model_name.encode())
+    for key, aliases in entries:
+        digest.update(json.dumps([key, aliases], ensure_ascii=False).encode())
+    return digest.hexdigest()[:16]
+
+
+def load_dishes_file(path, normalize=str.lower):
+    """Đọc graphrag/input/dishes.txt (list JSON {id, metadata: {dish_name, ...}}) thành [(id, [alias])]."""
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    entries = []
+    for item in items:
+        name = item.get("metadata", {}).get("dish_name")
+        if name:
+            entries.append((item["id"], [normalize(name)]))
+    return entries
+
+
+class DishIndex:
+    """
+    Index tên món theo embedding của mọi alias.
+    - embeddings của tất cả alias nằm trong một ma trận float32 liên tục, đã chuẩn hoá (cosine = tích vô hướng)
+    - alias của cùng một món nằm liền nhau, offsets[i] là dòng đầu tiên của món i
+    - search(): một phép nhân ma trận cho cả batch query, lấy max theo alias của từng món rồi top-k
+    """
+
+    def __init__(self, keys, aliases, embeddings, offsets, fingerprint=None):
+        self.keys = list(keys)
+        self.aliases = list(aliases)
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, entries, encode, fingerprint=None):
+        """entries: [(dish_key, [alias, ...])]; encode(list[str]) -> ma trận embedding."""
+        keys, aliases, offsets = [], [], []
+        for key, names in entries:
+            names = list(dict.fromkeys(n for n in names if n))  # bỏ alias trùng, giữ thứ tự
+            if not names:
+                continue
+            keys.append(key)
+            offsets.append(len(aliases))
+            aliases.extend(names)
+        embeddings = np.asarray(encode(aliases), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+        return cls(keys, aliases, embeddings, offsets, fingerprint)
+
+    @classmethod
+    def load_or_build(cls, entries, encode, model_name, path=DISH_INDEX_PATH):
+        """Nạp index từ đĩa nếu cùng model + cùng danh sách alias, nếu không thì encode lại và lưu."""
+        fingerprint = index_fingerprint(model_name, entries)
+        if path and os.path.exists(path):
+            try:
+                index = cls.load(path)
+                if index.fingerprint == fingerprint:
+                    return index
+            except (OSError, ValueError, KeyError) as e:
+                print(f"🔴 [DishIndex] Không đọc được {path}: {e}")
+        index = cls.build(entries, encode, fingerprint)
+        if path:
+            index.save(path)
+        return index
+
+    def save(self, path=DISH_INDEX_PATH):
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            embeddings=self.embeddings,
+            offsets=self.offsets,
+            keys=np.asarray(self.keys),
+            aliases=np.asarray(self.aliases),
+            fingerprint=np.asarray(self.fingerprint or ""),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=DISH_INDEX_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["keys"].tolist(),
+                data["aliases"].tolist(),
+                data["embeddings"],
+                data["offsets"],
+                str(data["fingerprint"]) or None,
+            )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def scores(self, query_embeddings):
+        """(số query, số món): cosine cao nhất giữa query và các alias của từng món."""
+        q = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        q = q / np.linalg.norm(q, axis=1, keepdims=True).clip(min=1e-12)
+        sims = q @ self.embeddings.T
+        return np.maximum.reduceat(sims, self.offsets, axis=1)
+
+    def search(self, query_embeddings, k=1):
+        """Với mỗi query trả về list [(dish_key, score)] gồm k món gần nhất, giảm dần theo score."""
+        per_dish = self.scores(query_embeddings)
+        k = min(k, per_dish.shape[1])
+        top = np.argpartition(-per_dish, k - 1, axis=1)[:, :k]
+        results = []
+        for row, idx in zip(per_dish, top):
+            idx = idx[np.argsort(-row[idx])]
+            results.append([(self.keys[i], float(row[i])) for i in idx])
+        return results
+
+    def match(self, query_embedding, min_score=DISH_MATCH_MIN_SCORE):
+        key, score = self.search(query_embedding, k=1)[0][0]
+        return (key if score >= min_score else None), score
@@ -1,6 +1,6 @@
-from sentence_transformers import SentenceTransformer
+from embedding_service import get_embedder
 
-model = SentenceTransformer('all-MiniLM-L12-v2')
+model = get_embedder('all-MiniLM-L12-v2')
 
 def get_embedding(text: str):
     embedding = model.encode(text, convert_to_numpy = True)
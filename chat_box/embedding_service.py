@@ -0,0 +1,231 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from micro_batcher import MicroBatcher
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khoá file, chỉ an toàn khi một process ghi cache
+    fcntl = None
+
+#---config---#
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(os.path.dirname(__file__), "embedding_cache"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MEMORY_ENTRIES = int(os.getenv("EMBED_MEMORY_ENTRIES", "10000"))  # LRU trong RAM cho câu hỏi người dùng
+# micro-batching: các lời gọi encode lẻ từ nhiều request được gom trong tối đa EMBED_MAX_WAIT_MS
+# hoặc tới khi đủ EMBED_MICRO_BATCH text rồi encode một lần (EMBED_MICRO_BATCH=1 để tắt)
+EMBED_MICRO_BATCH = int(os.getenv("EMBED_MICRO_BATCH", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+#---config---#
+
+_models = {}
+_services = {}
+_models_lock = threading.Lock()
+
+
+def load_model(model_name):
+    """SentenceTransformer được load đúng một lần mỗi process."""
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+            _models[model_name] = model
+        return model
+
+
+def normalize_key(text):
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class DiskEmbeddingCache:
+    """
+    Cache embedding trên đĩa cho một model:
+    - <slug>.f32: ma trận float32 (số dòng x dim) đọc bằng np.memmap, ghi nối đuôi
+    - <slug>.keys.jsonl: mỗi dòng là text tương ứng với dòng cùng vị trí trong .f32
+    Nhiều worker uvicorn dùng chung file, việc ghi được khoá bằng flock.
+    """
+
+    def __init__(self, model_name, cache_dir=EMBED_CACHE_DIR):
+        os.makedirs(cache_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.vectors_path = os.path.join(cache_dir, f"{slug}.f32")
+        self.keys_path = os.path.join(cache_dir, f"{slug}.keys.jsonl")
+        self.meta_path = os.path.join(cache_dir, f"{slug}.meta.json")
+        self.lock_path = os.path.join(cache_dir, f"{slug}.lock")
+        self.model_name = model_name
+        self.dim = None
+        self._rows = {}
+        self._keys_offset = 0
+        self._mmap = None
+        self._lock = threading.Lock()
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+            self._sync()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _file_lock(self):
+        f = open(self.lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _sync(self):
+        """Đọc thêm các key mà process khác đã ghi từ lần đọc trước."""
+        if not os.path.exists(self.keys_path):
+            return
+        max_rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith(b"\n") or len(self._rows) >= max_rows:
+                    break  # dòng ghi dở hoặc vector chưa được ghi xong
+                self._rows.setdefault(json.loads(line), len(self._rows))
+                self._keys_offset += len(line)
+        self._mmap = None
+
+    def _matrix(self):
+        if self._mmap is None or self._mmap.shape[0] < len(self._rows):
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self._rows), self.dim))
+        return self._mmap
+
+    def get(self, keys):
+        """Trả về {key: vector} cho các key đã có trên đĩa."""
+        with self._lock:
+            rows = [(key, self._rows[key]) for key in keys if key in self._rows]
+            if not rows:
+                return {}
+            matrix = self._matrix()
+            return {key: np.array(matrix[row]) for key, row in rows}
+
+    def put(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            lock = self._file_lock()
+            try:
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    with open(self.meta_path, "w") as f:
+                        json.dump({"model": self.model_name, "dim": self.dim}, f)
+                self._sync()
+                new = [(k, v) for k, v in zip(keys, vectors) if k not in self._rows]
+                if not new:
+                    return
+                start = len(self._rows)
+                # ghi vector trước vào đúng vị trí dòng, rồi mới ghi key -> reader không bao giờ thấy key thiếu vector
+                mode = "r+b" if os.path.exists(self.vectors_path) else "wb"
+                with open(self.vectors_path, mode) as f:
+                    f.seek(start * 4 * self.dim)
+                    f.write(np.stack([v for _, v in new]).tobytes())
+                with open(self.keys_path, "ab") as f:
+                    f.write(b"".join(json.dumps(k, ensure_ascii=False).encode() + b"\n" for k, _ in new))
+                self._sync()
+            finally:
+                lock.close()
+
+
+class EmbeddingService:
+    """
+    Embedding dùng chung cho mọi module trong process, mỗi model một instance (get_embedder()).
+    encode() tra theo thứ tự: LRU trong RAM -> cache trên đĩa -> model (chỉ encode các text còn thiếu, theo batch).
+    Vector luôn được chuẩn hoá (norm = 1). Có cùng chữ ký encode() với SentenceTransformer để thay thế trực tiếp.
+    """
+
+    def __init__(self, model_name, cache_dir=EMBED_CACHE_DIR, memory_entries=EMBED_MEMORY_ENTRIES,
+                 micro_batch=EMBED_MICRO_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.model_name = model_name
+        self.batcher = MicroBatcher(self._encode_batch, micro_batch, max_wait_ms, name=f"embed:{model_name}")
+        self.disk = DiskEmbeddingCache(model_name, cache_dir) if cache_dir else None
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "encoded": 0}
+
+    @property
+    def model(self):
+        return load_model(self.model_name)
+
+    def _encode_batch(self, texts):
+        vectors = self.model.encode(texts, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True,
+                                    convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def encode(self, sentences, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True, persist=True, **kwargs):
+        """
+        sentences: str hoặc list[str]. persist=False: chỉ giữ trong RAM (câu hỏi người dùng),
+        persist=True: ghi thêm xuống cache đĩa (tên món, dữ liệu mẫu, ... dùng lại sau khi restart).
+        """
+        single = isinstance(sentences, str)
+        keys = [normalize_key(s) for s in ([sentences] if single else sentences)]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+        self.stats["memory_hits"] += len(found)
+
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing and self.disk is not None:
+            from_disk = self.disk.get(missing)
+            self.stats["disk_hits"] += len(from_disk)
+            found.update(from_disk)
+            missing = [k for k in missing if k not in from_disk]
+        if missing:
+            if len(missing) >= self.batcher.max_batch:
+                vectors = self._encode_batch(missing)
+            else:
+                # ít text (thường là 1 câu hỏi): gom chung batch với các request khác đang chờ
+                vectors = np.stack(self.batcher.map(missing))
+            self.stats["encoded"] += len(missing)
+            found.update(zip(missing, vectors))
+            if persist and self.disk is not None:
+                self.disk.put(missing, vectors)
+
+        with self._lock:
+            for key in keys:
+                self._remember(key, found[key])
+        result = np.stack([found[key] for key in keys]) if keys else np.zeros((0, self.dimension), dtype=np.float32)
+        return result[0] if single else result
+
+    @property
+    def dimension(self):
+        if self.disk is not None and self.disk.dim is not None:
+            return self.disk.dim
+        return self.model.get_sentence_embedding_dimension()
+
+    def metrics(self):
+        return {
+            "model": self.model_name,
+            "loaded": self.model_name in _models,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "micro_batch": self.batcher.metrics(),
+            **self.stats,
+        }
+
+
+def get_embedder(model_name, **kwargs):
+    """EmbeddingService dùng chung trong process cho model_name."""
+    with _models_lock:
+        service = _services.get(model_name)
+        if service is None:
+            service = EmbeddingService(model_name, **kwargs)
+            _services[model_name] = service
+        return service
@@ -0,0 +1,292 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows không có module resource
+    resource = None
+
+import pyarrow.parquet as pq
+
+from graphrag.config.models.vector_store_schema_config import VectorStoreSchemaConfig
+from graphrag.query.indexer_adapters import (
+    read_indexer_entities,
+    read_indexer_relationships,
+    read_indexer_reports,
+    read_indexer_text_units,
+)
+from graphrag.vector_stores.lancedb import LanceDBVectorStore
+
+#---config---#
+GRAPHRAG_INDEX_DIR = os.getenv("GRAPHRAG_INDEX_DIR", os.path.join(os.path.dirname(__file__), "graphrag", "output"))
+# bao nhiêu giây kiểm tra thư mục index một lần để tự nạp bản mới (0 = tắt)
+GRAPHRAG_WATCH_INTERVAL = float(os.getenv("GRAPHRAG_WATCH_INTERVAL", "0"))
+#---config---#
+
+COMMUNITY_REPORT_TABLE = "community_reports"
+ENTITY_TABLE = "entities"
+COMMUNITY_TABLE = "communities"
+RELATIONSHIP_TABLE = "relationships"
+# COVARIATE_TABLE = "covariates"
+TEXT_UNIT_TABLE = "text_units"
+REQUIRED_TABLES = [ENTITY_TABLE, COMMUNITY_TABLE, RELATIONSHIP_TABLE, COMMUNITY_REPORT_TABLE, TEXT_UNIT_TABLE]
+
+
+def index_version(input_dir):
+    """Dấu vân tay của một thư mục output (tên, kích thước, mtime của các bảng parquet)."""
+    digest = hashlib.sha1(os.path.abspath(input_dir).encode())
+    for name in REQUIRED_TABLES:
+        path = os.path.join(input_dir, f"{name}.parquet")
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:12]
+
+
+def current_rss_mb():
+    """RSS hiện tại của process (MB), đọc từ /proc nếu có."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return round(peak / 1024 if sys.platform.startswith("linux") else peak / (1024 * 1024), 1)
+
+
+class GraphRAGIndex:
+    """
+    Đọc output của GraphRAG theo kiểu lazy.
+    - Parquet được đọc bằng Arrow (memory_map tránh một lần copy khi đọc file); dữ liệu được giải nén và
+      chuyển thành DataFrame / object indexer trong bộ nhớ riêng của từng worker, không dùng chung giữa các worker
+    - Bảng và các object indexer (entities, reports, ...) chỉ được tạo ở lần truy vấn đầu tiên
+    - metrics() trả về thời gian load từng bảng và RSS để theo dõi cold start / bộ nhớ mỗi worker
+    """
+
+    def __init__(self, input_dir, community_level=2):
+        self.input_dir = input_dir
+        self.community_level = community_level
+        self.version = index_version(input_dir)
+        self._tables = {}
+        self._objects = {}
+        self._lock = threading.RLock()
+        self._timings = {}
+
+    def _timed(self, key, build):
+        start = time.perf_counter()
+        value = build()
+        self._timings[key] = round(time.perf_counter() - start, 4)
+        return value
+
+    def table(self, name):
+        """DataFrame của một bảng parquet, đọc ở lần gọi đầu."""
+        with self._lock:
+            df = self._tables.get(name)
+            if df is None:
+                path = os.path.join(self.input_dir, f"{name}.parquet")
+                df = self._timed(f"table:{name}", lambda: self._read_parquet(path))
+                self._tables[name] = df
+            return df
+
+    @staticmethod
+    def _read_parquet(path):
+        arrow_table = pq.read_table(path, memory_map=True)
+        # to_pandas copy dữ liệu sang bộ nhớ của pandas (cột parquet đã nén nên không thể dùng thẳng vùng mmap);
+        # self_destruct giải phóng buffer Arrow ngay khi chuyển xong từng cột, tránh giữ 2 bản
+        return arrow_table.to_pandas(split_blocks=True, self_destruct=True)
+
+    def _lazy(self, key, build):
+        with self._lock:
+            if key not in self._objects:
+                self._objects[key] = self._timed(key, build)
+            return self._objects[key]
+
+    @property
+    def entities(self):
+        return self._lazy("entities", lambda: read_indexer_entities(
+            self.table(ENTITY_TABLE), self.table(COMMUNITY_TABLE), self.community_level))
+
+    @property
+    def relationships(self):
+        return self._lazy("relationships", lambda: read_indexer_relationships(self.table(RELATIONSHIP_TABLE)))
+
+    @property
+    def reports(self):
+        return self._lazy("reports", lambda: read_indexer_reports(
+            self.table(COMMUNITY_REPORT_TABLE), self.table(COMMUNITY_TABLE), self.community_level))
+
+    @property
+    def text_units(self):
+        return self._lazy("text_units", lambda: read_indexer_text_units(self.table(TEXT_UNIT_TABLE)))
+
+    @property
+    def description_embedding_store(self):
+        def build():
+            # load description embeddings to an in-memory lancedb vectorstore
+            store = LanceDBVectorStore(
+                vector_store_schema_config=VectorStoreSchemaConfig(
+                    index_name="default-entity-description"
+                )
+            )
+            store.connect(db_uri=os.path.join(self.input_dir, "lancedb"))
+            return store
+        return self._lazy("description_embedding_store", build)
+
+    def validate(self):
+        """Đọc toàn bộ index và kiểm tra tính hợp lệ, raise ValueError nếu có vấn đề."""
+        for name in REQUIRED_TABLES:
+            path = os.path.join(self.input_dir, f"{name}.parquet")
+            if not os.path.exists(path):
+                raise ValueError(f"Thiếu bảng {name}.parquet trong {self.input_dir}")
+        if not os.path.isdir(os.path.join(self.input_dir, "lancedb")):
+            raise ValueError(f"Thiếu thư mục lancedb trong {self.input_dir}")
+        for name in (ENTITY_TABLE, TEXT_UNIT_TABLE):
+            if len(self.table(name)) == 0:
+                raise ValueError(f"Bảng {name} rỗng")
+        # tạo trước các object để lần truy vấn đầu trên snapshot mới không bị chậm
+        if not self.entities or not self.text_units:
+            raise ValueError("Không đọc được entities / text_units")
+        self.relationships
+        self.reports
+        self.description_embedding_store
+
+    def metrics(self):
+        with self._lock:
+            rows = {name: len(df) for name, df in self._tables.items()}
+            loaded = list(self._objects)
+        return {
+            "input_dir": self.input_dir,
+            "version": self.version,
+            "rows": rows,
+            "loaded": loaded,
+            "timings_s": dict(self._timings),
+            "rss_mb": current_rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+class GraphRAGSnapshot:
+    """Một phiên bản index cùng search engine tương ứng; truy vấn đang chạy giữ tham chiếu tới nó."""
+
+    def __init__(self, index, search_engine):
+        self.index = index
+        self.search_engine = search_engine
+        self.version = index.version
+        self.loaded_at = time.time()
+
+
+class SnapshotManager:
+    """
+    Quản lý index GraphRAG đang phục vụ.
+    - current(): snapshot hiện tại, tạo lazy ở lần gọi đầu
+    - reload(): nạp + validate index mới trong thread nền rồi đổi snapshot một cách nguyên tử,
+      truy vấn đang chạy vẫn dùng snapshot cũ nên không có downtime
+    build_engine(index) là hàm tạo LocalSearch từ một GraphRAGIndex.
+    """
+
+    def __init__(self, build_engine, input_dir=GRAPHRAG_INDEX_DIR, community_level=2,
+                 watch_interval=GRAPHRAG_WATCH_INTERVAL):
+        self.build_engine = build_engine
+        self.input_dir = input_dir
+        self.community_level = community_level
+        self._current = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+        self.last_error = None
+        self.failed_version = None  # version nạp lỗi gần nhất, watcher bỏ qua tới khi file đổi tiếp
+        self.swaps = 0
+        if watch_interval > 0:
+            threading.Thread(target=self._watch, args=(watch_interval,), daemon=True).start()
+
+    def current(self):
+        snapshot = self._current
+        if snapshot is not None:
+            return snapshot
+        # _reload_lock: listener nhận version của snapshot đầu tiên trước mọi lần reload sau đó
+        with self._reload_lock:
+            if self._current is None:
+                index = GraphRAGIndex(self.input_dir, self.community_level)
+                snapshot = GraphRAGSnapshot(index, self.build_engine(index))
+                with self._lock:
+                    self._current = snapshot
+                for callback in self._listeners:
+                    callback(None, snapshot.version)
+            return self._current
+
+    @property
+    def version(self):
+        snapshot = self._current
+        return snapshot.version if snapshot is not None else index_version(self.input_dir)
+
+    def on_swap(self, callback):
+        """
+        Đăng kí callback(old_version, new_version) được gọi khi snapshot đầu tiên được tạo
+        (old_version = None) và sau mỗi lần đổi snapshot.
+        """
+        self._listeners.append(callback)
+
+    def reload(self, input_dir=None):
+        """Nạp index mới (chạy đồng bộ, nên gọi trong thread nền). Trả về True nếu đã đổi snapshot."""
+        input_dir = input_dir or self.input_dir
+        with self._reload_lock:
+            version = index_version(input_dir)
+            try:
+                index = GraphRAGIndex(input_dir, self.community_level)
+                index.validate()
+                snapshot = GraphRAGSnapshot(index, self.build_engine(index))
+            except Exception as e:
+                self.last_error = f"{input_dir}: {e}"
+                self.failed_version = version
+                print(f"🔴 [GraphRAG] Không nạp được index mới: {self.last_error}")
+                return False
+
+            with self._lock:
+                old = self._current
+                self._current = snapshot
+                self.input_dir = input_dir
+                self.swaps += 1
+            self.last_error = None
+            self.failed_version = None
+            old_version = old.version if old is not None else None
+            print(f"🟢 [GraphRAG] Đã chuyển index {old_version} -> {snapshot.version}")
+            for callback in self._listeners:
+                callback(old_version, snapshot.version)
+            return True
+
+    def reload_in_background(self, input_dir=None):
+        thread = threading.Thread(target=self.reload, args=(input_dir,), daemon=True)
+        thread.start()
+        return thread
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            snapshot = self._current
+            if snapshot is None:
+                continue
+            version = index_version(self.input_dir)
+            # index lỗi không được thử lại mỗi chu kỳ, chỉ khi snapshot trên đĩa thay đổi tiếp
+            if version != snapshot.version and version != self.failed_version:
+                self.reload()
+
+    def metrics(self):
+        snapshot = self._current
+        return {
+            "version": snapshot.version if snapshot is not None else None,
+            "loaded_at": snapshot.loaded_at if snapshot is not None else None,
+            "swaps": self.swaps,
+            "last_error": self.last_error,
+            "failed_version": self.failed_version,
+            "index": snapshot.index.metrics() if snapshot is not None else None,
+        }
@@ -0,0 +1,79 @@
+import base64
+import os
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+#---config---#
+SCAN_IMAGE_MAX_SIDE = int(os.getenv("SCAN_IMAGE_MAX_SIDE", "1024"))          # cạnh dài tối đa của ảnh gửi VLM
+SCAN_IMAGE_QUALITY = int(os.getenv("SCAN_IMAGE_QUALITY", "82"))
+SCAN_IMAGE_FORMAT = os.getenv("SCAN_IMAGE_FORMAT", "JPEG").upper()            # JPEG hoặc WEBP
+SCAN_MAX_UPLOAD_BYTES = int(os.getenv("SCAN_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+SCAN_MAX_PIXELS = int(os.getenv("SCAN_MAX_PIXELS", str(50_000_000)))          # chặn ảnh "decompression bomb"
+#---config---#
+
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "HEIF", "MPO", "BMP", "GIF", "TIFF"}
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class ImageRejected(ValueError):
+    """Upload không phải ảnh hợp lệ hoặc quá lớn; status_code là mã HTTP nên trả về."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PreparedImage:
+    def __init__(self, data, mime, dhash, size):
+        self.data = data
+        self.mime = mime
+        self.dhash = dhash
+        self.size = size
+
+    @property
+    def b64(self):
+        return base64.b64encode(self.data).decode("utf-8")
+
+
+def check_upload_size(size):
+    if size is not None and size > SCAN_MAX_UPLOAD_BYTES:
+        raise ImageRejected(f"Ảnh quá lớn ({size // 1024} KB), tối đa {SCAN_MAX_UPLOAD_BYTES // 1024} KB", 413)
+
+
+def _dhash(img, hash_size=8):
+    small = np.asarray(img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def preprocess_image(image_bytes, max_side=SCAN_IMAGE_MAX_SIDE, quality=SCAN_IMAGE_QUALITY,
+                     fmt=SCAN_IMAGE_FORMAT):
+    """
+    Decode ảnh upload đúng một lần: xoay theo EXIF, thu nhỏ về max_side, encode lại JPEG/WebP.
+    Trả về PreparedImage (byte đã nén, mime, dHash để cache nhận ra ảnh nén lại).
+    Raise ImageRejected nếu không phải ảnh hoặc quá lớn.
+    """
+    check_upload_size(len(image_bytes))
+    try:
+        img = Image.open(BytesIO(image_bytes))
+        if img.format not in ALLOWED_FORMATS:
+            raise ImageRejected(f"Định dạng ảnh không hỗ trợ: {img.format}", 415)
+        if img.width * img.height > SCAN_MAX_PIXELS:
+            raise ImageRejected("Ảnh có độ phân giải quá lớn", 413)
+        # JPEG: để libjpeg decode thẳng ở độ phân giải gần max_side (nhanh hơn nhiều so với decode full rồi resize)
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ImageRejected(f"File upload không phải ảnh hợp lệ: {e}", 415)
+
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    fmt = fmt if fmt in MIME_TYPES else "JPEG"
+    buf = BytesIO()
+    if fmt == "WEBP":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return PreparedImage(buf.getvalue(), MIME_TYPES[fmt], _dhash(img), img.size)
@@ -0,0 +1,104 @@
+import json
+import os
+
+import numpy as np
+import llm_gateway
+from embedding_service import get_embedder
+
+#---config---#
+INTENT_MODEL = os.getenv("INTENT_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+INTENT_DATA_PATH = os.getenv("INTENT_DATA_PATH", os.path.join(os.path.dirname(__file__), "intent_data", "intent_prompts.jsonl"))
+INTENT_CENTROIDS_PATH = os.getenv("INTENT_CENTROIDS_PATH", os.path.join(os.path.dirname(__file__), "intent_data", "intent_centroids.npz"))
+# chênh lệch cosine tối thiểu giữa nhãn tốt nhất và nhãn thứ hai, dưới mức này thì hỏi LLM
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.05"))
+#---config---#
+
+INTENT_LLM_MODEL = "Qwen/Qwen3-4B-Instruct-2507:nscale"
+INTENT_SYSTEM_PROMPT = """ Bạn là bộ phân loại intent. - Nếu câu hỏi yêu cầu dữ liệu cụ thể từ dataset chứa thông tin thực phẩm và nguyên liệu (ví dụ: calories, protein, allergen, health_tags, thành phần dinh dưỡng, đề xuất món ăn, cho món ăn phù hợp, Gợi ý món ăn, Xin ý tưởng món ăn, cơm sườn có bao nhiêu calo) → Trả về đúng chữ: GraphRAG - Nếu câu hỏi chỉ mang tính hội thoại chung → Trả về đúng chữ: Chatbot - Không được trả lời thêm bất kỳ giải thích nào khác. """
+
+
+async def llm_intent_classification(text):
+    messages = [ { "role": "system", "content": INTENT_SYSTEM_PROMPT },
+     {"role": "user", "content": text} ]
+
+    return await llm_gateway.chat(
+        model=INTENT_LLM_MODEL,
+        messages=messages,
+    )
+
+
+def load_examples(path=INTENT_DATA_PATH):
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            texts.append(row["text"])
+            labels.append(row["label"])
+    return texts, labels
+
+
+def fit_centroids(embeddings, labels):
+    """Centroid đã chuẩn hoá của từng nhãn (nearest-centroid classifier)."""
+    label_names = sorted(set(labels))
+    labels = np.asarray(labels)
+    centroids = np.stack([embeddings[labels == name].mean(axis=0) for name in label_names]).astype(np.float32)
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+    return label_names, centroids
+
+
+class IntentRouter:
+    """
+    Phân loại intent GraphRAG / Chatbot ngay trên máy bằng embedding MiniLM.
+    route() trả về None khi không đủ tự tin, lúc đó gọi LLM như cũ.
+    """
+
+    def __init__(self, model=None, label_names=None, centroids=None, min_margin=INTENT_MIN_MARGIN):
+        self.model = model if model is not None else get_embedder(INTENT_MODEL)
+        self.min_margin = min_margin
+        if centroids is None:
+            label_names, centroids = self._load_or_fit()
+        self.label_names = list(label_names)
+        self.centroids = centroids
+
+    def _load_or_fit(self):
+        if os.path.exists(INTENT_CENTROIDS_PATH):
+            data = np.load(INTENT_CENTROIDS_PATH)
+            if str(data["model"]) == INTENT_MODEL:
+                return [str(x) for x in data["labels"]], data["centroids"]
+        texts, labels = load_examples()
+        embeddings = self.model.encode(texts, normalize_embeddings=True, batch_size=64)
+        return fit_centroids(embeddings, labels)
+
+    def save(self, path=INTENT_CENTROIDS_PATH):
+        np.savez(path, labels=np.asarray(self.label_names), centroids=self.centroids, model=np.asarray(INTENT_MODEL))
+
+    def scores(self, texts):
+        # câu hỏi người dùng chỉ cache trong RAM, không ghi xuống đĩa
+        emb = self.model.encode(texts, normalize_embeddings=True, persist=False)
+        return emb @ self.centroids.T
+
+    def predict(self, text):
+        """Trả về (nhãn, margin) với margin = chênh lệch cosine giữa hai nhãn gần nhất."""
+        sims = self.scores([text])[0]
+        order = np.argsort(sims)[::-1]
+        margin = float(sims[order[0]] - sims[order[1]]) if len(order) > 1 else 1.0
+        return self.label_names[order[0]], margin
+
+    def route(self, text):
+        label, margin = self.predict(text)
+        if margin < self.min_margin:
+            return None
+        return label
+
+
+_router = None
+
+
+def get_router():
+    global _router
+    if _router is None:
+        _router = IntentRouter()
+    return _router
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import random
+from contextlib import aclosing
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#---config---#
+HF_TOKEN = os.getenv("HF_TOKEN")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://router.huggingface.co/v1")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_DEFAULT_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Giới hạn riêng cho từng model, ví dụ: "Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic=4,openai/gpt-oss-20b:groq=8"
+LLM_MODEL_CONCURRENCY = os.getenv("LLM_MODEL_CONCURRENCY", "")
+# Sau bao nhiêu giây chưa có kết quả thì gửi thêm một request dự phòng (0 = tắt hedging)
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "0"))
+#---config---#
+
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def _parse_model_limits(spec):
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        model, limit = item.rsplit("=", 1)
+        limits[model.strip()] = int(limit)
+    return limits
+
+
+class LLMGateway:
+    """
+    Client LLM bất đồng bộ dùng chung cho các service FastAPI.
+    - Một connection pool httpx cho mọi request
+    - Semaphore theo từng model để không vượt rate limit của HF router
+    - Timeout, retry với backoff có jitter và hedging cho các request chậm
+    """
+
+    def __init__(self, api_key=HF_TOKEN, base_url=LLM_BASE_URL, timeout=LLM_TIMEOUT,
+                 max_retries=LLM_MAX_RETRIES, max_connections=LLM_MAX_CONNECTIONS,
+                 default_concurrency=LLM_DEFAULT_CONCURRENCY, model_concurrency=None,
+                 hedge_delay=LLM_HEDGE_DELAY):
+        self.max_retries = max_retries
+        self.default_concurrency = default_concurrency
+        self.model_concurrency = model_concurrency if model_concurrency is not None else _parse_model_limits(LLM_MODEL_CONCURRENCY)
+        self.hedge_delay = hedge_delay
+        self._semaphores = {}
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT),
+        )
+        # tự xử lý retry nên tắt retry mặc định của SDK
+        self._client = AsyncOpenAI(api_key=api_key or "none", base_url=base_url,
+                                   http_client=self._http, max_retries=0, timeout=timeout)
+        self.stats = {"requests": 0, "retries": 0, "hedges": 0, "errors": 0}
+
+    def _semaphore(self, model):
+        sem = self._semaphores.get(model)
+        if sem is None:
+            sem = asyncio.Semaphore(self.model_concurrency.get(model, self.default_concurrency))
+            self._semaphores[model] = sem
+        return sem
+
+    async def chat(self, model, messages, hedge_delay=None, **params):
+        """Gọi chat completion và trả về nội dung text của câu trả lời."""
+        completion = await self.complete(model, messages, hedge_delay=hedge_delay, **params)
+        return completion.choices[0].message.content
+
+    async def complete(self, model, messages, hedge_delay=None, **params):
+        self.stats["requests"] += 1
+        hedge_delay = self.hedge_delay if hedge_delay is None else hedge_delay
+        if hedge_delay <= 0:
+            return await self._complete_with_retry(model, messages, params)
+        return await self._complete_hedged(model, messages, params, hedge_delay)
+
+    async def _complete_hedged(self, model, messages, params, hedge_delay):
+        primary = asyncio.create_task(self._complete_with_retry(model, messages, params))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        self.stats["hedges"] += 1
+        backup = asyncio.create_task(self._complete_with_retry(model, messages, params))
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _complete_with_retry(self, model, messages, params):
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore(model):
+                    return await self._client.chat.completions.create(model=model, messages=messages, **params)
+            except RETRYABLE_ERRORS:
+                if attempt >= self.max_retries:
+                    self.stats["errors"] += 1
+                    raise
+                # full jitter backoff
+                delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+                attempt += 1
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+    async def stream_chat(self, model, messages, **params):
+        """Async generator trả về từng đoạn text ngay khi LLM sinh ra (stream=True)."""
+        self.stats["requests"] += 1
+        attempt = 0
+        started = False
+        while True:
+            try:
+                async with self._semaphore(model):
+                    stream = await self._client.chat.completions.create(
+                        model=model, messages=messages, stream=True, **params)
+                    try:
+                        async for chunk in stream:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                started = True
+                                yield chunk.choices[0].delta.content
+                    finally:
+                        # consumer dừng sớm (client ngắt kết nối): đóng response upstream, trả connection về pool
+                        await stream.close()
+                return
+            except RETRYABLE_ERRORS:
+                # đã gửi token cho client rồi thì không retry được nữa
+                if started or attempt >= self.max_retries:
+                    self.stats["errors"] += 1
+                    raise
+                delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+                attempt += 1
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+_gateway = None
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
+
+
+async def chat(model, messages, **params):
+    return await get_gateway().chat(model, messages, **params)
+
+
+async def stream_chat(model, messages, **params):
+    async with aclosing(get_gateway().stream_chat(model, messages, **params)) as deltas:
+        async for delta in deltas:
+            yield delta
@@ -1,13 +1,17 @@
+import time
+_import_started = time.perf_counter()
+
 import numpy as np
-from openai import OpenAI
 from pinecone import Pinecone, ServerlessSpec
 from huggingface_hub import InferenceClient
 import json
+import hmac
 import re
 import os
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import pandas as pd
 from PIL import Image
@@ -15,6 +19,10 @@ from io import BytesIO
 import numpy as np
 import io
 import requests
+import uuid
+
+from conversation_store import create_store
+from semantic_cache import SemanticCache, profile_key
 
 
 #---api_key---#
@@ -24,104 +32,42 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GOOGLE_API_KEY = os.getenv('GOOGLE_SEARCH_API_KEY')
 GOOGLE_CX = os.getenv('GOOGLE_SEARCH_CX')
 HF_TOKEN = os.getenv("HF_TOKEN")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # header X-Admin-Token cho /admin/*, không đặt thì tắt các endpoint admin
 #---api_key---#
 
 #---model_database_config---#
-client = OpenAI(
-    api_key = HF_TOKEN,
-    base_url="https://router.huggingface.co/v1"
-)
+import llm_gateway
 
-def intent_classification(text):
+from intent_router import get_router, llm_intent_classification
 
-    messages = [ { "role": "system", "content": """ Bạn là bộ phân loại intent. - Nếu câu hỏi yêu cầu dữ liệu cụ thể từ dataset chứa thông tin thực phẩm và nguyên liệu (ví dụ: calories, protein, allergen, health_tags, thành phần dinh dưỡng, đề xuất món ăn, cho món ăn phù hợp, Gợi ý món ăn, Xin ý tưởng món ăn, cơm sườn có bao nhiêu calo) → Trả về đúng chữ: GraphRAG - Nếu câu hỏi chỉ mang tính hội thoại chung → Trả về đúng chữ: Chatbot - Không được trả lời thêm bất kỳ giải thích nào khác. """ }, 
-     {"role": "user", "content": text} ]
-
-    completion = client.chat.completions.create(
-        model="Qwen/Qwen3-4B-Instruct-2507:nscale",
-        messages=messages,
-    )
+intent_router = get_router()
 
-    return(completion.choices[0].message.content)
+async def intent_classification(text):
+    # phân loại bằng embedding trước, chỉ hỏi Qwen khi router không đủ tự tin
+    # encode chạy trong thread để các request đồng thời được gom chung micro-batch
+    intent = await asyncio.to_thread(intent_router.route, text)
+    if intent is not None:
+        return intent
+    return await llm_intent_classification(text)
 
 import os
 from dotenv import load_dotenv
 import pandas as pd
 
-from graphrag.config.models.vector_store_schema_config import VectorStoreSchemaConfig
 from graphrag.query.context_builder.entity_extraction import EntityVectorStoreKey
-from graphrag.query.indexer_adapters import (
-    read_indexer_covariates,
-    read_indexer_entities,
-    read_indexer_relationships,
-    read_indexer_reports,
-    read_indexer_text_units,
-)
-from graphrag.query.question_gen.local_gen import LocalQuestionGen
 from graphrag.query.structured_search.local_search.mixed_context import (
     LocalSearchMixedContext,
 )
 from graphrag.query.structured_search.local_search.search import LocalSearch
-from graphrag.vector_stores.lancedb import LanceDBVectorStore
 
-load_dotenv()
+from graphrag_index import GRAPHRAG_INDEX_DIR, SnapshotManager
 
-INPUT_DIR = "E:\MyProjectLibrary\Diet Tracking\diet_tracking_project\chat_box\graphrag\output"
-LANCEDB_URI = f"{INPUT_DIR}/lancedb"
+load_dotenv()
 
-COMMUNITY_REPORT_TABLE = "community_reports"
-ENTITY_TABLE = "entities"
-COMMUNITY_TABLE = "communities"
-RELATIONSHIP_TABLE = "relationships"
-# COVARIATE_TABLE = "covariates"
-TEXT_UNIT_TABLE = "text_units"
+# đặt GRAPHRAG_INDEX_DIR trong .env để trỏ tới thư mục output khác
+INPUT_DIR = GRAPHRAG_INDEX_DIR
 COMMUNITY_LEVEL = 2
 
-# read nodes table to get community and degree data
-entity_df = pd.read_parquet(f"{INPUT_DIR}/{ENTITY_TABLE}.parquet")
-community_df = pd.read_parquet(f"{INPUT_DIR}/{COMMUNITY_TABLE}.parquet")
-
-entities = read_indexer_entities(entity_df, community_df, COMMUNITY_LEVEL)
-
-# load description embeddings to an in-memory lancedb vectorstore
-# to connect to a remote db, specify url and port values.
-description_embedding_store = LanceDBVectorStore(
-    vector_store_schema_config=VectorStoreSchemaConfig(
-        index_name="default-entity-description"
-    )
-)
-description_embedding_store.connect(db_uri=LANCEDB_URI)
-
-print(f"Entity count: {len(entity_df)}")
-entity_df.head()
-
-relationship_df = pd.read_parquet(f"{INPUT_DIR}/{RELATIONSHIP_TABLE}.parquet")
-relationships = read_indexer_relationships(relationship_df)
-
-print(f"Relationship count: {len(relationship_df)}")
-relationship_df.head()
-
-# NOTE: covariates are turned off by default, because they generally need prompt tuning to be valuable
-# Please see the GRAPHRAG_CLAIM_* settings
-# covariate_df = pd.read_parquet(f"{INPUT_DIR}/{COVARIATE_TABLE}.parquet")
-
-# claims = read_indexer_covariates(covariate_df)
-
-# print(f"Claim records: {len(claims)}")
-# covariates = {"claims": claims}
-
-report_df = pd.read_parquet(f"{INPUT_DIR}/{COMMUNITY_REPORT_TABLE}.parquet")
-reports = read_indexer_reports(report_df, community_df, COMMUNITY_LEVEL)
-
-print(f"Report records: {len(report_df)}")
-report_df.head()
-
-text_unit_df = pd.read_parquet(f"{INPUT_DIR}/{TEXT_UNIT_TABLE}.parquet")
-text_units = read_indexer_text_units(text_unit_df)
-
-print(f"Text unit records: {len(text_unit_df)}")
-text_unit_df.head()
-
 from graphrag.config.enums import ModelType
 from graphrag.config.models.language_model_config import LanguageModelConfig
 from graphrag.language_model.manager import ModelManager
@@ -166,19 +112,6 @@ text_embedder = ModelManager().get_or_create_embedding_model(
 
 tokenizer = get_tokenizer(chat_config)
 
-context_builder = LocalSearchMixedContext(
-    community_reports=reports,
-    text_units=text_units,
-    entities=entities,
-    relationships=relationships,
-    # if you did not run covariates during indexing, set this to None
-    covariates=None,
-    entity_text_embeddings=description_embedding_store,
-    embedding_vectorstore_key=EntityVectorStoreKey.ID,  # if the vectorstore uses entity title as ids, set this to EntityVectorStoreKey.TITLE
-    text_embedder=text_embedder,
-    tokenizer=tokenizer,
-)
-
 # text_unit_prop: proportion of context window dedicated to related text units
 # community_prop: proportion of context window dedicated to community reports.
 # The remaining proportion is dedicated to entities and relationships. Sum of text_unit_prop and community_prop should be <= 1
@@ -215,14 +148,33 @@ model_params = {
     "temperature": 0.3,
 }
 
-search_engine = LocalSearch(
-    model=chat_model,
-    context_builder=context_builder,
-    tokenizer=tokenizer,
-    model_params=model_params,
-    context_builder_params=local_context_params,
-    response_type="multiple paragraphs",  # free form text describing the response type and format, can be anything, e.g. prioritized list, single paragraph, multiple paragraphs, multiple-page report
-)
+def build_search_engine(index):
+    """Tạo LocalSearch từ một GraphRAGIndex (gọi ở truy vấn đầu tiên hoặc khi nạp index mới)."""
+    context_builder = LocalSearchMixedContext(
+        community_reports=index.reports,
+        text_units=index.text_units,
+        entities=index.entities,
+        relationships=index.relationships,
+        # if you did not run covariates during indexing, set this to None
+        # NOTE: covariates are turned off by default, because they generally need prompt tuning to be valuable
+        covariates=None,
+        entity_text_embeddings=index.description_embedding_store,
+        embedding_vectorstore_key=EntityVectorStoreKey.ID,  # if the vectorstore uses entity title as ids, set this to EntityVectorStoreKey.TITLE
+        text_embedder=text_embedder,
+        tokenizer=tokenizer,
+    )
+    return LocalSearch(
+        model=chat_model,
+        context_builder=context_builder,
+        tokenizer=tokenizer,
+        model_params=model_params,
+        context_builder_params=local_context_params,
+        response_type="multiple paragraphs",  # free form text describing the response type and format, can be anything, e.g. prioritized list, single paragraph, multiple paragraphs, multiple-page report
+    )
+
+# Các bảng parquet chỉ được đọc khi có truy vấn GraphRAG đầu tiên,
+# index mới được nạp nền rồi đổi snapshot nên không cần restart server
+snapshot_manager = SnapshotManager(build_search_engine, INPUT_DIR, COMMUNITY_LEVEL)
 
 # print("Entities:", len(entities))
 # print("Reports:", len(reports))
@@ -245,11 +197,14 @@ def build_user_profile(age, height, weight, allergy, goal, goal_weight, gender):
     return user_profile
 
 import asyncio
+from contextlib import aclosing
 
 async def local_search(prompt, goal, allery):
     user_profile = f"mình dị ứng với: {allery}, mục tiêu: {goal}"
     # result = await search_engine.search(prompt + f"cho 10 món ăn phù hợp với query của người dùng và cho thông tin dinh dưỡng về calories, carb, fat và protein đầy đủ + {json_type}, không cần phải giải thích gì thêm")
-    result = await search_engine.search(user_profile + prompt + "nếu bạn không có thông tin, có thể sử dụng kiến thức nền của bạn, ***chỉ cần trả về thông tin và không cần giải thích thêm***")
+    # lần đầu phải đọc index nên chạy trong thread để không chặn event loop
+    snapshot = await asyncio.to_thread(snapshot_manager.current)
+    result = await snapshot.search_engine.search(user_profile + prompt + "nếu bạn không có thông tin, có thể sử dụng kiến thức nền của bạn, ***chỉ cần trả về thông tin và không cần giải thích thêm***")
     # json_blocks = re.findall(r'\{.*?\}', result.response, re.DOTALL)
     # foods = [json.loads(block) for block in json_blocks] 
     # return foods
@@ -258,7 +213,9 @@ async def local_search(prompt, goal, allery):
 # asyncio.run(local_search())
 
 
-def chat_bot(prompt, conversation_history, age, height, weight, allergy, goal, goal_weight, gender):
+CHAT_MODEL = "Qwen/Qwen3-4B-Instruct-2507:nscale"
+
+def chat_bot_messages(prompt, conversation_history, age, height, weight, allergy, goal, goal_weight, gender):
     # Define the system message
     system_message = {"role": "system", "content":f"""
         -Bạn là trợ lí dinh dưỡng ảo tiếng việt và trả lời nhẹ nhàng, có thể thêm emoji, trả lời mọi câu hỏi liên quan đến ăn uống, dinh dưỡng, sức khỏe, thói quen ăn uống, dị ứng. Nếu người dùng hỏi những câu hỏi không liên quan đến lĩnh vực của bạn thì nhớ nhắc người dùng là bạn chuyên về dinh dưỡng và sức khỏe là chính. Câu trả lời không được hơn 2000 kí tự
@@ -277,19 +234,20 @@ def chat_bot(prompt, conversation_history, age, height, weight, allergy, goal, g
 
     messages.append(system_message)
     messages.append({"role": "user", "content": prompt})
+    return messages
 
-    completion = client.chat.completions.create(
-        model="Qwen/Qwen3-4B-Instruct-2507:nscale",
+async def chat_bot(prompt, conversation_history, age, height, weight, allergy, goal, goal_weight, gender):
+    messages = chat_bot_messages(prompt, conversation_history, age, height, weight, allergy, goal, goal_weight, gender)
+    bot_response = await llm_gateway.chat(
+        model=CHAT_MODEL,
         messages=messages,
     )
 
-    bot_response = completion.choices[0].message.content
-
     messages.append({"role": "assistant", "content": bot_response})
 
     return bot_response, messages
 
-def more_bot(prompt, conversation_history, allergy, goal, food):
+def more_bot_messages(prompt, conversation_history, allergy, goal, food):
     system_message = {"role": "system", "content":f"""
         -Bạn là trợ lí dinh dưỡng ảo tiếng việt.
         Dưới đây là thông tin của người dùng để bạn hiểu rõ về người dùng hơn:
@@ -316,13 +274,15 @@ def more_bot(prompt, conversation_history, allergy, goal, food):
 
     messages.append(system_message)
     messages.append({"role": "user", "content": prompt})
-    completion = client.chat.completions.create(
-        model="Qwen/Qwen3-4B-Instruct-2507:nscale",
+    return messages
+
+async def more_bot(prompt, conversation_history, allergy, goal, food):
+    messages = more_bot_messages(prompt, conversation_history, allergy, goal, food)
+    bot_response = await llm_gateway.chat(
+        model=CHAT_MODEL,
         messages=messages,
     )
 
-    bot_response = completion.choices[0].message.content
-
     # Add the bot's response to the history
     messages.append({"role": "assistant", "content": bot_response})
 
@@ -353,6 +313,7 @@ class ChatRequest(BaseModel):
     nutrition_plan: dict | None = None
     food_records: list[dict] | None = None
     food_scan: dict | None = None
+    session_id: str | None = None
 
 # def google_search(query: str, num_results: int = 3):
 #     print("đang sử dụng google")
@@ -368,22 +329,140 @@ class ChatRequest(BaseModel):
 #         })
 #     return results
 
-chat_history = []
+conversation_store = create_store()
+
+# cache câu trả lời GraphRAG theo ngữ nghĩa, dùng chung model MiniLM với intent router
+# version của cache được gán khi snapshot thật sự được tạo (lần gọi current() đầu tiên hoặc reload),
+# không đọc từ đĩa lúc import: file index có thể đổi trước khi snapshot đầu tiên được nạp
+semantic_cache = SemanticCache(lambda texts: intent_router.model.encode(texts, persist=False))
+snapshot_manager.on_swap(lambda old_version, new_version: semantic_cache.invalidate(new_version))
+
+startup_s = round(time.perf_counter() - _import_started, 3)
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "startup_s": startup_s,
+        "graphrag": snapshot_manager.metrics(),
+        "semantic_cache": semantic_cache.metrics(),
+        "embeddings": intent_router.model.metrics(),
+    }
+
+def require_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Endpoint admin bị tắt (chưa đặt ADMIN_TOKEN)")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Sai admin token")
+
+@app.post("/admin/reload_index")
+async def reload_index(x_admin_token: str | None = Header(None)):
+    require_admin(x_admin_token)
+    # luôn nạp lại đúng GRAPHRAG_INDEX_DIR đã cấu hình, không nhận đường dẫn từ client
+    # nạp + validate ở thread nền, snapshot cũ vẫn phục vụ cho tới khi đổi xong
+    path = snapshot_manager.input_dir
+    if not os.path.isdir(path):
+        return {"status": "error", "reason": f"Không tìm thấy thư mục {path}"}
+    snapshot_manager.reload_in_background()
+    return {"status": "reloading", "current_version": snapshot_manager.version}
+
 @app.post("/chat")
 async def chatbox(request: ChatRequest):
     print(f"Received request with gender: {request.gender}")
-    global chat_history
-    
-    intent = intent_classification(request.prompt)
+    # mỗi người dùng có lịch sử riêng, client gửi lại session_id nhận được ở lần trước
+    session_id = request.session_id or uuid.uuid4().hex
+    history = conversation_store.history(session_id)
+
+    intent = await intent_classification(request.prompt)
     if(intent.lower() == "chatbot"):
-        response, chat_history = chat_bot(request.prompt, chat_history, request.age, request.height, request.weight, request.allergy, request.goal, request.goal_weight, request.gender)
-        return{"reply": response}
+        response, _ = await chat_bot(request.prompt, history, request.age, request.height, request.weight, request.allergy, request.goal, request.goal_weight, request.gender)
     else:
         print(intent)
-        # def more_bot(prompt, conversation_history, allergy, goal, food):
-        food = await local_search(request.prompt, request.goal, request.allergy)
-        response, chat_history = more_bot(request.prompt, chat_history, request.allergy, request.goal, food)
-        return{"reply": response}
-        
+        profile = profile_key(request.goal, request.allergy)
+        # version index lúc bắt đầu: nếu index đổi giữa chừng, câu trả lời không được ghi vào cache
+        index_version = snapshot_manager.version
+        prompt_emb = await asyncio.to_thread(semantic_cache.embed, request.prompt)
+        response = semantic_cache.get(prompt_emb, profile, index_version)
+        if response is None:
+            started = time.perf_counter()
+            # async def more_bot(prompt, conversation_history, allergy, goal, food):
+            food = await local_search(request.prompt, request.goal, request.allergy)
+            response, _ = await more_bot(request.prompt, history, request.allergy, request.goal, food)
+            semantic_cache.put(prompt_emb, profile, response, cost_s=time.perf_counter() - started,
+                               version=index_version)
+
+    conversation_store.append(session_id, request.prompt, response)
+    return{"reply": response, "session_id": session_id}
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chatbox_stream(request: ChatRequest):
+    """
+    Giống /chat nhưng trả về Server-Sent Events:
+      event: start  -> {"session_id"}
+      event: token  -> {"text"} (lặp lại cho từng đoạn LLM sinh ra)
+      event: done   -> {"session_id", "intent", "cached", "elapsed_s"}
+      event: error  -> {"error"}
+    """
+    started = time.perf_counter()
+    session_id = request.session_id or uuid.uuid4().hex
+    history = conversation_store.history(session_id)
+    intent = await intent_classification(request.prompt)
+    is_chatbot = intent.lower() == "chatbot"
+
+    cached = None
+    if not is_chatbot:
+        profile = profile_key(request.goal, request.allergy)
+        index_version = snapshot_manager.version
+        prompt_emb = await asyncio.to_thread(semantic_cache.embed, request.prompt)
+        cached = semantic_cache.get(prompt_emb, profile, index_version)
+
+    async def events():
+        # task GraphRAG được tạo trong generator: client ngắt trước khi stream bắt đầu thì không có task nào bị bỏ lại
+        search_task = None
+        if not is_chatbot and cached is None:
+            # bắt đầu dựng context GraphRAG ngay, chạy song song với lúc gửi event start
+            search_task = asyncio.create_task(local_search(request.prompt, request.goal, request.allergy))
+        try:
+            yield sse_event("start", {"session_id": session_id})
+            if cached is not None:
+                response = cached
+                yield sse_event("token", {"text": cached})
+            else:
+                if is_chatbot:
+                    messages = chat_bot_messages(request.prompt, history, request.age, request.height, request.weight, request.allergy, request.goal, request.goal_weight, request.gender)
+                else:
+                    food = await search_task
+                    messages = more_bot_messages(request.prompt, history, request.allergy, request.goal, food)
+                parts = []
+                async with aclosing(llm_gateway.stream_chat(model=CHAT_MODEL, messages=messages)) as deltas:
+                    async for delta in deltas:
+                        parts.append(delta)
+                        yield sse_event("token", {"text": delta})
+                response = "".join(parts)
+                if not is_chatbot:
+                    semantic_cache.put(prompt_emb, profile, response, cost_s=time.perf_counter() - started,
+                                       version=index_version)
+        except Exception as e:
+            print(f"🔴 [ERROR] /chat/stream: {e}")
+            yield sse_event("error", {"error": str(e)})
+            return
+        finally:
+            # client ngắt kết nối giữa chừng thì huỷ luôn truy vấn GraphRAG
+            if search_task is not None and not search_task.done():
+                search_task.cancel()
+
+        conversation_store.append(session_id, request.prompt, response)
+        yield sse_event("done", {
+            "session_id": session_id,
+            "intent": intent,
+            "cached": cached is not None,
+            "elapsed_s": round(time.perf_counter() - started, 3),
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
     print(extract_tags("món ăn giảm cân giành con người bị dị ứng cá"))
\ No newline at end of file
@@ -0,0 +1,79 @@
+import concurrent.futures
+import queue
+import threading
+import time
+
+
+class MicroBatcher:
+    """
+    Gom các lời gọi lẻ thành batch cho hàm xử lý theo lô (vd. model.encode).
+    submit(item) trả về concurrent.futures.Future, dùng được từ thread thường (.result())
+    lẫn từ asyncio (await asyncio.wrap_future(...)).
+    Worker thread lấy item đầu tiên, chờ thêm tối đa max_wait_ms hoặc tới khi đủ max_batch item,
+    gọi fn(list item) một lần rồi trả kết quả về đúng future của từng người gọi.
+    """
+
+    def __init__(self, fn, max_batch=32, max_wait_ms=5.0, name="micro-batcher"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"batches": 0, "items": 0}
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def submit(self, item):
+        self._ensure_worker()
+        future = concurrent.futures.Future()
+        self._queue.put((item, future))
+        return future
+
+    def map(self, items):
+        """Gửi nhiều item rồi chờ hết, trả về kết quả theo đúng thứ tự."""
+        futures = [self.submit(item) for item in items]
+        return [f.result() for f in futures]
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # bỏ các lời gọi đã bị huỷ trong lúc chờ
+            batch = [(item, f) for item, f in self._collect() if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.fn([item for item, _ in batch])
+            except Exception as e:
+                for _, f in batch:
+                    f.set_exception(e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            for (_, f), result in zip(batch, results):
+                f.set_result(result)
+
+    def metrics(self):
+        batches = self.stats["batches"]
+        return {
+            "batches": batches,
+            "items": self.stats["items"],
+            "avg_batch": round(self.stats["items"] / batches, 2) if batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
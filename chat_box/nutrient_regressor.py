@@ -2,52 +2,88 @@ import os
 import unicodedata
 import re
 import base64
-from sentence_transformers import SentenceTransformer
 from PIL import Image
 from io import BytesIO
-import numpy as np
 import base64
 from pinecone import Pinecone
-from fastapi import FastAPI, UploadFile, File, Form, Body
+from fastapi import FastAPI, UploadFile, File, Form, Body, HTTPException
+from pydantic import BaseModel
 from dotenv import load_dotenv
 import os
 from huggingface_hub import InferenceClient
-from openai import OpenAI
 
 import logging
 from logging.handlers import RotatingFileHandler
 import json
 from datetime import datetime
 
+import asyncio
+
+import llm_gateway
+from image_preprocess import SCAN_MAX_UPLOAD_BYTES, ImageRejected, check_upload_size, preprocess_image
+from dish_index import DishIndex
+from embedding_service import get_embedder
+from nutrition_engine import NutritionEngine
+from scan_cache import ScanCache, image_digest
+
 load_dotenv()
 app = FastAPI()
 
 ##api-key##
 HF_TOKEN = os.getenv("HF_TOKEN")
+# chỉ kết luận dị ứng bằng bảng local khi tên món khớp DISH_DB chắc chắn (cosine >= ngưỡng này), còn lại hỏi LLM
+ALLERGY_LOCAL_MIN_SCORE = float(os.getenv("ALLERGY_LOCAL_MIN_SCORE", "0.75"))
 
 ##data#
 INGREDIENT_DB = {
-    "rice_noodles": {"unit": "100g", "calories": (105, 130)},
-    "egg_noodles": {"unit": "100g", "calories": (130, 160)},
-    "beef": {"unit": "100g", "calories": (220, 280)},
-    "chicken": {"unit": "100g", "calories": (165, 210)},
-    "pork": {"unit": "100g", "calories": (240, 300)},
-    "fish": {"unit": "100g", "calories": (120, 160)},
-    "shrimp": {"unit": "100g", "calories": (90, 120)},
-    "tofu": {"unit": "100g", "calories": (70, 90)},
-    "broth": {"unit": "100ml", "calories": (10, 30)},
-    "vegetables": {"unit": "100g", "calories": (20, 40)},
-    "oil": {"unit": "10ml", "calories": (80, 90)},
-    "sauce": {"unit": "30g", "calories": (50, 80)},
-    "rice": {"unit": "100g", "calories": (130, 150)},
-    "soy_sauce": {"unit": "10ml", "calories": (8, 12)},
-    "pepper": {"unit": "5g", "calories": (10, 15)},
-    "mushroom": {"unit": "100g", "calories": (25, 35)},
-    "tofu_skin": {"unit": "100g", "calories": (50, 70)},
-    "garlic": {"unit": "10g", "calories": (15, 20)}  # mới thêm
+    # calories / protein / carbs / fat: (min, max) theo đơn vị "unit"
+    "rice_noodles": {"unit": "100g", "calories": (105, 130), "protein": (1.5, 3.5), "carbs": (24, 30), "fat": (0.2, 0.6)},
+    "egg_noodles": {"unit": "100g", "calories": (130, 160), "protein": (4.5, 6), "carbs": (25, 30), "fat": (1.5, 3)},
+    "beef": {"unit": "100g", "calories": (220, 280), "protein": (25, 28), "carbs": (0, 0), "fat": (15, 20)},
+    "chicken": {"unit": "100g", "calories": (165, 210), "protein": (25, 31), "carbs": (0, 0), "fat": (4, 10)},
+    "pork": {"unit": "100g", "calories": (240, 300), "protein": (24, 27), "carbs": (0, 0), "fat": (17, 24)},
+    "fish": {"unit": "100g", "calories": (120, 160), "protein": (20, 25), "carbs": (0, 0), "fat": (2, 6)},
+    "shrimp": {"unit": "100g", "calories": (90, 120), "protein": (20, 24), "carbs": (0, 1), "fat": (0.5, 1.5)},
+    "tofu": {"unit": "100g", "calories": (70, 90), "protein": (7, 9), "carbs": (1.5, 3), "fat": (4, 5)},
+    "broth": {"unit": "100ml", "calories": (10, 30), "protein": (1, 3), "carbs": (0, 1.5), "fat": (0.3, 1.5)},
+    "vegetables": {"unit": "100g", "calories": (20, 40), "protein": (1, 2.5), "carbs": (3, 7), "fat": (0.1, 0.4)},
+    "oil": {"unit": "10ml", "calories": (80, 90), "protein": (0, 0), "carbs": (0, 0), "fat": (9, 10)},
+    "sauce": {"unit": "30g", "calories": (50, 80), "protein": (0.5, 2), "carbs": (8, 15), "fat": (0.5, 3)},
+    "rice": {"unit": "100g", "calories": (130, 150), "protein": (2.5, 3), "carbs": (28, 33), "fat": (0.2, 0.4)},
+    "soy_sauce": {"unit": "10ml", "calories": (8, 12), "protein": (0.8, 1), "carbs": (0.5, 1), "fat": (0, 0.1)},
+    "pepper": {"unit": "5g", "calories": (10, 15), "protein": (0.4, 0.6), "carbs": (2.5, 3.3), "fat": (0.1, 0.2)},
+    "mushroom": {"unit": "100g", "calories": (25, 35), "protein": (2.5, 3.5), "carbs": (3, 5), "fat": (0.2, 0.5)},
+    "tofu_skin": {"unit": "100g", "calories": (50, 70), "protein": (6, 9), "carbs": (1, 3), "fat": (2, 4)},
+    "garlic": {"unit": "10g", "calories": (15, 20), "protein": (0.6, 0.7), "carbs": (3, 3.5), "fat": (0, 0.1)}  # mới thêm
 }
 
 
+# chất gây dị ứng có trong từng nguyên liệu (từ khoá tiếng Việt + tiếng Anh, so sánh sau normalize_text)
+# "sauce" được tính bảo thủ vì nước chấm thường có mắm / tương / đậu phộng
+INGREDIENT_ALLERGENS = {
+    "rice_noodles": ["gạo", "rice"],
+    "egg_noodles": ["trứng", "egg", "gluten", "lúa mì", "wheat"],
+    "beef": ["thịt bò", "bò", "beef", "thịt đỏ", "red meat"],
+    "chicken": ["thịt gà", "gà", "chicken", "gia cầm", "poultry"],
+    "pork": ["thịt lợn", "thịt heo", "lợn", "heo", "pork", "thịt đỏ", "red meat"],
+    "fish": ["cá", "fish", "hải sản", "seafood"],
+    "shrimp": ["tôm", "shrimp", "hải sản", "seafood", "giáp xác", "shellfish", "crustacean"],
+    "tofu": ["đậu nành", "đậu phụ", "soy", "soybean", "tofu"],
+    "broth": [],
+    "vegetables": [],
+    "oil": [],
+    "sauce": ["nước mắm", "cá", "fish", "đậu nành", "soy", "đậu phộng", "lạc", "peanut", "gluten"],
+    "rice": ["gạo", "rice"],
+    "soy_sauce": ["nước tương", "xì dầu", "đậu nành", "soy", "gluten", "lúa mì", "wheat"],
+    "pepper": ["tiêu", "hạt tiêu", "pepper"],
+    "mushroom": ["nấm", "mushroom"],
+    "tofu_skin": ["váng đậu", "đậu nành", "soy", "soybean"],
+    "garlic": ["tỏi", "garlic"],
+}
+
+# các từ không mang nghĩa dị ứng cụ thể ("không có", "none", ...) -> coi như không có dị ứng
+NO_ALLERGY_TERMS = {"khong", "khong co", "none", "no", "nothing", "khong di ung"}
+
 
 DISH_DB = {
     "beef_bo": {  # phở bò
@@ -219,20 +255,14 @@ DISH_DB = {
 
 
 
-embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
-dish_keys = list(DISH_DB.keys())
-dish_texts = [k.replace("_", " ") for k in dish_keys]
-
-dish_embeddings = embedder.encode(dish_texts, normalize_embeddings=True)
+DISH_EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+embedder = get_embedder(DISH_EMBED_MODEL)
 
-client = OpenAI(
-    base_url="https://router.huggingface.co/v1",
-    api_key=HF_TOKEN,
-)
+# cache kết quả nhận diện ảnh + kết luận dị ứng, chụp lại / client retry trả về ngay
+scan_cache = ScanCache()
 
-def good_or_bad(allergy, food_name):
-    response = client.chat.completions.create(
+async def good_or_bad(allergy, food_name):
+    return await llm_gateway.chat(
         model="Qwen/Qwen3-4B-Instruct-2507:nscale",
         messages = [
             {
@@ -252,10 +282,8 @@ def good_or_bad(allergy, food_name):
         ]
     )
 
-    return response.choices[0].message.content
-
-def food_classification(img_64):
-    response = client.chat.completions.create(
+async def food_classification(img_64, mime="image/jpeg"):
+    content = await llm_gateway.chat(
         model="Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic",
         messages=[
             {
@@ -282,7 +310,7 @@ def food_classification(img_64):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{img_64}"
+                            "url": f"data:{mime};base64,{img_64}"
                         }
 }
                 ]
@@ -292,15 +320,102 @@ def food_classification(img_64):
     )
 
     import json
-    result = json.loads(response.choices[0].message.content.strip("```json").strip("```"))
+    result = json.loads(content.strip("```json").strip("```"))
     return result
 
 def normalize_text(text):
     text = unicodedata.normalize("NFKD", text)
     text = "".join(c for c in text if not unicodedata.combining(c))
-    text = text.lower()
+    text = text.lower().replace("đ", "d")
     text = re.sub(r"[^a-z0-9\s]", " ", text)
-    return text.strip()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def fold_text(text):
+    """Chữ thường, bỏ dấu câu nhưng giữ dấu tiếng Việt."""
+    text = unicodedata.normalize("NFC", text.lower())
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]|_", " ", text)).strip()
+
+
+def allergy_key(term):
+    """
+    Từ khoá dị ứng để so sánh: cụm nhiều âm tiết bỏ dấu ("đậu nành" -> "dau nanh"),
+    còn một âm tiết thì giữ dấu vì bỏ dấu sẽ trùng nhau ("cá" / "cà" đều thành "ca").
+    """
+    stripped = normalize_text(term)
+    return stripped if " " in stripped else fold_text(term)
+
+
+def allergy_terms(allergy):
+    """Tách chuỗi dị ứng người dùng nhập ("tôm, đậu phộng và sữa") thành các từ khoá đã chuẩn hoá (allergy_key)."""
+    if not allergy:
+        return []
+    parts = re.split(r",|;|/|\n|\bvà\b|\band\b", allergy.lower())
+    return [allergy_key(part) for part in parts if normalize_text(part) and normalize_text(part) not in NO_ALLERGY_TERMS]
+
+
+def allergy_mentioned(terms, *texts):
+    """Có từ khoá dị ứng nào xuất hiện trong tên món / nguyên liệu VLM trả về không."""
+    stripped = " ".join(normalize_text(t) for t in texts if t)
+    accented = " ".join(fold_text(t) for t in texts if t)
+    for term in terms:
+        haystack = stripped if " " in term else accented
+        if re.search(rf"(?<!\w){re.escape(term)}(?!\w)", haystack):
+            return True
+    return False
+
+
+def build_allergen_table(dish_db, ingredient_allergens):
+    """dish_key -> tập từ khoá chất gây dị ứng, gộp từ nguyên liệu chính + optional của món."""
+    table = {}
+    for key, dish in dish_db.items():
+        found = set()
+        for ing in list(dish["ingredients"]) + dish.get("optional", []):
+            found.update(allergy_key(term) for term in ingredient_allergens.get(ing, []))
+        table[key] = found
+    return table
+
+
+DISH_ALLERGENS = build_allergen_table(DISH_DB, INGREDIENT_ALLERGENS)
+
+
+def dish_aliases(dish_db):
+    """[(dish_key, [alias đã chuẩn hoá])]: tên key + mọi alias tiếng Việt / tiếng Anh của món."""
+    return [(key, [normalize_text(key.replace("_", " "))] + [normalize_text(a) for a in dish.get("alias", [])])
+            for key, dish in dish_db.items()]
+
+
+def _encode_dishes(texts):
+    return embedder.encode(texts, normalize_embeddings=True, batch_size=64)
+
+
+# embedding alias được lưu xuống DISH_INDEX_PATH, lần khởi động sau không phải encode lại
+dish_index = DishIndex.load_or_build(dish_aliases(DISH_DB), _encode_dishes, DISH_EMBED_MODEL)
+
+
+def local_allergy_verdict(terms, dish_key):
+    """
+    "không" nếu nguyên liệu của món trong DISH_DB chắc chắn chứa chất gây dị ứng, ngược lại None -> hỏi LLM.
+    Không bao giờ trả lời "có" (an toàn): nguyên liệu trong DISH_DB chỉ là danh sách chung, thiếu chất dị ứng
+    không có nghĩa là món không chứa (vd. bánh mì vẫn có lúa mì, trứng).
+    """
+    if dish_key is None:
+        return None
+    return "không" if any(term in DISH_ALLERGENS[dish_key] for term in terms) else None
+
+
+def match_dish(dish_name):
+    """(dish_key hoặc None nếu dưới DISH_MATCH_MIN_SCORE, cosine)."""
+    query_emb = embedder.encode([normalize_text(dish_name)], normalize_embeddings=True, persist=False)
+    return dish_index.match(query_emb[0])
+
+
+async def llm_allergy_verdict(allergy, dish_name):
+    flag = scan_cache.get_allergy(dish_name, allergy)
+    if flag is None:
+        flag = await good_or_bad(allergy, dish_name)
+        scan_cache.put_allergy(dish_name, allergy, flag)
+    return flag
 
 
 def synthesize_dish(dish_name, dish_db, ingredient_db, ratio=0.25):
@@ -326,45 +441,98 @@ def synthesize_dish(dish_name, dish_db, ingredient_db, ratio=0.25):
     return int(new_min), int(new_max)
 
 
+# khoảng dinh dưỡng của mọi món được tính sẵn một lần bằng phép nhân ma trận
+nutrition_engine = NutritionEngine(DISH_DB, INGREDIENT_DB)
+
+
+class NutritionBatchRequest(BaseModel):
+    dishes: list[str]
+    portions: list[float] | None = None
+
+
+@app.post("/nutrition/batch")
+async def nutrition_batch(req: NutritionBatchRequest):
+    """Khoảng dinh dưỡng từng món + tổng của cả thực đơn / nhật ký ăn trong một lần gọi."""
+    if req.portions is not None and len(req.portions) != len(req.dishes):
+        raise HTTPException(status_code=400, detail="portions phải có cùng số phần tử với dishes")
+    ranges = nutrition_engine.batch(req.dishes, req.portions)
+    return {
+        "dishes": [{"dish": key, "nutrition_range": NutritionEngine.to_dict(r)} for key, r in zip(req.dishes, ranges)],
+        "total": nutrition_engine.totals(req.dishes, req.portions),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    return {"scan_cache": scan_cache.metrics(), "embeddings": embedder.metrics()}
+
+
 @app.post("/scan_food")
 async def scan_food(file: UploadFile = File(...),
                     allergy: str | None = Form(None),):
-    image_bytes = await file.read()
-    img_base64 = base64.b64encode(image_bytes).decode('utf-8')
-
-    vlm_output = food_classification(img_base64)
-    flag = good_or_bad(allergy, vlm_output["dish"])
-
-    if(vlm_output["dish"].lower() == "uncertain"):
+    try:
+        # từ chối sớm theo Content-Length / kích thước thật, không đọc hết file quá lớn vào RAM
+        check_upload_size(file.size)
+        image_bytes = await file.read(SCAN_MAX_UPLOAD_BYTES + 1)
+        check_upload_size(len(image_bytes))
+
+        digest = image_digest(image_bytes)
+        vlm_output = scan_cache.get_image(digest)
+        if vlm_output is None:
+            # decode một lần: xoay EXIF, thu nhỏ, nén lại -> ít byte gửi lên VLM hơn nhiều so với ảnh gốc
+            image = await asyncio.to_thread(preprocess_image, image_bytes)
+            vlm_output = scan_cache.get_similar(image.dhash)
+            if vlm_output is None:
+                vlm_output = await food_classification(image.b64, image.mime)
+            scan_cache.store_image(digest, image.dhash, vlm_output)
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    dish_name = vlm_output.get("dish") or "uncertain"
+    if dish_name.lower() == "uncertain":
         return {"reply": "Bức ảnh đồ ăn chưa nằm chính giữa khung hình."}
-    else:
-        normalize_text(vlm_output["dish"])
-        query = normalize_text(vlm_output["dish"])
-        query_emb = embedder.encode([query], normalize_embeddings=True)
-        sims = dish_embeddings @ query_emb[0]
-
-        best_idx = int(np.argmax(sims))
-        best_score = float(sims[best_idx])
 
-        if best_score < 0.2:
-            matched_dish = None
-        else:
-            matched_dish = dish_keys[best_idx]
-
-        dish = matched_dish
-        cal_range = synthesize_dish(dish, DISH_DB, INGREDIENT_DB)
-        print(cal_range)
-        if(flag.lower() == "có"):
-            print(vlm_output["dish"])
-            return {
-                    # "dish_name": vlm_output["dish"],
-                    "calories_range": cal_range,
-                    "warning": "none"
-                    }
+    # local chỉ kết luận "không" (có chất dị ứng): tên món / nguyên liệu VLM nhắc tới chất dị ứng,
+    # hoặc nguyên liệu món trong DISH_DB chứa nó. Kết luận "có" (an toàn) luôn phải hỏi LLM,
+    # nên LLM được gọi ngay song song với bước so khớp món và huỷ nếu local đã thấy chất dị ứng
+    terms = allergy_terms(allergy)
+    ingredients = vlm_output.get("ingredients") or []
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+    mentioned = bool(terms) and allergy_mentioned(terms, dish_name, *map(str, ingredients))
+    llm_task = None
+    if terms and not mentioned:
+        llm_task = asyncio.create_task(llm_allergy_verdict(allergy, dish_name))
+
+    dish, score = await asyncio.to_thread(match_dish, dish_name)
+    cal_range = nutrition_engine.calories_range(dish)
+    nutrition = nutrition_engine.nutrition(dish) if dish else None
+    print(cal_range)
+
+    if not terms:
+        flag = "có"
+    elif mentioned:
+        flag = "không"
+    else:
+        # món khớp lỏng (vd. món tôm gần "beef_bo") không được dùng để gán nguyên liệu cho món
+        flag = local_allergy_verdict(terms, dish if score >= ALLERGY_LOCAL_MIN_SCORE else None)
+        if flag is None:
+            flag = await llm_task
         else:
-            print(vlm_output["dish"])
-            return {
-                    # "dish_name": vlm_output["dish"],
-                    "calories_range": cal_range,
-                    "warning": "món ăn có chứa chất gây dị ứng đối với bạn, hãy cẩn thận."
-                    }
\ No newline at end of file
+            llm_task.cancel()
+
+    print(dish_name)
+    if flag.strip().strip("*").lower() == "có":
+        return {
+                # "dish_name": vlm_output["dish"],
+                "calories_range": cal_range,
+                "nutrition_range": nutrition,
+                "warning": "none"
+                }
+    else:
+        return {
+                # "dish_name": vlm_output["dish"],
+                "calories_range": cal_range,
+                "nutrition_range": nutrition,
+                "warning": "món ăn có chứa chất gây dị ứng đối với bạn, hãy cẩn thận."
+                }
@@ -0,0 +1,77 @@
+import numpy as np
+
+NUTRIENTS = ("calories", "protein", "carbs", "fat")
+
+
+class NutritionEngine:
+    """
+    INGREDIENT_DB / DISH_DB biên dịch thành ma trận NumPy:
+    - ingredient x nutrient: giá trị thấp / cao của mỗi chất theo đơn vị trong INGREDIENT_DB
+    - dish x ingredient: lượng thấp / cao của mỗi nguyên liệu trong món (/100 giống synthesize_dish)
+    Khoảng dinh dưỡng của mọi món = hai phép nhân ma trận, tính sẵn một lần khi khởi tạo.
+    """
+
+    def __init__(self, dish_db, ingredient_db, ratio=0.25):
+        self.ingredients = list(ingredient_db)
+        self.dishes = list(dish_db)
+        self._dish_idx = {key: i for i, key in enumerate(self.dishes)}
+        ing_idx = {name: i for i, name in enumerate(self.ingredients)}
+
+        per_unit = np.zeros((2, len(self.ingredients), len(NUTRIENTS)))
+        for i, name in enumerate(self.ingredients):
+            for j, nutrient in enumerate(NUTRIENTS):
+                per_unit[:, i, j] = ingredient_db[name].get(nutrient, (0, 0))
+
+        amounts = np.zeros((2, len(self.dishes), len(self.ingredients)))
+        for d, key in enumerate(self.dishes):
+            for name, amount in dish_db[key]["ingredients"].items():
+                if name in ing_idx:
+                    amounts[:, d, ing_idx[name]] = amount
+        amounts /= 100
+
+        low = amounts[0] @ per_unit[0]
+        high = amounts[1] @ per_unit[1]
+        span = high - low
+        # (dish, nutrient, [min, max]), thu hẹp hai đầu theo ratio như synthesize_dish
+        self.ranges = np.stack([low + span * ratio, high - span * ratio], axis=-1)
+
+    def indices(self, dish_keys):
+        """Vị trí của từng món trong ma trận, -1 nếu món không có trong DISH_DB."""
+        return np.fromiter((self._dish_idx.get(key, -1) for key in dish_keys), dtype=np.int64, count=len(dish_keys))
+
+    def batch(self, dish_keys, portions=None):
+        """
+        Khoảng dinh dưỡng của một batch món: mảng (số món, số chất, 2), món không biết là NaN.
+        portions: số suất của từng món (mặc định 1).
+        """
+        idx = self.indices(dish_keys)
+        ranges = np.where((idx >= 0)[:, None, None], self.ranges[idx.clip(min=0)], np.nan)
+        if portions is not None:
+            ranges = ranges * np.asarray(portions, dtype=float)[:, None, None]
+        return ranges
+
+    def totals(self, dish_keys, portions=None):
+        """Tổng khoảng dinh dưỡng của cả thực đơn / nhật ký ăn (bỏ qua món không biết)."""
+        idx = self.indices(dish_keys)
+        weights = np.ones(len(dish_keys)) if portions is None else np.asarray(portions, dtype=float)
+        weights = np.where(idx >= 0, weights, 0.0)
+        total = np.tensordot(weights, self.ranges[idx.clip(min=0)], axes=1)
+        return self.to_dict(total)
+
+    @staticmethod
+    def to_dict(ranges):
+        """(số chất, 2) -> {"calories": (min, max), ...}, None nếu là NaN."""
+        if np.isnan(ranges).any():
+            return None
+        return {nutrient: (round(float(lo), 1), round(float(hi), 1)) for nutrient, (lo, hi) in zip(NUTRIENTS, ranges)}
+
+    def nutrition(self, dish_key):
+        return self.to_dict(self.batch([dish_key])[0])
+
+    def calories_range(self, dish_key):
+        """Giống synthesize_dish(dish_key, DISH_DB, INGREDIENT_DB): (int min, int max) hoặc None."""
+        idx = self._dish_idx.get(dish_key)
+        if idx is None:
+            return None
+        low, high = self.ranges[idx, NUTRIENTS.index("calories")]
+        return int(low), int(high)
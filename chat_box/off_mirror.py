@@ -0,0 +1,237 @@
+"""
+Bản sao cục bộ của OpenFoodFacts, tra cứu barcode không cần gọi mạng.
+
+    python off_mirror.py import openfoodfacts-products.jsonl.gz        # dump JSONL
+    python off_mirror.py import en.openfoodfacts.org.products.csv.gz   # dump CSV (tab)
+    python off_mirror.py get 8934673123456
+
+Thư mục mirror (OFF_MIRROR_DIR):
+- CURRENT: tên bản mirror đang dùng; mỗi lần import ghi vào versions/<tên mới> rồi đổi CURRENT bằng một os.replace,
+  reader không bao giờ thấy các file của hai bản khác nhau trộn lẫn
+- versions/<tên>/barcodes.npy: barcode dạng uint64, đã sắp xếp -> tìm bằng np.searchsorted (O(log n)), đọc bằng memmap
+- versions/<tên>/offsets.npy / lengths.npy: vị trí bản ghi của barcode tương ứng trong records.bin
+- versions/<tên>/records.bin: các bản ghi JSON rút gọn (chỉ các trường get_product_info dùng)
+"""
+import argparse
+import array
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+#---config---#
+OFF_MIRROR_DIR = os.getenv("OFF_MIRROR_DIR", os.path.join(os.path.dirname(__file__), "off_mirror"))
+#---config---#
+
+KEEP_FIELDS = (
+    "product_name", "brands", "quantity", "image_url", "ingredients_text", "allergens_tags", "nutriscore_grade", "nova_group",
+)
+KEEP_NUTRIMENTS = (
+    "energy-kcal", "energy-kcal_100g", "proteins", "proteins_100g", "carbohydrates", "carbohydrates_100g",
+    "sugars", "sugars_100g", "fat", "fat_100g", "saturated-fat", "saturated-fat_100g", "fiber", "fiber_100g",
+    "salt", "salt_100g", "sodium", "sodium_100g",
+)
+MAX_KEY = np.iinfo(np.uint64).max
+KEEP_VERSIONS = 2  # bản mới + bản trước (reader vừa đọc CURRENT cũ vẫn mở được)
+
+
+def barcode_key(barcode):
+    """
+    Barcode -> uint64. Số 0 ở đầu bị bỏ (UPC-A 12 số và EAN-13 có thêm số 0 là cùng một sản phẩm, giống cách OFF chuẩn hoá).
+    None nếu không phải chuỗi số hoặc quá dài.
+    """
+    barcode = str(barcode).strip()
+    if not barcode.isdigit() or len(barcode.lstrip("0")) > 19:
+        return None
+    key = int(barcode)
+    return key if key < MAX_KEY else None
+
+
+def compact_product(product):
+    """Chỉ giữ các trường get_product_info cần từ một sản phẩm OFF."""
+    record = {field: product[field] for field in KEEP_FIELDS if product.get(field) not in (None, "", [])}
+    nutriments = product.get("nutriments") or {}
+    record["nutriments"] = {k: nutriments[k] for k in KEEP_NUTRIMENTS if nutriments.get(k) not in (None, "")}
+    return record
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def iter_jsonl(path):
+    with _open_text(path) as f:
+        for line in f:
+            try:
+                product = json.loads(line)
+            except ValueError:
+                continue
+            yield product.get("code") or product.get("_id"), compact_product(product)
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_csv(path):
+    """Dump CSV của OFF: phân tách bằng tab, giá trị dinh dưỡng nằm ở các cột <chất>_100g."""
+    csv.field_size_limit(sys.maxsize)
+    with _open_text(path) as f:
+        for row in csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            product = {
+                "product_name": row.get("product_name"),
+                "brands": row.get("brands"),
+                "quantity": row.get("quantity"),
+                "image_url": row.get("image_url"),
+                "ingredients_text": row.get("ingredients_text"),
+                "nutriscore_grade": row.get("nutriscore_grade"),
+                "allergens_tags": [t for t in (row.get("allergens") or "").split(",") if t],
+                "nutriments": {k: _to_number(row.get(k)) for k in KEEP_NUTRIMENTS if k.endswith("_100g")},
+            }
+            yield row.get("code"), compact_product(product)
+
+
+def current_version(mirror_dir):
+    """Tên bản mirror đang dùng (nội dung file CURRENT), None nếu chưa import."""
+    try:
+        with open(os.path.join(mirror_dir, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _publish(mirror_dir, version):
+    tmp = os.path.join(mirror_dir, f"CURRENT.tmp-{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(mirror_dir, "CURRENT"))
+    versions_dir = os.path.join(mirror_dir, "versions")
+    # tên bản bắt đầu bằng thời gian import nên sắp xếp theo tên = theo thời gian
+    for old in sorted(os.listdir(versions_dir))[:-KEEP_VERSIONS]:
+        if old != version:
+            shutil.rmtree(os.path.join(versions_dir, old), ignore_errors=True)
+
+
+def import_dump(path, out_dir=OFF_MIRROR_DIR, log_every=500_000):
+    """Đọc dump OFF (JSONL / CSV, có thể .gz) và ghi một bản mirror mới vào out_dir. Trả về số sản phẩm."""
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{os.getpid()}"
+    mirror_dir = out_dir
+    out_dir = os.path.join(mirror_dir, "versions", version)
+    os.makedirs(out_dir)
+    rows = iter_csv(path) if ".csv" in os.path.basename(path) else iter_jsonl(path)
+    # array thay cho list: vài triệu barcode chỉ tốn vài chục MB RAM
+    keys, offsets, lengths = array.array("Q"), array.array("Q"), array.array("I")
+    records_path = os.path.join(out_dir, "records.bin")
+    started = time.perf_counter()
+    position = 0
+    with open(records_path, "wb") as out:
+        for barcode, record in rows:
+            key = barcode_key(barcode) if barcode else None
+            if key is None:
+                continue
+            data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode()
+            out.write(data)
+            keys.append(key)
+            offsets.append(position)
+            lengths.append(len(data))
+            position += len(data)
+            if log_every and len(keys) % log_every == 0:
+                print(f"🔵 [OFF mirror] {len(keys)} sản phẩm, {len(keys) / (time.perf_counter() - started):.0f}/s")
+
+    keys = np.frombuffer(keys, dtype=np.uint64)
+    offsets = np.frombuffer(offsets, dtype=np.uint64)
+    lengths = np.frombuffer(lengths, dtype=np.uint32)
+    # sắp xếp ổn định rồi giữ bản ghi xuất hiện sau cùng của mỗi barcode trùng
+    order = np.argsort(keys, kind="stable")
+    keys, offsets, lengths = keys[order], offsets[order], lengths[order]
+    last = np.append(keys[1:] != keys[:-1], True) if len(keys) else np.zeros(0, dtype=bool)
+    keys, offsets, lengths = keys[last], offsets[last], lengths[last]
+
+    for name, values in (("barcodes", keys), ("offsets", offsets), ("lengths", lengths)):
+        np.save(os.path.join(out_dir, f"{name}.npy"), values)
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump({"source": os.path.abspath(path), "products": int(len(keys)), "imported_at": time.time()}, f)
+    # bản mới chỉ được dùng sau khi đã ghi đủ mọi file
+    _publish(mirror_dir, version)
+    elapsed = time.perf_counter() - started
+    print(f"🟢 [OFF mirror] {len(keys)} sản phẩm trong {elapsed:.1f}s ({len(keys) / max(elapsed, 1e-9):.0f}/s) -> {out_dir}")
+    return len(keys)
+
+
+class OFFMirror:
+    """Tra cứu barcode trên mirror đã import; mọi file được memory-map nên mở gần như tức thì."""
+
+    def __init__(self, mirror_dir=OFF_MIRROR_DIR, version=None):
+        self.mirror_dir = mirror_dir
+        self.version = version or current_version(mirror_dir)
+        if self.version is None:
+            raise FileNotFoundError(f"Chưa có mirror trong {mirror_dir}")
+        path = os.path.join(mirror_dir, "versions", self.version)
+        self.barcodes = np.load(os.path.join(path, "barcodes.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(path, "lengths.npy"), mmap_mode="r")
+        records_path = os.path.join(path, "records.bin")
+        self.records = np.memmap(records_path, dtype=np.uint8, mode="r") if os.path.getsize(records_path) else b""
+
+    @classmethod
+    def open(cls, mirror_dir=OFF_MIRROR_DIR):
+        """Bản mirror hiện tại nếu đã được import, None nếu chưa có."""
+        for _ in range(3):
+            version = current_version(mirror_dir) if mirror_dir else None
+            if version is None:
+                return None
+            try:
+                return cls(mirror_dir, version)
+            except FileNotFoundError:
+                continue  # bản vừa đọc bị xoá bởi lần import chạy song song, đọc lại CURRENT
+        return None
+
+    def __len__(self):
+        return len(self.barcodes)
+
+    def get(self, barcode):
+        """Sản phẩm rút gọn (dict) hoặc None nếu barcode không có trong mirror."""
+        key = barcode_key(barcode)
+        if key is None or not len(self.barcodes):
+            return None
+        key = np.uint64(key)
+        i = int(np.searchsorted(self.barcodes, key))
+        if i >= len(self.barcodes) or self.barcodes[i] != key:
+            return None
+        start = int(self.offsets[i])
+        return json.loads(bytes(self.records[start:start + int(self.lengths[i])]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="import dump JSONL / CSV của OpenFoodFacts")
+    p_import.add_argument("dump")
+    p_import.add_argument("--out", default=OFF_MIRROR_DIR)
+    p_get = sub.add_parser("get", help="tra cứu một barcode")
+    p_get.add_argument("barcode")
+    p_get.add_argument("--dir", default=OFF_MIRROR_DIR)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        import_dump(args.dump, args.out)
+    else:
+        mirror = OFFMirror.open(args.dir)
+        print(json.dumps(mirror.get(args.barcode) if mirror else None, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pinecone import Pinecone, ServerlessSpec
-from sentence_transformers import SentenceTransformer
+from embedding_service import get_embedder
 import os
 from dotenv import load_dotenv
 
@@ -19,7 +19,7 @@ if index_name not in pc.list_indexes().names():
 
 index = pc.Index(index_name)
 
-model = SentenceTransformer('all-MiniLM-L12-v2')
+model = get_embedder('all-MiniLM-L12-v2')
 
 def get_embedding(text: str):
     return model.encode(text, convert_to_numpy=True).tolist()
@@ -44,11 +44,14 @@ recipes = [
 ]
 ##dummy data##
 
+# encode tất cả tên món trong một batch, lần chạy sau lấy lại từ cache đĩa
+title_embeddings = model.encode([recipe["title"] for recipe in recipes])
+
 vectors = []
-for recipe in recipes:
+for recipe, title_emb in zip(recipes, title_embeddings):
     vectors.append({
         "id": recipe["id"],
-        "values": get_embedding(recipe["title"]),
+        "values": title_emb.tolist(),
         "metadata": {
             "title": recipe["title"],
             "ingredients": recipe["ingredients"],
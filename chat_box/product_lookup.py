@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+
+from off_mirror import OFF_MIRROR_DIR, OFFMirror, current_version
+
+#---config---#
+OFF_BASE_URL = os.getenv("OFF_BASE_URL", "https://world.openfoodfacts.org")
+OFF_TIMEOUT = float(os.getenv("OFF_TIMEOUT", "10"))
+OFF_MAX_CONNECTIONS = int(os.getenv("OFF_MAX_CONNECTIONS", "32"))
+OFF_USER_AGENT = os.getenv("OFF_USER_AGENT", "NutritionApp/1.0 (chat_box barcode service)")
+OFF_CACHE_DB = os.getenv("OFF_CACHE_DB", os.path.join(os.path.dirname(__file__), "off_cache.db"))
+OFF_CACHE_TTL = float(os.getenv("OFF_CACHE_TTL", str(7 * 24 * 3600)))      # sản phẩm tìm thấy
+OFF_NEGATIVE_TTL = float(os.getenv("OFF_NEGATIVE_TTL", "3600"))            # barcode không có trong OFF
+OFF_MEMORY_ENTRIES = int(os.getenv("OFF_MEMORY_ENTRIES", "5000"))
+OFF_MIRROR_CHECK_INTERVAL = float(os.getenv("OFF_MIRROR_CHECK_INTERVAL", "30"))  # giây, phát hiện mirror mới import
+#---config---#
+
+BARCODE_PATTERN = re.compile(r"\d{1,32}")
+
+
+def not_found(barcode):
+    return {"barcode": barcode, "status": 0, "product": None}
+
+
+class ProductStore:
+    """Cache sản phẩm OpenFoodFacts trên SQLite theo barcode, giữ được qua các lần restart."""
+
+    def __init__(self, path=OFF_CACHE_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            " barcode TEXT PRIMARY KEY,"
+            " status INTEGER NOT NULL,"
+            " product TEXT,"
+            " expires REAL NOT NULL)"
+        )
+
+    def get(self, barcode):
+        """(kết quả, expires) hoặc None nếu chưa có / đã hết hạn."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, product, expires FROM products WHERE barcode = ?", (barcode,)
+            ).fetchone()
+        if row is None or row[2] < time.time():
+            return None
+        status, product, expires = row
+        return {"barcode": barcode, "status": status, "product": json.loads(product) if product else None}, expires
+
+    def put(self, result, expires):
+        product = json.dumps(result["product"], ensure_ascii=False) if result["product"] is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO products (barcode, status, product, expires) VALUES (?, ?, ?, ?)",
+                (result["barcode"], result["status"], product, expires),
+            )
+
+
+class ProductLookup:
+    """
+    Tra cứu sản phẩm OpenFoodFacts theo barcode.
+    - mirror OFF cục bộ (nếu đã import) -> LRU trong RAM -> SQLite -> API OFF qua một connection pool httpx dùng chung
+      mirror được tra trước cache nên barcode từng cache "không tìm thấy" vẫn có kết quả ngay khi mirror có nó
+    - kết quả không tìm thấy (status != 1) cũng được cache nhưng với TTL ngắn
+    - nhiều request cùng lúc cho cùng barcode chỉ gọi API một lần
+    lookup() trả về {"barcode", "status", "product"}; lỗi mạng / timeout được raise (httpx.HTTPError), không cache.
+    """
+
+    def __init__(self, base_url=OFF_BASE_URL, store=None, timeout=OFF_TIMEOUT, max_connections=OFF_MAX_CONNECTIONS,
+                 ttl=OFF_CACHE_TTL, negative_ttl=OFF_NEGATIVE_TTL, memory_entries=OFF_MEMORY_ENTRIES,
+                 mirror=None, mirror_dir=OFF_MIRROR_DIR):
+        self.base_url = base_url.rstrip("/")
+        # truyền mirror cố định thì không theo dõi thư mục mirror nữa
+        self.mirror_dir = None if mirror is not None else mirror_dir
+        self.mirror = mirror if mirror is not None else OFFMirror.open(mirror_dir)
+        self._mirror_checked = time.monotonic()
+        self.store = store if store is not None else ProductStore()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # barcode -> (kết quả, expires)
+        self._inflight = {}
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout),
+            headers={"User-Agent": OFF_USER_AGENT},
+        )
+        self.stats = {"memory_hits": 0, "mirror_hits": 0, "disk_hits": 0, "fetches": 0, "coalesced": 0,
+                      "not_found": 0, "errors": 0}
+
+    def _remember(self, result, expires):
+        self._memory[result["barcode"]] = (result, expires)
+        self._memory.move_to_end(result["barcode"])
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _current_mirror(self):
+        """Mở lại mirror khi có bản import mới (kiểm tra CURRENT tối đa mỗi OFF_MIRROR_CHECK_INTERVAL giây)."""
+        now = time.monotonic()
+        if self.mirror_dir and now - self._mirror_checked >= OFF_MIRROR_CHECK_INTERVAL:
+            self._mirror_checked = now
+            version = current_version(self.mirror_dir)
+            if version != (self.mirror.version if self.mirror is not None else None):
+                self.mirror = OFFMirror.open(self.mirror_dir)
+        return self.mirror
+
+    def cached(self, barcode):
+        mirror = self._current_mirror()
+        if mirror is not None:
+            product = mirror.get(barcode)
+            if product is not None:
+                self.stats["mirror_hits"] += 1
+                return {"barcode": barcode, "status": 1, "product": product}
+        entry = self._memory.get(barcode)
+        if entry is not None:
+            if entry[1] >= time.time():
+                self._memory.move_to_end(barcode)
+                self.stats["memory_hits"] += 1
+                return entry[0]
+            del self._memory[barcode]
+        entry = self.store.get(barcode)
+        if entry is not None:
+            self.stats["disk_hits"] += 1
+            self._remember(*entry)
+            return entry[0]
+        return None
+
+    async def lookup(self, barcode):
+        barcode = barcode.strip()
+        if not BARCODE_PATTERN.fullmatch(barcode):
+            return not_found(barcode)
+        result = self.cached(barcode)
+        if result is not None:
+            return result
+
+        task = self._inflight.get(barcode)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(self._fetch(barcode))
+        self._inflight[barcode] = task
+        task.add_done_callback(lambda _: self._inflight.pop(barcode, None))
+        # shield: một client huỷ request không làm huỷ lần gọi API mà các request khác đang chờ
+        return await asyncio.shield(task)
+
+    async def _fetch(self, barcode):
+        self.stats["fetches"] += 1
+        try:
+            resp = await self._http.get(f"{self.base_url}/api/v2/product/{barcode}.json")
+            if resp.status_code == 404:
+                data = {"status": 0}
+            else:
+                resp.raise_for_status()
+                data = resp.json()
+                if not isinstance(data, dict):
+                    raise ValueError(f"kiểu {type(data).__name__}")
+        except httpx.HTTPError:
+            self.stats["errors"] += 1
+            raise
+        except ValueError as e:
+            # OFF đôi khi trả trang HTML (bảo trì / rate limit) với status 200: coi như lỗi upstream
+            self.stats["errors"] += 1
+            raise httpx.DecodingError(f"OpenFoodFacts trả về nội dung không phải JSON: {e}", request=resp.request) from e
+
+        if data.get("status") == 1 and data.get("product"):
+            result = {"barcode": barcode, "status": 1, "product": data["product"]}
+            expires = time.time() + self.ttl
+        else:
+            self.stats["not_found"] += 1
+            result = not_found(barcode)
+            expires = time.time() + self.negative_ttl
+        self._remember(result, expires)
+        await asyncio.to_thread(self.store.put, result, expires)
+        return result
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    def metrics(self):
+        return {
+            "memory_entries": len(self._memory),
+            "mirror_products": len(self.mirror) if self.mirror is not None else 0,
+            "mirror_version": self.mirror.version if self.mirror is not None else None,
+            "inflight": len(self._inflight),
+            **self.stats,
+        }
+
+
+_lookup = None
+
+
+def get_product_lookup():
+    global _lookup
+    if _lookup is None:
+        _lookup = ProductLookup()
+    return _lookup
@@ -0,0 +1,108 @@
+from pydantic import BaseModel, ConfigDict, Field
+
+# trường luôn được trả về dù fields= chọn gì (app Flutter cần để hiển thị)
+REQUIRED_FIELDS = {"product_name"}
+RAW_FIELDS = "raw"  # fields=raw: trả nguyên object OpenFoodFacts như trước
+
+
+class Nutriments(BaseModel):
+    """Dinh dưỡng của sản phẩm, giữ tên key của OpenFoodFacts (app đọc nutriments['energy-kcal'], ...)."""
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    energy_kcal: float | None = Field(None, alias="energy-kcal")
+    proteins: float | None = None
+    carbohydrates: float | None = None
+    sugars: float | None = None
+    fat: float | None = None
+    saturated_fat: float | None = Field(None, alias="saturated-fat")
+    fiber: float | None = None
+    salt: float | None = None
+    sodium: float | None = None
+
+
+class CompactProduct(BaseModel):
+    """Bản rút gọn của product OpenFoodFacts: chỉ các trường app và prompt LLM dùng."""
+
+    product_name: str | None = None
+    brands: str | None = None
+    quantity: str | None = None
+    image_url: str | None = None
+    ingredients_text: str | None = None
+    allergens_tags: list[str] = []
+    nutriscore_grade: str | None = None
+    nova_group: int | None = None
+    nutriments: Nutriments = Nutriments()
+    # chỉ lấy từ các key *_100g, dùng cho luật / prompt so với ngưỡng trên 100g; không trả về cho client
+    # (nutriments ở trên là giá trị "as sold", có thể là theo khẩu phần khi nutrition_data_per=serving)
+    nutriments_100g: Nutriments = Field(Nutriments(), exclude=True)
+
+
+PRODUCT_FIELDS = set(CompactProduct.model_fields) - {"nutriments_100g"}
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def project_product(product):
+    """product OpenFoodFacts (đầy đủ hoặc bản ghi mirror) -> CompactProduct."""
+    raw = product.get("nutriments") or {}
+    nutriments, per_100g = {}, {}
+    for name, info in Nutriments.model_fields.items():
+        key = info.alias or name
+        per_100g[key] = _number(raw.get(f"{key}_100g"))
+        # giá trị "as sold" nếu có, nếu không lấy giá trị /100g
+        nutriments[key] = _number(raw.get(key)) if raw.get(key) is not None else per_100g[key]
+    nova_group = _number(product.get("nova_group"))
+    return CompactProduct(
+        product_name=product.get("product_name") or None,
+        brands=product.get("brands") or None,
+        quantity=product.get("quantity") or None,
+        image_url=product.get("image_url") or None,
+        ingredients_text=product.get("ingredients_text") or None,
+        allergens_tags=product.get("allergens_tags") or [],
+        nutriscore_grade=product.get("nutriscore_grade") or None,
+        nova_group=int(nova_group) if nova_group is not None else None,
+        nutriments=Nutriments.model_validate(nutriments),
+        nutriments_100g=Nutriments.model_validate(per_100g),
+    )
+
+
+def parse_fields(fields):
+    """'product_name,nutriments' -> set trường; None = tất cả; 'raw' -> RAW_FIELDS. Raise ValueError nếu có trường lạ."""
+    if not fields:
+        return None
+    if fields.strip() == RAW_FIELDS:
+        return RAW_FIELDS
+    selected = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = selected - PRODUCT_FIELDS
+    if unknown:
+        raise ValueError(f"Trường không hỗ trợ: {', '.join(sorted(unknown))}. Có thể chọn: {', '.join(sorted(PRODUCT_FIELDS))} hoặc raw")
+    return selected | REQUIRED_FIELDS
+
+
+def product_payload(product, fields=None):
+    """Dict product trả về cho client theo lựa chọn fields (kết quả của parse_fields)."""
+    if product is None:
+        return None
+    if fields == RAW_FIELDS:
+        return product
+    return project_product(product).model_dump(by_alias=True, exclude_none=True, include=fields)
+
+
+def prompt_macros(compact):
+    """Chuỗi ngắn các chỉ số trên 100g cần cho lời khuyên của LLM (thay cho cả dict nutriments)."""
+    n = compact.nutriments_100g
+
+    def fmt(value, unit):
+        return f"{value:g}{unit}" if value is not None else "?"
+
+    allergens = ", ".join(tag.split(":", 1)[-1] for tag in compact.allergens_tags) or "không ghi"
+    return (
+        f"trên 100g: Calo {fmt(n.energy_kcal, 'kcal')}, Protein {fmt(n.proteins, 'g')}, Carbs {fmt(n.carbohydrates, 'g')} "
+        f"(đường {fmt(n.sugars, 'g')}), Fat {fmt(n.fat, 'g')}, Muối {fmt(n.salt, 'g')}, Chất gây dị ứng: {allergens}"
+    )
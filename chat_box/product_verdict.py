@@ -0,0 +1,292 @@
+"""
+Kết luận nhanh "sản phẩm có hợp với người dùng không" cho /get_product_info, không cần gọi LLM.
+
+Luật (giá trị trên 100g, ngưỡng "cao" theo bảng đèn giao thông FSA):
+- dị ứng: allergens_tags của OFF (+ ingredients_text) khớp với dị ứng người dùng nhập
+- bệnh: tiểu đường -> đường, huyết áp / thận -> muối, tim mạch / mỡ máu -> chất béo bão hoà
+- mục tiêu: giảm cân (thường / keto / low carb), tăng cân, tăng cơ, duy trì
+rule_verdict() trả về None khi không đủ chắc (dị ứng / bệnh / mục tiêu lạ, thiếu số liệu, sản phẩm ở mức trung bình)
+-> barcode.py mới hỏi LLM, kết quả LLM được cache theo (barcode, profile_bucket()).
+"""
+import os
+import re
+import unicodedata
+
+from scan_cache import TTLCache
+
+#---config---#
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", str(7 * 24 * 3600)))
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "20000"))
+VERDICT_WEIGHT_BUCKET = float(os.getenv("VERDICT_WEIGHT_BUCKET", "10"))  # kg, cân nặng làm tròn khi tạo key cache
+#---config---#
+
+MAX_VERDICT_CHARS = 100
+
+# tag OFF -> các từ người dùng có thể nhập (so sánh sau normalize_text)
+ALLERGEN_TAGS = {
+    "en:milk": ["sữa", "milk", "lactose", "bơ sữa", "phô mai", "cheese"],
+    "en:gluten": ["gluten", "lúa mì", "wheat", "bột mì", "lúa mạch", "barley"],
+    "en:peanuts": ["đậu phộng", "lạc", "peanut", "peanuts"],
+    "en:nuts": ["hạt", "nuts", "hạnh nhân", "almond", "óc chó", "walnut", "hạt điều", "cashew"],
+    "en:soybeans": ["đậu nành", "soy", "soybean", "đậu tương"],
+    "en:eggs": ["trứng", "egg", "eggs"],
+    "en:fish": ["cá", "fish"],
+    "en:crustaceans": ["tôm", "cua", "ghẹ", "shrimp", "crab", "giáp xác", "hải sản", "seafood"],
+    "en:molluscs": ["mực", "nghêu", "sò", "ốc", "hàu", "squid", "mollusc", "hải sản", "seafood"],
+    "en:sesame-seeds": ["mè", "vừng", "sesame"],
+    "en:celery": ["cần tây", "celery"],
+    "en:mustard": ["mù tạt", "mustard"],
+    "en:sulphur-dioxide-and-sulphites": ["sulfite", "sulphite", "lưu huỳnh"],
+    "en:lupin": ["lupin"],
+}
+
+NO_ALLERGY_TERMS = {"khong", "khong co", "none", "no", "nothing", "khong di ung"}
+NO_DISEASE_TERMS = {"khong", "khong co", "none", "no", "nothing", "khoe manh", "binh thuong"}
+
+# bệnh -> (từ khoá, chất cần giới hạn, ngưỡng / 100g, lý do)
+DISEASE_LIMITS = {
+    "diabetes": (["tiểu đường", "đái tháo đường", "diabetes", "đường huyết"], "sugars", 5.0, "nhiều đường"),
+    "hypertension": (["huyết áp", "hypertension", "blood pressure"], "salt", 1.5, "nhiều muối"),
+    "kidney": (["thận", "kidney"], "salt", 1.5, "nhiều muối"),
+    "heart": (["tim mạch", "mỡ máu", "cholesterol", "heart", "xơ vữa"], "saturated_fat", 5.0, "nhiều chất béo bão hoà"),
+}
+
+# ngưỡng "cao" / 100g (FSA)
+HIGH_SUGAR = 22.5
+HIGH_FAT = 17.5
+HIGH_SATURATED_FAT = 5.0
+HIGH_SALT = 1.5
+
+GOAL_ALIASES = {
+    "lose_weight": ["lose weight", "giảm cân", "giam can", "loseweight"],
+    "low_carb": ["keto", "low carb", "lowcarb", "low_carb"],
+    "gain_weight": ["gain weight", "tăng cân", "gainweight", "gain_weight"],
+    "build_muscle": ["build muscle", "tăng cơ", "buildmuscle", "build_muscle"],
+    "maintain_weight": ["maintain", "duy trì", "maintainweight", "maintain_weight"],
+}
+GOAL_LABELS = {
+    "lose_weight": "giảm cân", "low_carb": "giảm cân low carb / keto", "gain_weight": "tăng cân",
+    "build_muscle": "tăng cơ", "maintain_weight": "duy trì cân nặng",
+}
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.lower().replace("đ", "d")
+    text = re.sub(r"[^a-z0-9\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def split_terms(text, ignore=()):
+    """"tôm, đậu phộng và sữa" -> ["tom", "dau phong", "sua"]."""
+    if not text:
+        return []
+    parts = re.split(r",|;|/|\n|\bvà\b|\band\b", text.lower())
+    terms = [normalize_text(part) for part in parts]
+    return [t for t in terms if t and t not in ignore]
+
+
+def _contains(text, term):
+    return re.search(rf"\b{re.escape(term)}\b", text) is not None
+
+
+# từ khoá đã chuẩn hoá -> tập tag OFF
+ALLERGEN_TERMS = {}
+for _tag, _words in ALLERGEN_TAGS.items():
+    for _word in _words:
+        ALLERGEN_TERMS.setdefault(normalize_text(_word), set()).add(_tag)
+# từ dài (> 3 ký tự) dùng để dò trong ingredients_text, xem _allergy_verdict
+INGREDIENT_TERMS = {tag: [w for w in map(normalize_text, words) if len(w) > 3] for tag, words in ALLERGEN_TAGS.items()}
+GOAL_TERMS = {key: [normalize_text(a.replace("_", " ")) for a in aliases] for key, aliases in GOAL_ALIASES.items()}
+DISEASE_TERMS = {key: [normalize_text(w) for w in words] for key, (words, *_) in DISEASE_LIMITS.items()}
+
+
+def normalize_goal(goal):
+    """goal từ app (key "lose_weight_keto" hoặc chuỗi cũ "Giảm cân(keto)") -> key trong GOAL_LABELS, "" nếu trống, None nếu lạ."""
+    if not goal or not goal.strip():
+        return ""
+    text = normalize_text(goal.replace("_", " "))
+    # keto / low carb kiểm tra trước vì chuỗi có cả "giảm cân"
+    for key in ("low_carb", "lose_weight", "gain_weight", "build_muscle", "maintain_weight"):
+        if any(_contains(text, a) for a in GOAL_TERMS[key]):
+            return key
+    return None
+
+
+def match_diseases(disease):
+    """(tập bệnh có luật, còn bệnh không nhận ra hay không)."""
+    found, unknown = set(), False
+    for term in split_terms(disease, NO_DISEASE_TERMS):
+        matched = {key for key, words in DISEASE_TERMS.items() if any(_contains(term, w) for w in words)}
+        found |= matched
+        unknown = unknown or not matched
+    return found, unknown
+
+
+def match_allergies(allergy):
+    """(tập tag OFF người dùng dị ứng, còn từ khoá không nhận ra hay không)."""
+    tags, unknown = set(), False
+    for term in split_terms(allergy, NO_ALLERGY_TERMS):
+        matched = ALLERGEN_TERMS.get(term)
+        if matched is None:
+            unknown = True
+        else:
+            tags |= matched
+    return tags, unknown
+
+
+def _values(compact):
+    """Giá trị trên 100g (chỉ từ các key *_100g của OFF); thiếu thì None -> luật liên quan không kết luận."""
+    n = compact.nutriments_100g
+    salt = n.salt if n.salt is not None else (n.sodium * 2.5 if n.sodium is not None else None)
+    return {
+        "kcal": n.energy_kcal, "proteins": n.proteins, "carbohydrates": n.carbohydrates, "sugars": n.sugars,
+        "fat": n.fat, "saturated_fat": n.saturated_fat, "salt": salt,
+    }
+
+
+def _fmt(value):
+    return f"{value:g}"
+
+
+def _short(text):
+    return text if len(text) <= MAX_VERDICT_CHARS else text[:MAX_VERDICT_CHARS - 1] + "…"
+
+
+def _allergy_verdict(compact, allergy):
+    """Câu kết luận nếu sản phẩm chứa chất người dùng dị ứng, "" nếu chắc chắn không có, None nếu không chắc."""
+    tags, unknown = match_allergies(allergy)
+    if not tags and not unknown:
+        return ""
+    product_tags = set(compact.allergens_tags)
+    hit = sorted(tags & product_tags)
+    ingredients = normalize_text(compact.ingredients_text or "")
+    if not hit and ingredients:
+        # từ một âm tiết ("cá", "mè", "sữa") dễ khớp nhầm ("cà chua") nên chỉ dò các từ dài trong thành phần
+        hit = sorted(tag for tag in tags if any(_contains(ingredients, w) for w in INGREDIENT_TERMS[tag]))
+    if hit:
+        name = ALLERGEN_TAGS[hit[0]][0]
+        return _short(f"Không phù hợp: sản phẩm có {name}, bạn bị dị ứng.")
+    # không thấy nhưng: có dị ứng lạ, hoặc OFF không ghi chất gây dị ứng (tag rỗng chưa chắc là không có)
+    if unknown or not product_tags:
+        return None
+    return ""
+
+
+def _disease_verdict(values, disease):
+    diseases, unknown = match_diseases(disease)
+    for key in sorted(diseases):
+        words, nutrient, limit, reason = DISEASE_LIMITS[key]
+        value = values[nutrient]
+        if value is None:
+            return None
+        if value > limit:
+            return _short(f"Không phù hợp: {reason} ({_fmt(value)}g/100g), không tốt với bệnh {words[0]}.")
+    return None if unknown else ""
+
+
+def _goal_verdict(values, goal):
+    kcal, protein, carbs, sugar, fat = (values[k] for k in ("kcal", "proteins", "carbohydrates", "sugars", "fat"))
+    if goal is None or kcal is None:
+        return None
+    label = GOAL_LABELS.get(goal, "")
+    high = [f"{name} {_fmt(value)}g" for name, value, limit in (
+        ("đường", sugar, HIGH_SUGAR), ("chất béo", fat, HIGH_FAT),
+        ("béo bão hoà", values["saturated_fat"], HIGH_SATURATED_FAT), ("muối", values["salt"], HIGH_SALT),
+    ) if value is not None and value > limit]
+
+    if goal == "lose_weight":
+        if kcal > 400 or high:
+            return f"Không phù hợp: nhiều {', '.join(high) or f'calo ({_fmt(kcal)} kcal)'} /100g, không hợp mục tiêu {label}."
+        if kcal <= 150 and sugar is not None and sugar <= 5 and fat is not None and fat <= 3:
+            return f"Phù hợp: ít calo ({_fmt(kcal)} kcal/100g), ít đường và chất béo, hợp mục tiêu {label}."
+    elif goal == "low_carb":
+        if carbs is None:
+            return None
+        if carbs > 20:
+            return f"Không phù hợp: nhiều carbs ({_fmt(carbs)}g/100g), không hợp chế độ low carb / keto."
+        if carbs <= 5 and not high:
+            return f"Phù hợp: ít carbs ({_fmt(carbs)}g/100g), hợp chế độ low carb / keto."
+    elif goal == "gain_weight":
+        if kcal >= 300 and not (sugar is not None and sugar > HIGH_SUGAR):
+            return f"Phù hợp: nhiều năng lượng ({_fmt(kcal)} kcal/100g), hợp mục tiêu {label}."
+        if kcal < 80:
+            return f"Chưa phù hợp: ít năng lượng ({_fmt(kcal)} kcal/100g), khó giúp {label}."
+    elif goal == "build_muscle":
+        if protein is None:
+            return None
+        if protein >= 10 and not high:
+            return f"Phù hợp: giàu protein ({_fmt(protein)}g/100g), hợp mục tiêu {label}."
+        if protein < 3 and high:
+            return f"Không phù hợp: ít protein, nhiều {', '.join(high)} /100g, không hợp mục tiêu {label}."
+    else:  # duy trì / không chọn mục tiêu: chỉ xét mức cao / thấp chung
+        if len(high) >= 2:
+            return f"Hạn chế: nhiều {', '.join(high)} /100g, chỉ nên dùng ít."
+        if not high and kcal <= 250 and sugar is not None and fat is not None and sugar <= 5 and fat <= 3:
+            return "Phù hợp: ít calo, ít đường và chất béo, dùng được hằng ngày."
+    return None
+
+
+def rule_verdict(compact, goal=None, disease=None, allergy=None):
+    """
+    Kết luận ngắn (<= 100 ký tự) cho CompactProduct theo luật, hoặc None khi luật không đủ chắc -> cần hỏi LLM.
+    Thứ tự ưu tiên: dị ứng -> bệnh -> mục tiêu.
+    """
+    verdict = _allergy_verdict(compact, allergy)
+    if verdict:
+        return verdict
+    allergy_unsure = verdict is None
+    values = _values(compact)
+    disease_verdict = _disease_verdict(values, disease)
+    if disease_verdict:
+        return disease_verdict
+    if allergy_unsure or disease_verdict is None:
+        return None
+    verdict = _goal_verdict(values, normalize_goal(goal))
+    return _short(verdict) if verdict else None
+
+
+def profile_bucket(weight=None, goal=None, disease=None, allergy=None):
+    """Key cache cho kết luận của LLM: các profile gần giống nhau (cân nặng làm tròn, cùng mục tiêu / bệnh / dị ứng) dùng chung."""
+    weight_bucket = int(weight // VERDICT_WEIGHT_BUCKET) if weight else None
+    goal_key = normalize_goal(goal)
+    return (
+        weight_bucket,
+        goal_key if goal_key is not None else normalize_text(goal),
+        tuple(sorted(split_terms(disease, NO_DISEASE_TERMS))),
+        tuple(sorted(split_terms(allergy, NO_ALLERGY_TERMS))),
+    )
+
+
+class ProductVerdicts:
+    """Luật trước, LLM sau; kết luận của LLM được cache theo (barcode, profile_bucket)."""
+
+    def __init__(self, max_entries=VERDICT_CACHE_MAX_ENTRIES, ttl=VERDICT_CACHE_TTL):
+        self.llm_cache = TTLCache(max_entries, ttl)
+        self.stats = {"rules": 0, "llm_cached": 0, "llm_calls": 0}
+
+    async def verdict(self, barcode, compact, ask_llm, weight=None, goal=None, disease=None, allergy=None):
+        """ask_llm: coroutine function không tham số, chỉ được gọi khi luật và cache đều không có kết luận."""
+        response = rule_verdict(compact, goal, disease, allergy)
+        if response is not None:
+            self.stats["rules"] += 1
+            return response, "rules"
+        key = (barcode, profile_bucket(weight, goal, disease, allergy))
+        response = self.llm_cache.get(key)
+        if response is not None:
+            self.stats["llm_cached"] += 1
+            return response, "llm_cache"
+        self.stats["llm_calls"] += 1
+        response = await ask_llm()
+        if response:
+            self.llm_cache.put(key, response)
+        return response, "llm"
+
+    def metrics(self):
+        total = sum(self.stats.values())
+        return {
+            **self.stats,
+            "rule_rate": round(self.stats["rules"] / total, 3) if total else 0.0,
+            "llm_cache": self.llm_cache.metrics(),
+        }
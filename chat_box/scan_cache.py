@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+#---config---#
+SCAN_CACHE_TTL = float(os.getenv("SCAN_CACHE_TTL", str(24 * 3600)))            # kết quả nhận diện ảnh
+SCAN_CACHE_MAX_ENTRIES = int(os.getenv("SCAN_CACHE_MAX_ENTRIES", "5000"))
+ALLERGY_CACHE_TTL = float(os.getenv("ALLERGY_CACHE_TTL", str(7 * 24 * 3600)))  # kết luận (món, dị ứng)
+ALLERGY_CACHE_MAX_ENTRIES = int(os.getenv("ALLERGY_CACHE_MAX_ENTRIES", "20000"))
+# ảnh có dHash khác <= ngưỡng này (bit / 64) được coi là cùng một ảnh đã nén lại, -1 (mặc định) = chỉ so hash byte.
+# Tắt mặc định: hai ảnh món khác nhau vẫn có thể có dHash gần nhau, mà kết quả VLM còn quyết định cảnh báo dị ứng
+SCAN_CACHE_PHASH_THRESHOLD = int(os.getenv("SCAN_CACHE_PHASH_THRESHOLD", "-1"))
+#---config---#
+
+
+class TTLCache:
+    """Dict có TTL cho từng entry và giới hạn số entry (loại theo LRU)."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, created)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def metrics(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+def image_digest(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class ScanCache:
+    """
+    Cache cho /scan_food, hai tầng độc lập:
+    - ảnh -> kết quả VLM: key là sha256 của byte ảnh, thêm dHash để nhận ra cùng ảnh đã bị nén lại
+    - (món, dị ứng) -> kết luận có / không của LLM, dùng chung giữa mọi ảnh của cùng một món
+    """
+
+    def __init__(self, ttl=SCAN_CACHE_TTL, max_entries=SCAN_CACHE_MAX_ENTRIES,
+                 allergy_ttl=ALLERGY_CACHE_TTL, allergy_max_entries=ALLERGY_CACHE_MAX_ENTRIES,
+                 phash_threshold=SCAN_CACHE_PHASH_THRESHOLD):
+        self.images = TTLCache(max_entries, ttl)
+        self.allergies = TTLCache(allergy_max_entries, allergy_ttl)
+        self.phash_threshold = phash_threshold
+        self._phashes = OrderedDict()  # digest -> dHash, cùng giới hạn với images
+        self._lock = threading.Lock()
+        self.phash_hits = 0
+
+    def get_image(self, digest):
+        """Kết quả VLM của đúng ảnh này (so sha256), chưa cần decode ảnh."""
+        return self.images.get(digest)
+
+    def get_similar(self, h):
+        """Kết quả VLM của một ảnh đã cache có dHash gần h (cùng ảnh đã bị nén lại / resize)."""
+        if h is None or self.phash_threshold < 0:
+            return None
+        with self._lock:
+            candidates = [d for d, other in self._phashes.items()
+                          if bin(h ^ other).count("1") <= self.phash_threshold]
+        for other_digest in candidates:
+            value = self.images.get(other_digest)
+            if value is not None:
+                self.phash_hits += 1
+                return value
+        return None
+
+    def store_image(self, digest, h, value):
+        self.images.put(digest, value)
+        if h is None:
+            return
+        with self._lock:
+            self._phashes[digest] = h
+            self._phashes.move_to_end(digest)
+            while len(self._phashes) > self.images.max_entries:
+                self._phashes.popitem(last=False)
+
+    @staticmethod
+    def allergy_key(dish, allergy):
+        return " ".join((dish or "").lower().split()), " ".join((allergy or "").lower().split())
+
+    def get_allergy(self, dish, allergy):
+        return self.allergies.get(self.allergy_key(dish, allergy))
+
+    def put_allergy(self, dish, allergy, verdict):
+        self.allergies.put(self.allergy_key(dish, allergy), verdict)
+
+    def metrics(self):
+        return {
+            "images": {**self.images.metrics(), "phash_hits": self.phash_hits},
+            "allergies": self.allergies.metrics(),
+        }
@@ -0,0 +1,143 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+#---config---#
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # cosine tối thiểu để coi là cùng câu hỏi
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+#---config---#
+
+
+def normalize_prompt(text):
+    # giữ dấu tiếng Việt, chỉ bỏ hoa/thường, dấu câu và khoảng trắng thừa
+    text = text.lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def profile_key(goal, allergy):
+    return (normalize_prompt(goal or ""), normalize_prompt(allergy or ""))
+
+
+class SemanticCache:
+    """
+    Cache câu trả lời theo ngữ nghĩa của câu hỏi.
+    Key = embedding của prompt đã chuẩn hoá + các trường profile ảnh hưởng tới câu trả lời (goal, allergy).
+    Entry hết hạn theo TTL, bị loại theo LRU khi đầy, và bị xoá hết khi index GraphRAG đổi phiên bản.
+    Mỗi entry ghi version của index đã sinh ra câu trả lời: get/put với version khác version hiện tại bị bỏ qua,
+    nên request bắt đầu trên snapshot cũ không ghi lại câu trả lời cũ sau invalidate().
+    Embedding được giữ trong một ma trận (max_entries x dim), get() là một phép matmul.
+    """
+
+    def __init__(self, encode, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, version=None):
+        self._encode = encode
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = version
+        self._entries = OrderedDict()  # id -> (slot, value, cost_s, profile), thứ tự LRU
+        self._matrix = None            # slot -> embedding
+        self._slot_ids = np.full(max_entries, -1, dtype=np.int64)       # slot -> id, -1 = trống
+        self._slot_profiles = np.full(max_entries, -1, dtype=np.int64)  # slot -> mã profile
+        self._slot_created = np.zeros(max_entries, dtype=np.float64)
+        self._profiles = {}            # profile -> [mã số, số entry còn giữ], xoá khi không còn entry nào
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._next_id = 0
+        self._next_profile_id = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "saved_s": 0.0, "invalidations": 0, "stale_puts": 0}
+
+    def embed(self, prompt):
+        emb = self._encode([normalize_prompt(prompt)])[0]
+        return np.asarray(emb, dtype=np.float32)
+
+    def _release(self, entry_id):
+        slot, _, _, profile = self._entries.pop(entry_id)
+        ref = self._profiles[profile]
+        ref[1] -= 1
+        if ref[1] == 0:
+            del self._profiles[profile]
+        self._slot_ids[slot] = -1
+        self._slot_profiles[slot] = -1
+        self._free.append(slot)
+
+    def get(self, embedding, profile, version=None):
+        """version: version index mà request đang dùng (None = không kiểm tra)."""
+        now = time.time()
+        with self._lock:
+            expired = np.flatnonzero((self._slot_ids >= 0) & (now - self._slot_created > self.ttl))
+            for slot in expired:
+                self._release(int(self._slot_ids[slot]))
+            ref = self._profiles.get(profile)
+            if self._matrix is None or ref is None or (version is not None and version != self.version):
+                self.stats["misses"] += 1
+                return None
+
+            scores = self._matrix @ np.asarray(embedding, dtype=np.float32)
+            scores[self._slot_profiles != ref[0]] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            entry_id = int(self._slot_ids[slot])
+            self._entries.move_to_end(entry_id)
+            _, value, cost_s, _ = self._entries[entry_id]
+            self.stats["hits"] += 1
+            self.stats["saved_s"] += cost_s
+            return value
+
+    def put(self, embedding, profile, value, cost_s=0.0, version=None):
+        """version: version index lúc request bắt đầu; khác version hiện tại (index đã đổi) thì không lưu."""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            if version is not None and version != self.version:
+                self.stats["stale_puts"] += 1
+                return
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+            if not self._free:
+                self._release(next(iter(self._entries)))
+            slot = self._free.pop()
+            entry_id = self._next_id
+            self._next_id += 1
+            self._matrix[slot] = embedding
+            self._slot_ids[slot] = entry_id
+            ref = self._profiles.get(profile)
+            if ref is None:
+                ref = self._profiles[profile] = [self._next_profile_id, 0]
+                self._next_profile_id += 1
+            ref[1] += 1
+            self._slot_profiles[slot] = ref[0]
+            self._slot_created[slot] = time.time()
+            self._entries[entry_id] = (slot, value, cost_s, profile)
+
+    def invalidate(self, version=None):
+        """Xoá toàn bộ cache, dùng làm hook khi index GraphRAG được nạp lại."""
+        with self._lock:
+            self._entries.clear()
+            self._slot_ids.fill(-1)
+            self._slot_profiles.fill(-1)
+            self._profiles.clear()
+            self._free = list(range(self.max_entries - 1, -1, -1))
+            self.version = version
+            self.stats["invalidations"] += 1
+
+    def metrics(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "profiles": len(self._profiles),
+            "version": self.version,
+            "hits": self.stats["hits"],
+            "misses": self.stats["misses"],
+            "hit_rate": round(self.stats["hits"] / total, 3) if total else 0.0,
+            "saved_latency_s": round(self.stats["saved_s"], 2),
+            "invalidations": self.stats["invalidations"],
+            "stale_puts": self.stats["stale_puts"],
+        }
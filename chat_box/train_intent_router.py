@@ -0,0 +1,134 @@
+"""
+Train + đánh giá intent router trên intent_data/intent_prompts.jsonl.
+
+    python train_intent_router.py                          # cross-validation + lưu centroid
+    python train_intent_router.py --holdout test.jsonl     # đánh giá thêm trên tập giữ riêng (cùng format)
+    python train_intent_router.py --llm 20                 # đo p50 thật của Qwen trên 20 câu (cần HF_TOKEN)
+
+In ra accuracy, tỉ lệ câu được router tự trả lời (coverage) / phải hỏi LLM (fallback) cho từng nhãn
+trên câu không dùng để train, và p50 latency tiết kiệm mỗi request
+(chỉ là ước lượng nếu không chạy --llm, vì khi đó p50 của LLM lấy từ --llm-p50-ms).
+INTENT_MODEL mặc định (all-MiniLM-L6-v2) chỉ train trên tiếng Anh: xem accuracy / fallback theo từng nhãn
+trên câu tiếng Việt, nếu thấp thì thử model đa ngôn ngữ (vd. INTENT_MODEL=paraphrase-multilingual-MiniLM-L12-v2).
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import numpy as np
+from embedding_service import EmbeddingService, get_embedder
+from intent_router import (
+    INTENT_MODEL,
+    INTENT_CENTROIDS_PATH,
+    IntentRouter,
+    fit_centroids,
+    llm_intent_classification,
+    load_examples,
+)
+
+
+def predict(names, centroids, embeddings, min_margin):
+    """(nhãn dự đoán, router có đủ tự tin để tự trả lời không) cho từng câu."""
+    sims = embeddings @ centroids.T
+    order = np.argsort(sims, axis=1)[:, ::-1]
+    rows = np.arange(len(embeddings))
+    margin = sims[rows, order[:, 0]] - sims[rows, order[:, 1]]
+    return np.asarray(names)[order[:, 0]], margin >= min_margin
+
+
+def cross_validate(embeddings, labels, min_margin, folds=5, seed=0):
+    """Dự đoán cho mọi câu bằng centroid fit trên các fold còn lại (mỗi câu đều là câu held-out)."""
+    idx = list(range(len(labels)))
+    random.Random(seed).shuffle(idx)
+    labels = np.asarray(labels)
+    pred = np.empty(len(labels), dtype=object)
+    confident = np.zeros(len(labels), dtype=bool)
+    for k in range(folds):
+        test = np.asarray(idx[k::folds])
+        train = np.setdiff1d(np.arange(len(labels)), test)
+        names, centroids = fit_centroids(embeddings[train], labels[train])
+        pred[test], confident[test] = predict(names, centroids, embeddings[test], min_margin)
+    return pred, confident
+
+
+def report(title, labels, pred, confident):
+    """In accuracy / coverage / fallback tổng và theo từng nhãn. Trả về coverage."""
+    labels = np.asarray(labels)
+    print(f"\n{title} ({len(labels)} câu)")
+    print(f"{'nhãn':<12}{'n':>5}{'accuracy':>10}{'fallback':>10}{'acc routed':>12}")
+    for name in [*sorted(set(labels)), None]:
+        mask = labels == name if name is not None else np.ones(len(labels), dtype=bool)
+        routed = mask & confident
+        acc = (pred[mask] == labels[mask]).mean()
+        routed_acc = (pred[routed] == labels[routed]).mean() if routed.any() else float("nan")
+        print(f"{name or 'tổng':<12}{int(mask.sum()):>5}{acc:>10.3f}{1 - routed.sum() / mask.sum():>10.3f}{routed_acc:>12.3f}")
+    return confident.mean()
+
+
+async def measure_llm(texts):
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        await llm_intent_classification(text)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--min-margin", type=float, default=None)
+    parser.add_argument("--llm", type=int, default=0, help="số câu dùng để đo latency Qwen")
+    parser.add_argument("--llm-p50-ms", type=float, default=1200.0,
+                        help="p50 giả định của Qwen khi không đo trực tiếp (kết quả chỉ là ước lượng)")
+    parser.add_argument("--holdout", default=None, help="file jsonl giữ riêng để đánh giá, không dùng để train")
+    args = parser.parse_args()
+
+    texts, labels = load_examples()
+    model = get_embedder(INTENT_MODEL)
+    embeddings = model.encode(texts, normalize_embeddings=True, batch_size=64)
+
+    names, centroids = fit_centroids(embeddings, labels)
+    router = IntentRouter(model=model, label_names=names, centroids=centroids)
+    if args.min_margin is not None:
+        router.min_margin = args.min_margin
+
+    print(f"model={INTENT_MODEL}  examples={len(texts)}  labels={router.label_names}  min_margin={router.min_margin}")
+    pred, confident = cross_validate(embeddings, labels, router.min_margin)
+    coverage = report("5-fold cross-validation, câu held-out", labels, pred, confident)
+    if args.holdout:
+        holdout_texts, holdout_labels = load_examples(args.holdout)
+        holdout_emb = model.encode(holdout_texts, normalize_embeddings=True, batch_size=64, persist=False)
+        pred, confident = predict(names, centroids, holdout_emb, router.min_margin)
+        coverage = report(f"tập held-out {args.holdout}", holdout_labels, pred, confident)
+
+    # đo route() như với câu hỏi mới của người dùng: service riêng không có cache RAM / đĩa
+    # (các câu ở trên vừa được encode nên get_embedder() sẽ trả từ cache, p50 thấp hơn thực tế)
+    uncached = IntentRouter(model=EmbeddingService(INTENT_MODEL, cache_dir=None, memory_entries=0),
+                            label_names=names, centroids=centroids, min_margin=router.min_margin)
+    timed_texts = holdout_texts if args.holdout else texts
+    uncached.route(timed_texts[0])  # khởi động thread micro-batch
+    local = []
+    for text in timed_texts:
+        start = time.perf_counter()
+        uncached.route(text)
+        local.append(time.perf_counter() - start)
+    local_p50 = statistics.median(local) * 1000
+
+    if args.llm:
+        llm_p50 = asyncio.run(measure_llm(texts[:args.llm])) * 1000
+        source = f"đo trên {args.llm} câu"
+    else:
+        llm_p50 = args.llm_p50_ms
+        source = "ƯỚC LƯỢNG từ --llm-p50-ms, chưa đo; chạy --llm N để đo thật"
+    saved = coverage * llm_p50 - local_p50
+    print(f"\np50 local={local_p50:.1f}ms (không cache embedding)  p50 llm={llm_p50:.1f}ms ({source})")
+    print(f"p50 saved per request≈{saved:.1f}ms ({'đo' if args.llm else 'ước lượng'})")
+
+    router.save()
+    print(f"saved centroids -> {INTENT_CENTROIDS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,181 +1,197 @@
-import cv2
 import os
-import base64
-from PIL import Image
-from io import BytesIO
-import base64
-from fastapi import FastAPI, UploadFile, File, Form, Body
-from openai import OpenAI
+from fastapi import FastAPI, UploadFile, File, Form, Body, HTTPException
 from dotenv import load_dotenv
 import tempfile
 from fastapi import FastAPI, UploadFile, File 
 import tempfile 
 import shutil
+import asyncio
+import concurrent.futures
+import threading
+import json
+import hashlib
 
 app = FastAPI()
 
 load_dotenv()
 
 HF_TOKEN = os.getenv("HF_TOKEN")
-
-client = OpenAI(
-    base_url="https://router.huggingface.co/v1",
-    api_key=HF_TOKEN,
-)
-
-def encode_image(path):
-    img = Image.open(path).convert("RGB")
-    buf = BytesIO()
-    img.save(buf, format="JPEG")
-    return base64.b64encode(buf.getvalue()).decode()
-
-def classify_frame(image_path):
-    image_b64 = encode_image(image_path)
-    completion = client.chat.completions.create(
-        model="Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "Is this image showing a dish or food? Answer only 'yes' or 'no'."
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_b64}"
-                        }
+# số frame được gửi lên VLM cùng lúc khi mô tả video
+VIDEO_CAPTION_CONCURRENCY = int(os.getenv("VIDEO_CAPTION_CONCURRENCY", "8"))
+
+import llm_gateway
+from video_frames import FrameDeduplicator, encode_frame, estimate_sample_count, iter_frames
+from video_jobs import CANCELLED, DONE, FAILED, JobRunner, job_key
+
+# thư mục chứa file video upload tạm thời (cv2 cần đường dẫn file), nên trỏ tới volume ghi được
+VIDEO_TMP_DIR = os.getenv("VIDEO_TMP_DIR") or None
+
+VLM_MODEL = "Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic"
+
+
+def _image_message(text, image_b64):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": text
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{image_b64}"
                     }
-                ]
-            }
-        ],
-        max_tokens=5,
+                }
+            ]
+        }
+    ]
+
+
+def parse_frame_analysis(content):
+    """Đọc JSON {"food": "yes"/"no", "action": "..."} của VLM, trả về (is_food, desc)."""
+    text = content.strip().strip("`").strip()
+    if text.startswith("json"):
+        text = text[4:]
+    try:
+        data = json.loads(text)
+        return str(data.get("food", "")).strip().lower() == "yes", str(data.get("action", "")).strip()
+    except (ValueError, AttributeError):
+        return content.strip().lower().startswith("yes"), content.strip()
+
+
+async def classify_and_describe(image_b64):
+    """Một lần gọi VLM cho cả hai việc: frame có phải đồ ăn không + mô tả hành động nấu."""
+    content = await llm_gateway.chat(
+        model=VLM_MODEL,
+        messages=_image_message(
+            "Is this image showing a dish, food or cooking? Also describe the cooking action and the INGREDIENTS "
+            "that are used in ONE short sentence using a verb and object. "
+            'Answer only with JSON: {"food": "yes" or "no", "action": "..."}',
+            image_b64,
+        ),
+        max_tokens=60,
         temperature=0.0,
     )
-    return completion.choices[0].message.content.strip().lower()
-
-
-def check_video_relevance(video_path, num_check=5):
-    """
-    Kiểm tra vài frame đầu để xác định video có liên quan đến đồ ăn không.
-    video_path: đường dẫn đến video
-    num_check: số frame đầu cần kiểm tra
-    """
-    with tempfile.TemporaryDirectory() as temp_dir:
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_interval = int(fps * 2)  # extract every 1 second for checking
-
-        frame_idx = 0
-        saved = 0
-        results = []
-
-        while cap.isOpened() and saved < num_check:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            if frame_idx % frame_interval == 0:
-                timestamp = int(frame_idx / fps)
-                filename = os.path.join(temp_dir, f"frame_{timestamp:06d}.jpg")
-                cv2.imwrite(filename, frame)
-                res = classify_frame(filename)  # trả về 'yes' hoặc 'no'
-                results.append(res)
-                saved += 1
+    return parse_frame_analysis(content)
 
-            frame_idx += 1
 
-        cap.release()
-
-        # Nếu đa số frame đầu là 'no' → dừng
-        if results.count("yes") == 0:
-            return {"status": "unsupported", "reason": "Video không liên quan đến đồ ăn"}
-        else:
-            return {"status": "ok", "reason": "Video có liên quan đến đồ ăn"}
-
-
-def describe_frame(image_path):
-    image_b64 = encode_image(image_path)
-
-    completion = client.chat.completions.create(
-        model="Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "Describe the cooking action and the INGREDIENTS that are used into ONE short sentence using a verb and object. No explanations."
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_b64}"
-                        }
-                    }
-                ]
-            }
-        ],
+async def describe_image(image_b64):
+    return await llm_gateway.chat(
+        model=VLM_MODEL,
+        messages=_image_message(
+            "Describe the cooking action and the INGREDIENTS that are used into ONE short sentence using a verb and object. No explanations.",
+            image_b64,
+        ),
         max_tokens=40,
         temperature=0.2,
     )
 
-    return completion.choices[0].message.content
-
-def process_frames(frame_dir):
-    results = []
-
-    frame_files = sorted(os.listdir(frame_dir))
-
-    for fname in frame_files:
-        path = os.path.join(frame_dir, fname)
-
-        # lấy timestamp từ tên file: frame_000005.jpg → 5
-        timestamp = int(fname.split("_")[1].split(".")[0])
-
-        desc = describe_frame(path)
-
-        results.append({
-            "time": timestamp,
-            "desc": desc
-        })
-
-    return results
-
-
-def extract_frames(video_path, interval_sec=3):
-    # tạo thư mục tạm
-    with tempfile.TemporaryDirectory() as out_dir:
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_interval = int(fps * interval_sec)
-
-        frame_idx = 0
-        saved = 0
-
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
+def _decode_frames(video_path, interval_sec, emit, stop, dedup):
+    """Chạy trong thread: đọc video, bỏ frame trùng và đẩy (index, timestamp, frame) sang emit."""
+    saved = 0
+    try:
+        for timestamp, frame in iter_frames(video_path, interval_sec):
+            if stop.is_set():
                 break
+            if not dedup.keep(frame):
+                continue
+            emit((saved, timestamp, frame))
+            saved += 1
+    finally:
+        emit(None)
+    print(f"Sampled frames: {saved}, skipped (duplicate): {dedup.skipped}")
 
-            if frame_idx % frame_interval == 0:
-                timestamp = int(frame_idx / fps)
-                filename = os.path.join(out_dir, f"frame_{timestamp:06d}.jpg")
-                cv2.imwrite(filename, frame)
-                saved += 1
 
-            frame_idx += 1
-
-        cap.release()
-        print("Saved frames:", saved)
-
-        # gọi process_frames với thư mục tạm
-        descriptions = process_frames(out_dir)
+async def analyze_video(video_path, interval_sec=3, num_check=5, concurrency=VIDEO_CAPTION_CONCURRENCY,
+                        progress=None):
+    """
+    Phân tích video trong một lần decode:
+    - num_check frame đầu được hỏi một prompt gộp (có phải đồ ăn không + mô tả)
+    - nếu không frame nào là đồ ăn thì dừng luôn, không decode / gọi VLM thêm
+    - các frame sau chỉ được mô tả, tối đa `concurrency` frame cùng lúc
+    - frame gần giống frame trước (dHash) bị bỏ qua trước khi gọi VLM
+    progress(stage, done, total) (tuỳ chọn) được gọi sau mỗi frame: "relevance" rồi "captioning".
+    Trả về {"status": "ok", "frames": [{"time", "desc"}, ...]} (theo thứ tự timestamp)
+    hoặc {"status": "unsupported", "reason": ...}.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    stop = threading.Event()
+    decided = asyncio.Event()
+    checked = {"done": 0, "food": 0}
+    results = []
+    dedup = FrameDeduplicator()
+    estimated = await asyncio.to_thread(estimate_sample_count, video_path, interval_sec) if progress else 0
+
+    def report():
+        if progress is None:
+            return
+        if checked["done"] < num_check and not decided.is_set():
+            progress("relevance", checked["done"], num_check)
+        else:
+            # tổng chỉ là ước lượng: trừ các frame đã bị bỏ vì trùng
+            progress("captioning", len(results), max(estimated - dedup.skipped, len(results)))
+
+    def emit(item):
+        # chặn thread decode khi hàng đợi đầy để không giữ quá nhiều frame trong bộ nhớ
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while not stop.is_set():
+            try:
+                return future.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
+                continue
+        future.cancel()
+
+    def decide():
+        decided.set()
+        if checked["food"] == 0:
+            # không phải video nấu ăn: dừng decode, bỏ các frame đang chờ và báo các worker kết thúc
+            stop.set()
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                # trả sentinel lại cho các worker khác
+                await queue.put(None)
+                return
+            idx, timestamp, frame = item
+            image_b64 = await asyncio.to_thread(encode_frame, frame)
+            if idx < num_check:
+                is_food, desc = await classify_and_describe(image_b64)
+                checked["done"] += 1
+                checked["food"] += int(is_food)
+                if checked["done"] == num_check:
+                    decide()
+            else:
+                await decided.wait()
+                if checked["food"] == 0:
+                    return
+                desc = await describe_image(image_b64)
+            results.append({"time": timestamp, "desc": desc})
+            report()
+
+    report()
+    producer = loop.run_in_executor(None, _decode_frames, video_path, interval_sec, emit, stop, dedup)
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        stop.set()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+    if checked["food"] == 0:
+        return {"status": "unsupported", "reason": "Video không liên quan đến đồ ăn"}
+    results.sort(key=lambda r: r["time"])
+    return {"status": "ok", "frames": results, "skipped_frames": dedup.skipped}
 
-        # khi thoát khỏi with, folder out_dir sẽ tự động bị xoá
-        return descriptions
-    
 def group_actions(actions, gap=3):
     steps = []
     group_start_time = actions[0]["time"]
@@ -198,7 +214,7 @@ def summarize_step(descs):
     # Nối tất cả các hành động trong list thành một string
     return " ".join(descs)   # hoặc " → ".join(descs) nếu muốn có dấu mũi tên
 
-def generate_recipe(steps, goal, allergy):
+async def generate_recipe(steps, goal, allergy):
     """
     steps: list các string mô tả hành động đã summarize
     Trả về: recipe step-by-step từ LLM
@@ -213,29 +229,34 @@ def generate_recipe(steps, goal, allergy):
         "và điều chỉnh công thức nếu cần để phù hợp với mình.\n\nHướng dẫn:" + steps
     )
     # Gọi LLM
-    completion = client.chat.completions.create(
+    return await llm_gateway.chat(
         model="Qwen/Qwen2.5-7B-Instruct",
         messages=[
             {"role": "user", "content": prompt}
         ],
     )
 
-    return completion.choices[0].message.content
-
 @app.post("/upload-video/")
 async def upload_video(file: UploadFile = File(...),
                        goal: str | None = Form(None),
                        allergy: str | None = Form(None)):
-    # tạo file tạm để lưu video
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp:
+    # tạo file tạm để lưu video (cv2 chỉ đọc được từ đường dẫn), xoá ngay khi xử lý xong
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4", dir=VIDEO_TMP_DIR) as tmp:
         shutil.copyfileobj(file.file, tmp)
         tmp_path = tmp.name  # đường dẫn file tạm
 
-    relevance = check_video_relevance(tmp_path)
-    if(relevance["status"] == "unsupported"):
-        return {"reply": relevance["reason"]}
+    try:
+        return await process_video(tmp_path, goal, allergy)
+    finally:
+        os.remove(tmp_path)
+
+async def process_video(tmp_path, goal, allergy, progress=None):
+    # decode video đúng một lần: kiểm tra liên quan đồ ăn + mô tả frame trong cùng một lượt
+    analysis = await analyze_video(tmp_path, interval_sec=3, progress=progress)
+    if(analysis["status"] == "unsupported"):
+        return {"reply": analysis["reason"]}
     else:
-        descriptions = extract_frames(tmp_path, interval_sec=3)
+        descriptions = analysis["frames"]
 
         steps = group_actions(descriptions, gap=3)
 
@@ -244,9 +265,84 @@ async def upload_video(file: UploadFile = File(...),
             [f"Bước {i}: {summarize_step(step['descs'])}" for i, step in enumerate(steps, 1)]
         )
 
-        recipe = generate_recipe(all_steps_text, goal, allergy)
+        if progress:
+            progress("recipe", 0, 1)
+        recipe = await generate_recipe(all_steps_text, goal, allergy)
 
         return {
             "recipe": recipe
         }
 
+
+#---video jobs---#
+# xử lý video dài chạy nền: client upload rồi poll tiến độ thay vì giữ request mở suốt pipeline
+job_runner = JobRunner(process_video)
+
+
+@app.on_event("startup")
+async def start_job_runner():
+    await job_runner.start()
+
+
+def job_response(job):
+    response = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": {"done": job["done"], "total": job["total"]},
+    }
+    if job["status"] == DONE:
+        response["result"] = job["result"]
+    elif job["status"] == FAILED:
+        response["error"] = job["error"]
+    return response
+
+
+@app.post("/jobs/upload-video")
+async def submit_video_job(file: UploadFile = File(...),
+                           goal: str | None = Form(None),
+                           allergy: str | None = Form(None)):
+    # ghi file và tính sha256 cùng lúc; video trùng nội dung + cùng profile trả về job / kết quả cũ
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4", dir=job_runner.job_dir) as tmp:
+        while chunk := await file.read(1024 * 1024):
+            digest.update(chunk)
+            tmp.write(chunk)
+        tmp_path = tmp.name
+
+    video_hash = digest.hexdigest()
+    video_path = job_runner.video_path(video_hash)
+    job_id = job_key(video_hash, goal, allergy)
+    existing = job_runner.store.get(job_id)
+    if existing is not None and existing["status"] not in (FAILED, CANCELLED):
+        os.remove(tmp_path)
+        return job_response(existing)
+
+    os.replace(tmp_path, video_path)
+    return job_response(job_runner.submit(job_id, video_path, goal, allergy))
+
+
+@app.get("/jobs/{job_id}")
+async def get_video_job(job_id: str):
+    job = job_runner.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    return job_response(job)
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_video_job_result(job_id: str):
+    job = job_runner.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    if job["status"] != DONE:
+        raise HTTPException(status_code=409, detail=f"Job đang ở trạng thái {job['status']}")
+    return job["result"]
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_video_job(job_id: str):
+    job = job_runner.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    return job_response(job)
@@ -0,0 +1,151 @@
+import base64
+import math
+import os
+
+import cv2
+import numpy as np
+
+#---config---#
+VIDEO_FRAME_MAX_SIDE = int(os.getenv("VIDEO_FRAME_MAX_SIDE", "768"))      # cạnh dài tối đa của frame gửi VLM
+VIDEO_FRAME_JPEG_QUALITY = int(os.getenv("VIDEO_FRAME_JPEG_QUALITY", "80"))
+# grab: grab() mọi frame (vẫn demux + decode từng frame), chỉ bỏ được bước retrieve() / đổi màu của frame không lấy
+# seek: nhảy thẳng tới từng mốc thời gian bằng CAP_PROP_POS_MSEC, chỉ decode từ keyframe gần nhất tới mốc đó
+# auto: seek với video dài từ VIDEO_SEEK_MIN_SEC giây, grab với video ngắn (seek không đáng so với decode hết)
+VIDEO_SAMPLER = os.getenv("VIDEO_SAMPLER", "auto")
+VIDEO_SEEK_MIN_SEC = float(os.getenv("VIDEO_SEEK_MIN_SEC", "60"))
+# bỏ frame nếu dHash khác frame giữ lại gần nhất <= ngưỡng này (số bit / 64), -1 = tắt
+VIDEO_DEDUP_THRESHOLD = int(os.getenv("VIDEO_DEDUP_THRESHOLD", "6"))
+#---config---#
+
+# fps dùng khi metadata của video không có / bằng 0
+FALLBACK_FPS = 30.0
+
+
+def video_fps(cap):
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or math.isnan(fps) or fps <= 0 or fps > 1000:
+        return None
+    return fps
+
+
+def _frame_time(cap, frame_idx, fps):
+    # ưu tiên timestamp thật của frame (đúng cả với video variable-FPS)
+    pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+    if pos_ms and pos_ms > 0 and not math.isnan(pos_ms):
+        return pos_ms / 1000
+    return frame_idx / (fps or FALLBACK_FPS)
+
+
+def _grab_frames(cap, interval_sec):
+    fps = video_fps(cap)
+    next_t = 0.0
+    frame_idx = 0
+    while cap.grab():
+        t = _frame_time(cap, frame_idx, fps)
+        if t + 1e-6 >= next_t:
+            ret, frame = cap.retrieve()
+            if ret:
+                yield int(t), frame
+            next_t = (math.floor(t / interval_sec) + 1) * interval_sec
+        frame_idx += 1
+
+
+def _seek_frames(cap, interval_sec):
+    t = 0.0
+    while True:
+        if not cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000):
+            if t == 0:
+                # backend không hỗ trợ seek
+                yield from _grab_frames(cap, interval_sec)
+            return
+        ret, frame = cap.read()
+        if not ret:
+            return
+        yield int(t), frame
+        t += interval_sec
+
+
+def video_duration(cap):
+    """Độ dài video (giây) theo metadata, None nếu không đọc được."""
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    if not frame_count or math.isnan(frame_count) or frame_count <= 0:
+        return None
+    return frame_count / (video_fps(cap) or FALLBACK_FPS)
+
+
+def estimate_sample_count(video_path, interval_sec):
+    """Số frame sẽ được lấy mẫu, ước lượng từ metadata (dùng cho tiến độ), 0 nếu không đọc được."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        duration = video_duration(cap)
+    finally:
+        cap.release()
+    return int(math.ceil(duration / interval_sec)) if duration else 0
+
+
+def iter_frames(video_path, interval_sec, max_frames=None, sampler=VIDEO_SAMPLER):
+    """
+    Đọc thẳng từ cv2.VideoCapture và yield (timestamp_giây, frame BGR) mỗi interval_sec giây; không ghi gì ra đĩa.
+    sampler "grab" vẫn decode mọi frame (chỉ bỏ retrieve / đổi màu), "seek" chỉ decode quanh các mốc lấy mẫu,
+    "auto" chọn seek cho video dài từ VIDEO_SEEK_MIN_SEC giây.
+    """
+    if interval_sec <= 0:
+        raise ValueError("interval_sec phải > 0")
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if sampler == "auto":
+            duration = video_duration(cap)
+            sampler = "seek" if duration is not None and duration >= VIDEO_SEEK_MIN_SEC else "grab"
+        frames = _seek_frames(cap, interval_sec) if sampler == "seek" else _grab_frames(cap, interval_sec)
+        for i, item in enumerate(frames):
+            if max_frames is not None and i >= max_frames:
+                break
+            yield item
+    finally:
+        cap.release()
+
+
+def encode_frame(frame, max_side=VIDEO_FRAME_MAX_SIDE, quality=VIDEO_FRAME_JPEG_QUALITY):
+    """Thu nhỏ frame (nếu cần) và encode JPEG đúng một lần trong bộ nhớ, trả về chuỗi base64."""
+    height, width = frame.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Không encode được frame sang JPEG")
+    return base64.b64encode(buf.tobytes()).decode()
+
+
+def dhash(frame, hash_size=8):
+    """Difference hash (hash_size² bit): so sánh độ sáng các pixel kề nhau trên ảnh xám đã thu nhỏ."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class FrameDeduplicator:
+    """Bỏ các frame gần giống frame được giữ lại gần nhất (cảnh tĩnh) trước khi gửi lên VLM."""
+
+    def __init__(self, threshold=VIDEO_DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.last_hash = None
+        self.kept = 0
+        self.skipped = 0
+
+    def keep(self, frame):
+        if self.threshold < 0:
+            self.kept += 1
+            return True
+        h = dhash(frame)
+        if self.last_hash is not None and hamming(h, self.last_hash) <= self.threshold:
+            self.skipped += 1
+            return False
+        self.last_hash = h
+        self.kept += 1
+        return True
@@ -0,0 +1,289 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import socket
+import threading
+import time
+import uuid
+
+#---config---#
+VIDEO_JOB_DB = os.getenv("VIDEO_JOB_DB", os.path.join(os.path.dirname(__file__), "video_jobs.db"))
+VIDEO_JOB_DIR = os.getenv("VIDEO_JOB_DIR", os.path.join(os.path.dirname(__file__), "video_jobs"))
+VIDEO_JOB_WORKERS = int(os.getenv("VIDEO_JOB_WORKERS", "2"))
+VIDEO_JOB_LEASE = float(os.getenv("VIDEO_JOB_LEASE", "60"))  # giây; job running hết lease được worker khác nhận lại
+#---config---#
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def job_key(video_hash, goal, allergy):
+    """Job id = hash nội dung video + profile (goal/allergy ảnh hưởng tới công thức trả về)."""
+    profile = hashlib.sha1(f"{goal or ''}|{allergy or ''}".encode()).hexdigest()[:8]
+    return f"{video_hash[:32]}-{profile}"
+
+
+class JobStore:
+    """Lưu trạng thái job xuống SQLite để không mất khi restart và dùng chung giữa các worker."""
+
+    def __init__(self, path=VIDEO_JOB_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " stage TEXT,"
+            " done INTEGER DEFAULT 0,"
+            " total INTEGER DEFAULT 0,"
+            " video_path TEXT,"
+            " goal TEXT,"
+            " allergy TEXT,"
+            " result TEXT,"
+            " error TEXT,"
+            " created REAL,"
+            " updated REAL,"
+            " owner TEXT,"
+            " lease_until REAL)"
+        )
+        # DB tạo từ bản cũ chưa có cột owner (id worker đang chạy job) / lease_until (hạn heartbeat của worker đó)
+        for column in ("owner TEXT", "lease_until REAL"):
+            try:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+
+    def get(self, job_id):
+        with self._lock:
+            cur = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([c[0] for c in cur.description], row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def create(self, job_id, video_path, goal, allergy):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, stage, done, total, video_path, goal, allergy,"
+                " result, error, created, updated) VALUES (?, ?, NULL, 0, 0, ?, ?, ?, NULL, NULL, ?, ?)",
+                (job_id, QUEUED, video_path, goal, allergy, now, now),
+            )
+
+    def update(self, job_id, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def claim(self, job_id, owner, lease=VIDEO_JOB_LEASE):
+        """Chuyển job queued -> running cho worker owner; False nếu job đã bị worker khác nhận hoặc bị huỷ."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, updated = ? WHERE job_id = ? AND status = ?",
+                (RUNNING, owner, now + lease, now, job_id, QUEUED),
+            )
+        return cur.rowcount == 1
+
+    def renew(self, job_id, owner, lease=VIDEO_JOB_LEASE, **fields):
+        """
+        Gia hạn lease (và ghi thêm fields, vd. tiến độ) nếu owner vẫn đang giữ job running.
+        False nếu job đã bị huỷ hoặc bị worker khác nhận lại -> owner phải dừng.
+        """
+        now = time.time()
+        fields.update(lease_until=now + lease, updated=now)
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE jobs SET {columns} WHERE job_id = ? AND status = ? AND owner = ?",
+                (*fields.values(), job_id, RUNNING, owner),
+            )
+        return cur.rowcount == 1
+
+    def finish(self, job_id, owner, status, **fields):
+        """running -> status (done / failed / queued) nếu owner vẫn giữ job; job đã bị huỷ thì giữ nguyên."""
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields.update(status=status, owner=None, lease_until=None, updated=time.time())
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE jobs SET {columns} WHERE job_id = ? AND status = ? AND owner = ?",
+                (*fields.values(), job_id, RUNNING, owner),
+            )
+        return cur.rowcount == 1
+
+    def transition(self, job_id, old_status, new_status):
+        """Đổi trạng thái nếu job đang ở old_status (nguyên tử giữa các process). Trả về True nếu đã đổi."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE job_id = ? AND status = ?",
+                (new_status, time.time(), job_id, old_status),
+            )
+        return cur.rowcount == 1
+
+    def requeue_expired(self):
+        """Job running mà worker không gia hạn lease kịp (đã chết / bị treo) được đưa về queued. Trả về các job_id đó."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)", (RUNNING, now)
+            ).fetchall()
+            requeued = []
+            for (job_id,) in rows:
+                cur = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, updated = ?"
+                    " WHERE job_id = ? AND status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                    (QUEUED, now, job_id, RUNNING, now),
+                )
+                if cur.rowcount == 1:
+                    requeued.append(job_id)
+        return requeued
+
+    def queued(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ? ORDER BY created", (QUEUED,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def pending(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status IN (?, ?) ORDER BY created", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+class JobRunner:
+    """
+    Hàng đợi job xử lý video chạy nền trong process FastAPI.
+    process(video_path, goal, allergy, progress) là coroutine xử lý một video,
+    progress(stage, done, total) được gọi để cập nhật tiến độ.
+    Với nhiều worker uvicorn, mỗi job chỉ được chạy bởi worker nhận được nó trước (JobStore.claim).
+    Worker giữ job bằng lease: gia hạn mỗi lần progress() và định kỳ mỗi lease / 3 giây; gia hạn thất bại
+    (job bị huỷ từ process khác, hoặc lease đã hết và job bị nhận lại) thì dừng job.
+    """
+
+    def __init__(self, process, store=None, workers=VIDEO_JOB_WORKERS, job_dir=VIDEO_JOB_DIR, lease=VIDEO_JOB_LEASE):
+        self.process = process
+        self.store = store if store is not None else JobStore()
+        self.workers = workers
+        self.job_dir = job_dir
+        self.lease = lease
+        # id duy nhất cho mỗi lần chạy: pid có thể bị dùng lại sau restart (container)
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(job_dir, exist_ok=True)
+        self._queue = None
+        self._running = {}
+        self._stopped = set()
+        self._workers = []
+
+    def video_path(self, video_hash):
+        return os.path.join(self.job_dir, f"{video_hash}.mp4")
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        # job còn dở từ lần chạy trước (lease đã hết) được xếp hàng lại; mọi worker đều thấy
+        # các job queued này nhưng claim() đảm bảo mỗi job chỉ chạy một lần
+        self.store.requeue_expired()
+        for job_id in self.store.queued():
+            self._queue.put_nowait(job_id)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._workers.append(asyncio.create_task(self._reaper()))
+
+    async def _reaper(self):
+        # worker ở process / container khác chết giữa chừng: job của nó hết lease và được chạy lại ở đây
+        while True:
+            await asyncio.sleep(self.lease)
+            for job_id in self.store.requeue_expired():
+                self._queue.put_nowait(job_id)
+
+    def submit(self, job_id, video_path, goal, allergy):
+        """Tạo job mới, hoặc trả về job cũ nếu video + profile này đã được xử lý / đang xử lý."""
+        job = self.store.get(job_id)
+        if job is not None and job["status"] in (QUEUED, RUNNING, DONE):
+            return job
+        self.store.create(job_id, video_path, goal, allergy)
+        self._queue.put_nowait(job_id)
+        return self.store.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.store.get(job_id)
+        if job is None or job["status"] in (DONE, FAILED, CANCELLED):
+            return job
+        if self.store.transition(job_id, QUEUED, CANCELLED):
+            # chưa worker nào nhận job: xoá video upload luôn
+            self._cleanup(job["video_path"], job_id)
+        elif self.store.transition(job_id, RUNNING, CANCELLED):
+            # worker đang chạy job tự xoá video khi task kết thúc; worker ở process khác
+            # thấy job bị huỷ ở lần gia hạn lease tiếp theo
+            self._stop(job_id)
+        return self.store.get(job_id)
+
+    def _stop(self, job_id):
+        task = self._running.get(job_id)
+        if task is not None and job_id not in self._stopped:
+            self._stopped.add(job_id)
+            task.cancel()
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not self.store.renew(job_id, self.owner, self.lease):
+                self._stop(job_id)
+                return
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.store.get(job_id)
+            if job is None or not self.store.claim(job_id, self.owner, self.lease):
+                continue
+
+            def progress(stage, done, total, job_id=job_id):
+                # gọi giữa các bước: job đã bị huỷ / mất lease thì dừng ngay thay vì chạy tiếp tới cuối
+                if not self.store.renew(job_id, self.owner, self.lease, stage=stage, done=done, total=total):
+                    self._stop(job_id)
+
+            task = asyncio.create_task(self.process(job["video_path"], job["goal"], job["allergy"], progress))
+            self._running[job_id] = task
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                result = await task
+                self.store.finish(job_id, self.owner, DONE, stage="done", result=result)
+            except asyncio.CancelledError:
+                if job_id not in self._stopped:
+                    # server đang tắt: giữ video lại, lần khởi động sau job được chạy lại
+                    task.cancel()
+                    self.store.finish(job_id, self.owner, QUEUED)
+                    raise
+            except Exception as e:
+                print(f"🔴 [ERROR] Job {job_id} lỗi: {e}")
+                self.store.finish(job_id, self.owner, FAILED, error=str(e))
+            finally:
+                heartbeat.cancel()
+                self._running.pop(job_id, None)
+                self._stopped.discard(job_id)
+            # job bị worker khác nhận lại (hết lease) thì video vẫn đang được dùng
+            if self.store.get(job_id)["status"] in (DONE, FAILED, CANCELLED):
+                self._cleanup(job["video_path"], job_id)
+
+    def _cleanup(self, video_path, job_id):
+        # video có thể dùng chung cho job khác profile, chỉ xoá khi không còn job nào chờ file này
+        for other in self.store.pending():
+            if other != job_id and self.store.get(other)["video_path"] == video_path:
+                return
+        if video_path and os.path.exists(video_path):
+            os.remove(video_path)